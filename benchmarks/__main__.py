@@ -0,0 +1,101 @@
+from benchmarks.common import BenchmarkResult, save_results, load_results, compare_results
+from benchmarks.scenarios import SCENARIOS, run_scenarios
+from benchmarks.micro import run_microbenchmarks
+from benchmarks.end_to_end import run_end_to_end
+from benchmarks.tally import run_tally_benchmarks
+from benchmarks.startup import run_startup_benchmarks, over_budget
+from typing import Optional
+import click
+import sys
+
+SUITES = ('micro', 'scenarios', 'end_to_end', 'tally', 'startup')
+
+
+def print_comparison(rows: list[dict]) -> None:
+    for row in rows:
+        click.echo(f"{row['status']:>12}  {row['ratio']:6.2f}x  "
+                   f"{row['baseline']:10.4f}s -> {row['current']:10.4f}s  {row['name']}")
+
+
+@click.group()
+def main() -> None:
+    """
+    Benchmarks for the NQG model.
+    """
+
+
+@main.command()
+@click.option('-s', '--suite', 'suites',
+              multiple=True,
+              type=click.Choice(SUITES),
+              help="Suites to run. Defaults to all of them")
+@click.option('-q', '--quick', 'quick',
+              default=False,
+              is_flag=True,
+              help="Scale the scenarios & populations down by 10x")
+@click.option('-o', '--output', 'output',
+              default=None,
+              help="Save the results as JSON into this file")
+@click.option('-b', '--baseline', 'baseline',
+              default=None,
+              help="Compare the results against a saved JSON report")
+@click.option('-t', '--threshold', 'threshold',
+              default=0.2,
+              help="Slowdown fraction over the baseline flagged as a regression")
+def run(suites: tuple[str, ...],
+        quick: bool,
+        output: Optional[str],
+        baseline: Optional[str],
+        threshold: float) -> None:
+    """
+    Run the benchmark suites.
+    """
+    suites = suites or SUITES
+    scale = 0.1 if quick else 1.0
+    results: list[BenchmarkResult] = []
+    if 'micro' in suites:
+        results += run_microbenchmarks(n_users=int(2_000 * scale))
+    if 'scenarios' in suites:
+        results += run_scenarios([s.scaled(scale) for s in SCENARIOS])
+    if 'end_to_end' in suites:
+        results += run_end_to_end(timesteps=int(100 * scale))
+    if 'tally' in suites:
+        results += run_tally_benchmarks(n_users=int(100_000 * scale))
+    if 'startup' in suites:
+        results += run_startup_benchmarks()
+
+    for r in results:
+        click.echo(f"{r.median:10.4f}s  {r.median / r.ops * 1e6:12.2f}us/op  {r.name}")
+    if output is not None:
+        save_results(results, output)
+    exceeded = over_budget(results)
+    for r in exceeded:
+        click.echo(f"over budget  {r.median:10.4f}s > {r.params['budget']:10.4f}s  {r.name}")
+    if baseline is not None:
+        current = {r.name: {'median': r.median} for r in results}
+        rows = compare_results(current, load_results(baseline), threshold)
+        print_comparison(rows)
+        if any(row['status'] == 'regression' for row in rows):
+            sys.exit(1)
+    if exceeded:
+        sys.exit(1)
+
+
+@main.command()
+@click.argument('current')
+@click.argument('baseline')
+@click.option('-t', '--threshold', 'threshold',
+              default=0.2,
+              help="Slowdown fraction over the baseline flagged as a regression")
+def compare(current: str, baseline: str, threshold: float) -> None:
+    """
+    Compare two saved JSON reports. Exits with 1 on regressions.
+    """
+    rows = compare_results(load_results(current), load_results(baseline), threshold)
+    print_comparison(rows)
+    if any(row['status'] == 'regression' for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
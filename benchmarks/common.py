@@ -0,0 +1,120 @@
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+from time import perf_counter
+from datetime import datetime
+import platform
+import statistics
+import json
+import sys
+
+
+@dataclass
+class BenchmarkResult():
+    name: str
+    suite: str
+    # Wall clock seconds of every repetition
+    timings: list[float]
+    # Number of operations timed on each repetition, eg. (user, project) pairs
+    ops: int = 1
+    params: dict = field(default_factory=dict)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.timings)
+
+    @property
+    def best(self) -> float:
+        return min(self.timings)
+
+
+def measure(name: str,
+            suite: str,
+            fn: Callable[[], object],
+            repeat: int = 5,
+            ops: int = 1,
+            setup: Optional[Callable[[], object]] = None,
+            min_time: float = 0.01,
+            **params) -> BenchmarkResult:
+    """
+    Time `repeat` calls of `fn`, calling `setup` untimed before each one.
+
+    Without `setup`, fast functions are called in a loop (as on `timeit`)
+    until each repetition takes at least `min_time` seconds, and the
+    average time per call is recorded.
+    """
+    number = 1
+    if setup is None:
+        while True:
+            t0 = perf_counter()
+            for _ in range(number):
+                fn()
+            if perf_counter() - t0 >= min_time:
+                break
+            number *= 10
+
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((perf_counter() - t0) / number)
+    return BenchmarkResult(name, suite, timings, ops, params)
+
+
+def machine_info() -> dict:
+    import numpy as np
+    import scipy  # type: ignore
+    return {'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+
+def save_results(results: list[BenchmarkResult], path: str) -> None:
+    report = {'machine': machine_info(),
+              'results': [{**asdict(r), 'median': r.median, 'best': r.best}
+                          for r in results]}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_results(path: str) -> dict[str, dict]:
+    """
+    Load a saved report as benchmark name -> result.
+    """
+    with open(path) as f:
+        report = json.load(f)
+    return {r['name']: r for r in report['results']}
+
+
+def compare_results(current: dict[str, dict],
+                    baseline: dict[str, dict],
+                    threshold: float = 0.2) -> list[dict]:
+    """
+    Compare the median timings of the benchmarks present on both reports.
+
+    A benchmark is flagged as a regression when it is more than
+    `threshold` (as a fraction) slower than on the baseline, and as an
+    improvement when it is more than `threshold` faster.
+    """
+    rows = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append({'name': name,
+                     'baseline': baseline[name]['median'],
+                     'current': result['median'],
+                     'ratio': ratio,
+                     'status': status})
+    return rows
@@ -0,0 +1,23 @@
+from nqg_model import default_run_args
+from nqg_model.runner import native_run
+from benchmarks.common import BenchmarkResult, measure
+from cadCAD_tools import easy_run  # type: ignore
+
+
+def run_end_to_end(timesteps: int = None, repeat: int = 3) -> list[BenchmarkResult]:
+    """
+    Time `default_run_args` on cadCAD and on the native runner.
+    """
+    (initial_state, params, blocks, default_timesteps, samples) = default_run_args
+    timesteps = timesteps or default_timesteps
+    args = (initial_state, params, blocks, timesteps, samples)
+    results = []
+    for (name, runner) in (('easy_run', easy_run), ('native_run', native_run)):
+        results.append(measure(f"end_to_end.default_run_args.{name}",
+                               'end_to_end',
+                               lambda: runner(*args, assign_params=False),
+                               repeat=repeat,
+                               ops=timesteps,
+                               timesteps=timesteps,
+                               samples=samples))
+    return results
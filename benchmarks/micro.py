@@ -0,0 +1,98 @@
+from nqg_model.types import *
+from nqg_model.neural_quorum_governance import *
+from nqg_model.logic import s_oracle_state
+from nqg_model.registry import UserRegistry
+from nqg_model.containers import append_only_dict
+from nqg_model.behaviour import sample_user_trustees
+from benchmarks.common import BenchmarkResult, measure
+from benchmarks.scenarios import Scenario, scenario_params, populated_state
+from dataclasses import replace
+from copy import deepcopy
+import numpy as np
+
+
+def run_microbenchmarks(n_users: int = 2_000,
+                        n_projects: int = 15,
+                        repeat: int = 5) -> list[BenchmarkResult]:
+    """
+    Time the hot functions of the model on a populated state, next to
+    their batched counterparts.
+    """
+    scenario = Scenario('micro', n_users, 1.0, n_projects, 2, 1)
+    params = scenario_params(scenario)
+    state = populated_state(n_users, params)
+    oracle_state = state['oracle_state']
+    users = state['users'].labels.tolist()
+    projects = sorted(params['projects'])
+    decisions = state['user_round_decisions']
+    delegators = [u for u, d in decisions.items() if d == Action.Delegate]
+    size = {'n_users': n_users, 'n_projects': n_projects}
+    results = []
+
+    def power_loop():
+        for u in users:
+            for p in projects:
+                power_from_neural_governance(u, p, params['neuron_layers'], oracle_state)
+    results.append(measure('micro.power_from_neural_governance', 'micro', power_loop,
+                           repeat, len(users) * len(projects), **size))
+    results.append(measure('micro.batch_power_from_neural_governance', 'micro',
+                           lambda: batch_power_from_neural_governance(users, projects,
+                                                                      params['batch_neuron_layers'],
+                                                                      oracle_state),
+                           repeat, len(users) * len(projects), **size))
+
+    def quorum_loop():
+        for u in delegators:
+            for p in projects:
+                vote_from_quorum_delegation(state['delegatees'].get(u, []), p,
+                                            state['action_matrix'], decisions, params)
+    results.append(measure('micro.vote_from_quorum_delegation', 'micro', quorum_loop,
+                           repeat, len(delegators) * len(projects), **size))
+    results.append(measure('micro.batch_votes_from_quorum_delegation', 'micro',
+                           lambda: batch_votes_from_quorum_delegation(delegators, projects,
+                                                                      state['delegatees'],
+                                                                      state['action_matrix'],
+                                                                      decisions, params),
+                           repeat, len(delegators) * len(projects), **size))
+    transitive_params = {**params, 'quorum_delegation_transitive': True}
+    results.append(measure('micro.batch_votes_from_transitive_quorum_delegation', 'micro',
+                           lambda: batch_votes_from_quorum_delegation(delegators, projects,
+                                                                      state['delegatees'],
+                                                                      state['action_matrix'],
+                                                                      decisions, transitive_params),
+                           repeat, len(delegators) * len(projects), **size))
+
+    def trust_loop():
+        for u in users:
+            trust_score(u, oracle_state)
+    results.append(measure('micro.trust_score', 'micro', trust_loop,
+                           repeat, len(users), **size))
+    results.append(measure('micro.batch_trust_score', 'micro',
+                           lambda: batch_trust_score(users, oracle_state),
+                           repeat, len(users), **size))
+
+    # Cold: PageRank from scratch. Warm: one timestep worth of new users.
+    cold_state = {**state, 'oracle_state': replace(oracle_state, pagerank_engine=None,
+                                                   pagerank_results={})}
+    results.append(measure('micro.s_oracle_state.cold', 'micro',
+                           lambda: s_oracle_state(params, 0, [], cold_state, {}),
+                           repeat, len(users), **size))
+    n_new = max(n_users // 100, 1)
+    rng = np.random.default_rng(1)
+    new_users = UserRegistry.from_columns(labels=np.arange(n_users, n_users + n_new),
+                                          reputations=np.zeros(n_new, dtype=np.int8),
+                                          past_rounds=np.zeros(n_new, dtype=np.uint64),
+                                          rounds=state['users'].rounds)
+    new_trustees = sample_user_trustees(rng, new_users.labels.tolist(), state['users'].labels, params)
+    warm_state = {**state,
+                  'users': state['users'].appended(new_users),
+                  'trustees': append_only_dict(state['trustees']).appended(new_trustees)}
+
+    def warm_setup():
+        # Every repetition starts from the engine as of the previous timestep
+        warm_state['oracle_state'] = replace(oracle_state,
+                                             pagerank_engine=deepcopy(oracle_state.pagerank_engine))
+    results.append(measure('micro.s_oracle_state.warm', 'micro',
+                           lambda: s_oracle_state(params, 0, [], warm_state, {}),
+                           repeat, len(users) + n_new, setup=warm_setup, **size))
+    return results
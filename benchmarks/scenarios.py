@@ -0,0 +1,113 @@
+from nqg_model.types import *
+from nqg_model.params import INITIAL_STATE, SINGLE_RUN_PARAMS
+from nqg_model.structure import NQG_MODEL_BLOCKS
+from nqg_model.neural_quorum_governance import *
+from nqg_model.registry import UserRegistry, REPUTATION_CATEGORIES
+from nqg_model.behaviour import sample_user_actions, sample_user_trustees
+from nqg_model.logic import s_oracle_state
+from nqg_model.runner import native_run
+from benchmarks.common import BenchmarkResult, measure
+from dataclasses import dataclass, replace
+import numpy as np
+
+
+@dataclass
+class Scenario():
+    name: str
+    initial_users: int
+    avg_new_users_per_day: float
+    n_projects: int
+    n_neuron_layers: int
+    timesteps: int
+
+    def scaled(self, factor: float) -> 'Scenario':
+        """
+        Smaller version of the scenario, eg. for quick runs.
+        """
+        return replace(self,
+                       initial_users=int(self.initial_users * factor),
+                       timesteps=max(int(self.timesteps * factor), 1))
+
+
+SCENARIOS: list[Scenario] = [
+    Scenario('default', 0, 1.0, 15, 2, 100),
+    Scenario('large_population', 20_000, 1.0, 15, 2, 50),
+    Scenario('high_arrivals', 1_000, 100.0, 15, 2, 50),
+    Scenario('many_projects', 2_000, 1.0, 150, 2, 50),
+    Scenario('deep_network', 2_000, 1.0, 15, 8, 50),
+    Scenario('long_run', 0, 5.0, 15, 2, 1_000),
+]
+
+
+def neuron_layers(n_layers: int) -> tuple[list[NeuronLayer], list[BatchNeuronLayer]]:
+    """
+    The default Neural Governance network, extended with extra Prior
+    Voting layers (or truncated) up to `n_layers` layers.
+    """
+    layers = DEFAULT_NG_LAYERS + [(LAYER_2_NEURONS, LAYER_2_AGGREGATOR)] * max(n_layers - 2, 0)
+    batch_layers = DEFAULT_NG_BATCH_LAYERS + [(LAYER_2_BATCH_NEURONS, LAYER_2_AGGREGATOR)] * max(n_layers - 2, 0)
+    return (layers[:n_layers], batch_layers[:n_layers])
+
+
+def scenario_params(scenario: Scenario, seed: int = 0) -> NQGModelParams:
+    (layers, batch_layers) = neuron_layers(scenario.n_neuron_layers)
+    return NQGModelParams(**{**SINGLE_RUN_PARAMS,  # type: ignore
+                             'projects': set(f"proj_{i}" for i in range(scenario.n_projects)),
+                             'new_user_project_vote_probability': min(5 / scenario.n_projects, 1.0),
+                             'avg_new_users_per_day': scenario.avg_new_users_per_day,
+                             'neuron_layers': layers,
+                             'batch_neuron_layers': batch_layers,
+                             'seed': seed})
+
+
+def populated_state(n_users: int,
+                    params: NQGModelParams,
+                    seed: int = 0) -> NQGModelState:
+    """
+    Initial state with `n_users` users which already took their actions,
+    trusted and delegated to each other through the batched behaviour model.
+    """
+    rng = np.random.default_rng(seed)
+    rounds = sorted(params['past_rounds'])
+    users = UserRegistry.from_columns(labels=np.arange(n_users),
+                                      reputations=rng.integers(len(REPUTATION_CATEGORIES), size=n_users),
+                                      past_rounds=rng.integers(2 ** len(rounds), size=n_users).astype(np.uint64),
+                                      rounds=rounds)
+    labels = users.labels.tolist()
+    (decisions, action_matrix, delegates) = sample_user_actions(rng, labels, users.labels, params)
+    trustees = sample_user_trustees(rng, labels, users.labels, params)
+    state = NQGModelState(**{**INITIAL_STATE,  # type: ignore
+                             'users': users,
+                             'user_round_decisions': decisions,
+                             'delegatees': delegates,
+                             'trustees': trustees,
+                             'action_matrix': action_matrix})
+    (_, oracle_state) = s_oracle_state(params, 0, [], state, {})
+    return NQGModelState(**{**state, 'oracle_state': oracle_state})  # type: ignore
+
+
+def run_scenarios(scenarios: list[Scenario], repeat: int = 1) -> list[BenchmarkResult]:
+    """
+    End-to-end native runs of every scenario, for both the reference and
+    the batched Neural Governance tally.
+    """
+    results = []
+    for scenario in scenarios:
+        params = scenario_params(scenario)
+        state = populated_state(scenario.initial_users, params)
+        for tally in ('batch', 'reference'):
+            run_params = dict(params)
+            if tally == 'reference':
+                run_params['batch_neuron_layers'] = None
+            results.append(measure(f"scenario.{scenario.name}.{tally}",
+                                   'scenarios',
+                                   lambda: native_run(state,
+                                                      {k: [v] for k, v in run_params.items()},
+                                                      NQG_MODEL_BLOCKS,
+                                                      scenario.timesteps,
+                                                      1,
+                                                      assign_params=False),
+                                   repeat=repeat,
+                                   ops=scenario.timesteps,
+                                   **{k: v for k, v in vars(scenario).items() if k != 'name'}))
+    return results
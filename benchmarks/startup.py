@@ -0,0 +1,51 @@
+from benchmarks.common import BenchmarkResult, measure
+import subprocess
+import sys
+
+# Commands timed on a fresh interpreter, as name -> python arguments
+STARTUP_COMMANDS: dict[str, list[str]] = {
+    'import': ['-c', 'import nqg_model'],
+    'blocks': ['-c', 'from nqg_model.structure import NQG_MODEL_BLOCKS'],
+    'cli_help': ['-m', 'nqg_model', '--help'],
+    'job': ['-c', "from nqg_model.worker import run_job; run_job({'timesteps': 10})"],
+}
+
+# Start time budget of the commands, in seconds. Measured at about 0.2s on
+# a single CPU, against 1.7s when `import nqg_model` loaded scipy, pandas
+# & cadCAD.
+STARTUP_BUDGETS: dict[str, float] = {
+    'import': 0.5,
+    'blocks': 0.5,
+    'cli_help': 0.75,
+}
+
+
+def run_startup_benchmarks(repeat: int = 5) -> list[BenchmarkResult]:
+    """
+    Time the start of a fresh interpreter on every `STARTUP_COMMANDS`, and
+    the same 10 timesteps job on an already warm worker.
+    """
+    from nqg_model.worker import run_job, warm_up
+
+    results = []
+    for (name, args) in STARTUP_COMMANDS.items():
+        budget = {'budget': STARTUP_BUDGETS[name]} if name in STARTUP_BUDGETS else {}
+        results.append(measure(f"startup.{name}", 'startup',
+                               lambda: subprocess.run([sys.executable, *args],
+                                                      check=True,
+                                                      stdout=subprocess.DEVNULL),
+                               repeat=repeat,
+                               min_time=0.0,
+                               **budget))
+    warm_up()
+    results.append(measure('startup.worker_job', 'startup',
+                           lambda: run_job({'timesteps': 10}),
+                           repeat=repeat))
+    return results
+
+
+def over_budget(results: list[BenchmarkResult]) -> list[BenchmarkResult]:
+    """
+    Results whose median exceeds their `budget` param.
+    """
+    return [r for r in results if 'budget' in r.params and r.median > r.params['budget']]
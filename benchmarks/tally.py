@@ -0,0 +1,68 @@
+from nqg_model.types import *
+from nqg_model.params import SINGLE_RUN_PARAMS
+from nqg_model.registry import REPUTATION_CATEGORIES
+from nqg_model.tally import RoundSnapshot, ACTIONS, save_snapshot, load_snapshot, tally_round
+from benchmarks.common import BenchmarkResult, measure
+import numpy as np
+import tempfile
+
+
+def random_snapshot(n_users: int,
+                    n_projects: int = 15,
+                    seed: int = 0,
+                    params: NQGModelParams = SINGLE_RUN_PARAMS) -> RoundSnapshot:
+    """
+    Synthetic round snapshot, drawn with the same distributions as the
+    batched behaviour model but without any onboarding order.
+    """
+    rng = np.random.default_rng(seed)
+    rounds = sorted(params['past_rounds'])
+    decisions = rng.choice([ACTIONS.index(Action.RoundVote), ACTIONS.index(Action.Delegate),
+                            ACTIONS.index(Action.Abstain), -1],
+                           p=[0.25, 0.25, 0.25, 0.25], size=n_users).astype(np.int8)
+
+    n_trustees = rng.poisson(params['new_user_average_trustees'], size=n_users)
+    trusters = np.repeat(np.arange(n_users), n_trustees)
+
+    round_voters = np.flatnonzero(decisions == ACTIONS.index(Action.RoundVote))
+    vote_users = np.repeat(round_voters, n_projects)
+    vote_projects = np.tile(np.arange(n_projects), len(round_voters))
+    is_voting = rng.random(len(vote_users)) < params['new_user_project_vote_probability']
+    vote_values = np.where(rng.random(len(vote_users)) < params['new_user_project_vote_yes_probability'],
+                           1, -1) * is_voting
+
+    delegators = np.flatnonzero(decisions == ACTIONS.index(Action.Delegate))
+    n_delegatees = (rng.poisson(params['new_user_average_delegate_count'], size=len(delegators))
+                    + params['new_user_min_delegate_count'])
+    delegation_users = np.repeat(delegators, n_delegatees)
+
+    columns = {'users_label': np.arange(n_users),
+               'users_reputation': rng.integers(len(REPUTATION_CATEGORIES), size=n_users),
+               'users_past_rounds': rng.integers(2 ** len(rounds), size=n_users),
+               'users_decision': decisions,
+               'trust_truster': trusters,
+               'trust_trustee': rng.integers(n_users, size=len(trusters)),
+               'votes_user': vote_users,
+               'votes_project': vote_projects,
+               'votes_vote': vote_values,
+               'delegations_delegator': delegation_users,
+               'delegations_delegatee': rng.integers(n_users, size=len(delegation_users))}
+    return RoundSnapshot(columns, [f"proj_{i}" for i in range(n_projects)], rounds)
+
+
+def run_tally_benchmarks(n_users: int = 100_000,
+                         n_projects: int = 15,
+                         repeat: int = 3) -> list[BenchmarkResult]:
+    """
+    Time the standalone tally of a synthetic round loaded from memory-mapped files.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        save_snapshot(directory, random_snapshot(n_users, n_projects))
+        results.append(measure('tally.tally_round', 'tally',
+                               lambda: tally_round(load_snapshot(directory)),
+                               repeat=repeat,
+                               ops=n_users,
+                               n_users=n_users,
+                               n_projects=n_projects))
+    return results
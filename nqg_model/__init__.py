@@ -1,8 +1,13 @@
 from nqg_model.params import SINGLE_RUN_PARAMS, INITIAL_STATE, TIMESTEPS, SAMPLES
-from nqg_model.structure import NQG_MODEL_BLOCKS
 
-default_run_args = (INITIAL_STATE,
-                     {k: [v] for k, v in SINGLE_RUN_PARAMS.items()},
-                    NQG_MODEL_BLOCKS,
-                    TIMESTEPS,
-                    SAMPLES)
\ No newline at end of file
+
+def __getattr__(name: str):
+    # XXX: lazy, so that `import nqg_model` doesn't build the model blocks
+    if name == 'default_run_args':
+        from nqg_model.structure import model_blocks
+        return (INITIAL_STATE,
+                {k: [v] for k, v in SINGLE_RUN_PARAMS.items()},
+                model_blocks(),
+                TIMESTEPS,
+                SAMPLES)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
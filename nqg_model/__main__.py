@@ -1,27 +1,194 @@
-from nqg_model import default_run_args
-from nqg_model.experiment import standard_run
-from cadCAD_tools.execution import easy_run
 from datetime import datetime
+from typing import Optional
 import click
-import os
+import sys
 
+# XXX: the model, pandas & cadCAD are imported by the commands, so that
+# `--help` and the short-lived commands start fast.
 
-@click.command()
+
+@click.group(invoke_without_command=True)
+@click.pass_context
 @click.option('-e', '--experiment-run', 'experiment_run',
               default=False,
               is_flag=True,
               help="Make an experiment run instead")
+@click.option('-w', '--workers', 'workers',
+              default=None,
+              type=int,
+              help="Number of worker processes for experiment runs. Defaults to the CPU count")
 @click.option('-p', '--pickle', 'pickle', default=False, is_flag=True)
-def main(experiment_run: bool, pickle: bool) -> None:
+@click.option('-c', '--columnar', 'columnar',
+              default=False,
+              is_flag=True,
+              help="Stream the runs as Parquet tables into data/simulations/")
+@click.option('-n', '--native', 'native',
+              default=False,
+              is_flag=True,
+              help="Execute the blocks on the native runner instead of cadCAD")
+@click.option('--profile', 'profile',
+              default=False,
+              is_flag=True,
+              help="Record the time per block and save a JSON trace into data/simulations/")
+@click.option('--profile-memory', 'profile_memory',
+              default=False,
+              is_flag=True,
+              help="Record the memory per block instead of the time, which tracing slows down")
+@click.option('-r', '--record', 'record',
+              multiple=True,
+              help="Only record this state variable. Can be repeated")
+@click.option('--every', 'every',
+              default=1,
+              help="Only record every N-th timestep")
+@click.option('--at', 'at',
+              multiple=True,
+              type=int,
+              help="Only record this timestep, instead of --every. Can be repeated")
+@click.option('--all-substeps', 'all_substeps',
+              default=False,
+              is_flag=True,
+              help="Record every substep instead of the last one of each timestep")
+@click.option('--cache', 'use_cache',
+              default=False,
+              is_flag=True,
+              help="Reuse the runs stored on the run cache (data/run_cache/ or $NQG_RUN_CACHE)")
+def main(ctx: click.Context,
+         experiment_run: bool,
+         workers: Optional[int],
+         pickle: bool,
+         columnar: bool,
+         native: bool,
+         profile: bool,
+         profile_memory: bool,
+         record: tuple[str, ...],
+         every: int,
+         at: tuple[int, ...],
+         all_substeps: bool,
+         use_cache: bool) -> None:
+    if ctx.invoked_subcommand is not None:
+        return
+    from nqg_model import default_run_args
+    from nqg_model.output import ColumnarWriter, output_block
+    from nqg_model.experiment import standard_run
+    from nqg_model.runner import native_run
+    from nqg_model.profiling import BlockProfiler, instrument_blocks
+    from nqg_model.recording import RecordingOptions, recorded_runner
+    from nqg_model.run_cache import RunCache, cached_runner
+    from cadCAD_tools.execution import easy_run  # type: ignore
+    runner = native_run if native else easy_run
+    recording = None
+    if record or every != 1 or at or all_substeps:
+        recording = RecordingOptions(variables=record or None,
+                                     final_substeps=not all_substeps,
+                                     every=every,
+                                     timesteps=set(at) or None)
+    run_cache = RunCache() if use_cache else None
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_dir = f"data/simulations/run-{timestamp}" if columnar else None
+    profile = profile or profile_memory
+    if profile and experiment_run:
+        raise click.UsageError("--profile is only supported on single runs")
     if experiment_run is False:
-        df = easy_run(*default_run_args, assign_params=False)
+        (initial_state, params, blocks, timesteps, samples) = default_run_args
+        if profile:
+            profiler = BlockProfiler(memory=profile_memory)
+            blocks = instrument_blocks(blocks, profiler)
+        if output_dir is not None:
+            writer = ColumnarWriter(output_dir)
+            blocks = blocks + [output_block(writer, timesteps, recording)]
+        if recording is not None:
+            runner = recorded_runner(runner, recording)
+        if run_cache is not None and output_dir is None and not profile:
+            runner = cached_runner(runner, run_cache)
+        try:
+            df = runner(initial_state, params, blocks, timesteps, samples, assign_params=False)
+        finally:
+            if profile:
+                profiler.close()
+        if profile:
+            profiler.save_trace(f"data/simulations/profile-{timestamp}.json")
+            aggregations = {'calls': 'sum', 'seconds': 'sum'}
+            if profile_memory:
+                aggregations = {'calls': 'sum', 'allocated_bytes': 'sum', 'peak_bytes': 'max'}
+            totals = profiler.summary().groupby('block', sort=False).agg(aggregations)
+            click.echo(totals.to_string())
     else:
-        df = standard_run()
+        df = standard_run(workers=workers, output_dir=output_dir, runner=runner, recording=recording,
+                          run_cache=run_cache)
     if pickle:
         df.to_pickle(
             f"data/simulations/multi-run-{timestamp}.pkl.gz", compression="gzip")
 
 
+@main.command()
+@click.argument('snapshot_dir')
+@click.option('-o', '--output', 'output',
+              default=None,
+              help="Write the per-project results into this .csv or .parquet file")
+@click.option('--chunk-size', 'chunk_size',
+              default=100_000,
+              help="Number of users processed at once, which bounds the memory usage")
+@click.option('--no-mmap', 'no_mmap',
+              default=False,
+              is_flag=True,
+              help="Load the snapshot columns into memory instead of memory-mapping them")
+def tally(snapshot_dir: str,
+          output: Optional[str],
+          chunk_size: int,
+          no_mmap: bool) -> None:
+    """
+    Tally a round snapshot (see `nqg_model.tally.save_snapshot`) through
+    Neural Governance & Quorum Delegation, outside of the simulation.
+    """
+    from nqg_model.tally import load_snapshot, tally_round, write_results
+    results = tally_round(load_snapshot(snapshot_dir, mmap=not no_mmap), chunk_size=chunk_size)
+    click.echo(results.to_string(index=False))
+    if output is not None:
+        write_results(results, output)
+
+
+@main.command()
+@click.option('-s', '--socket', 'socket_path',
+              default=None,
+              help="Serve on a Unix socket at this path instead of stdin & stdout")
+@click.option('-p', '--port', 'port',
+              default=None,
+              type=int,
+              help="Serve on this localhost TCP port instead of stdin & stdout")
+@click.option('--trust-refresh', 'trust_refresh',
+              default=1.0,
+              help="Seconds between Trust Score refreshes, when the Trust Graph changed")
+def live(socket_path: Optional[str], port: Optional[int], trust_refresh: float) -> None:
+    """
+    Keep a live tally of an open round from JSON lines of events
+    (onboard, trust, vote, delegate, abstain) and answer queries
+    (totals, user, stats, refresh). See `nqg_model.live`.
+    """
+    from nqg_model.live import LiveTally, LiveTallyService
+    import asyncio
+    service = LiveTallyService(LiveTally(), trust_refresh_interval=trust_refresh)
+    if socket_path is not None or port is not None:
+        asyncio.run(service.serve_socket(socket_path, port))
+    else:
+        asyncio.run(service.serve_stdio())
+
+
+@main.command()
+@click.option('--no-warm-up', 'no_warm_up',
+              default=False,
+              is_flag=True,
+              help="Don't execute a 1 timestep run before reading the jobs")
+def worker(no_warm_up: bool) -> None:
+    """
+    Execute many run configurations on a single interpreter, from JSON
+    lines of jobs on stdin, replying with a JSON line per job on stdout.
+    See `nqg_model.worker.run_job` for the job fields.
+    """
+    from nqg_model.worker import serve_jobs, warm_up
+    if not no_warm_up:
+        warm_up()
+    serve_jobs(sys.stdin, sys.stdout)
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
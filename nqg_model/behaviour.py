@@ -0,0 +1,143 @@
+from nqg_model.types import *
+from nqg_model.registry import UserRegistry
+import numpy as np
+
+# Independent random streams for each of the behavioural steps
+ONBOARDING_STREAM = 0
+VOTING_STREAM = 1
+TRUST_STREAM = 2
+
+
+def behaviour_rng(params: NQGModelParams,
+                  state: NQGModelState,
+                  stream: int) -> np.random.Generator:
+    """
+    Generator for the batched behaviour model.
+
+    The generator is derived from the `seed` parameter together with the
+    simulation, subset, run and timestep indices that cadCAD attaches to
+    the state, so that every (run, timestep, stream) gets its own
+    reproducible sequence without carrying RNG state around.
+    """
+    spawn_key = tuple(int(state.get(k, 0))  # type: ignore
+                      for k in ('simulation', 'subset', 'run', 'timestep'))
+    seed_sequence = np.random.SeedSequence(params['seed'],
+                                           spawn_key=spawn_key + (stream,))
+    return np.random.default_rng(seed_sequence)
+
+
+def sample_without_replacement(rng: np.random.Generator,
+                               population_size: int,
+                               counts: ndarray) -> list[ndarray]:
+    """
+    Draw `counts[i]` distinct indices from `range(population_size)` for
+    every i in a single batch.
+
+    Rows are drawn with replacement at once and only the rows with
+    collisions are redrawn one by one.
+    """
+    counts = np.minimum(counts, population_size).astype(int)
+    k_max = int(counts.max(initial=0))
+    if k_max == 0:
+        return [np.empty(0, dtype=int) for _ in counts]
+
+    draws = rng.integers(population_size, size=(len(counts), k_max))
+    valid = np.arange(k_max) < counts[:, None]
+    ordered = np.sort(np.where(valid, draws, -1), axis=1)
+    collided = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] >= 0)).any(axis=1)
+    for i in np.flatnonzero(collided):
+        draws[i, :counts[i]] = rng.choice(population_size, counts[i], replace=False)
+    return [draws[i, :counts[i]] for i in range(len(counts))]
+
+
+def sample_new_users(rng: np.random.Generator,
+                     first_label: int,
+                     timestep: int,
+                     params: NQGModelParams) -> UserRegistry:
+    """
+    Batched counterpart of the onboarding process on `s_onboard_users`.
+
+    The new users are returned on their own registry, with the past rounds
+    bitmasks laid over the sorted `past_rounds` parameter.
+    """
+    avg_new_users_per_ts = params['avg_new_users_per_day'] * params['timestep_in_days']
+    n_new_users = rng.poisson(avg_new_users_per_ts)
+
+    past_round_choices = sorted(params['past_rounds'])
+    reputation_choices = list(ReputationCategory) # TODO: parametrize
+
+    past_voting_n = rng.poisson(params['avg_user_past_votes'], size=n_new_users)
+    reputations = rng.integers(len(reputation_choices), size=n_new_users)
+    past_rounds = sample_without_replacement(rng, len(past_round_choices), past_voting_n)
+
+    masks = np.array([sum(1 << int(j) for j in rounds) for rounds in past_rounds],
+                     dtype=np.uint64)
+    return UserRegistry.from_columns(labels=first_label + np.arange(n_new_users),
+                                     reputations=reputations,
+                                     past_rounds=masks,
+                                     rounds=past_round_choices,
+                                     timestep=timestep)
+
+
+def sample_user_actions(rng: np.random.Generator,
+                        new_users: list[UserUUID],
+                        previous_users: list[UserUUID],
+                        params: NQGModelParams) -> tuple[dict[UserUUID, Action],
+                                                         dict[UserUUID, dict[ProjectUUID, Vote]],
+                                                         dict[UserUUID, list[UserUUID]]]:
+    """
+    Batched counterpart of the decision process on `p_user_vote`.
+
+    Returns the new users decisions, actions and quorums.
+    """
+    previous_users = np.asarray(previous_users, dtype=np.int64)
+    n = len(new_users)
+    projects = sorted(params['projects'])
+
+    is_active = rng.random(n) < params['new_user_action_probability']
+    is_round_voting = rng.random(n) < params['new_user_round_vote_probability']
+    is_project_voting = rng.random((n, len(projects))) < params['new_user_project_vote_probability']
+    is_yes = rng.random((n, len(projects))) < params['new_user_project_vote_yes_probability']
+
+    mu = params['new_user_average_delegate_count'] - params['new_user_min_delegate_count']
+    delegate_counts = rng.poisson(mu, size=n) + 2 * params['new_user_min_delegate_count']
+    delegate_counts = np.minimum(delegate_counts, len(previous_users))
+    has_quorum = delegate_counts >= params['new_user_min_delegate_count']
+
+    vote_choices = [Vote.Abstain, Vote.No, Vote.Yes]
+    project_votes = np.where(is_project_voting, np.where(is_yes, 2, 1), 0)
+
+    is_delegating = is_active & ~is_round_voting
+    quorum_rows = np.flatnonzero(is_delegating & has_quorum)
+    quorums = sample_without_replacement(rng, len(previous_users), delegate_counts[quorum_rows])
+
+    decisions: dict[UserUUID, Action] = {}
+    action_matrix: dict[UserUUID, dict[ProjectUUID, Vote]] = {}
+    delegates: dict[UserUUID, list[UserUUID]] = {}
+    for i, user in enumerate(new_users):
+        action_matrix[user] = {}
+        if not is_active[i]:
+            decisions[user] = Action.Abstain
+        elif is_round_voting[i]:
+            decisions[user] = Action.RoundVote
+            action_matrix[user] = {p: vote_choices[v]
+                                   for p, v in zip(projects, project_votes[i].tolist())}
+        else:
+            decisions[user] = Action.Delegate
+    for i, quorum in zip(quorum_rows, quorums):
+        delegates[new_users[i]] = previous_users[quorum].tolist()
+    return (decisions, action_matrix, delegates)
+
+
+def sample_user_trustees(rng: np.random.Generator,
+                         new_users: list[UserUUID],
+                         previous_users: list[UserUUID],
+                         params: NQGModelParams) -> dict[UserUUID, set[UserUUID]]:
+    """
+    Batched counterpart of the trusting process on `s_trust`.
+    """
+    previous_users = np.asarray(previous_users, dtype=np.int64)
+    n_user_trustees = rng.poisson(params['new_user_average_trustees'], size=len(new_users))
+    trustees = sample_without_replacement(rng, len(previous_users), n_user_trustees)
+    return {user: set(previous_users[user_trustees].tolist())
+            for user, user_trustees in zip(new_users, trustees)}
@@ -0,0 +1,156 @@
+from nqg_model.types import *
+from nqg_model.neural_quorum_governance import DEFAULT_NG_LAYERS, DEFAULT_NG_BATCH_LAYERS
+from nqg_model.structure import NQG_MODEL_BLOCKS
+from nqg_model.runner import iter_run, STATE_INDEXES
+from nqg_model.recording import RecordingOptions
+from pandas import DataFrame
+import numpy as np
+import pickle
+import random
+import zlib
+import os
+
+# Header of checkpoint files, followed by the format version byte
+CHECKPOINT_MAGIC = b'NQGCKPT'
+CHECKPOINT_VERSION = 1
+
+# Params holding neuron layers, which are stored by their name on `NEURON_LAYERS`
+LAYER_PARAMS = ('neuron_layers', 'batch_neuron_layers')
+
+# Known neuron layer configurations, by name
+NEURON_LAYERS: dict[str, list] = {
+    'DEFAULT_NG_LAYERS': DEFAULT_NG_LAYERS,
+    'DEFAULT_NG_BATCH_LAYERS': DEFAULT_NG_BATCH_LAYERS,
+}
+
+
+def register_neuron_layers(name: str, layers: list) -> None:
+    """
+    Make a neuron layer configuration available to checkpoints.
+    """
+    NEURON_LAYERS[name] = layers
+
+
+def _layers_name(layers: Optional[list]) -> Optional[str]:
+    if layers is None:
+        return None
+    for (name, known) in NEURON_LAYERS.items():
+        if known is layers:
+            return name
+    raise ValueError("Neuron layers must be registered through `register_neuron_layers` "
+                     "before being checkpointed")
+
+
+@dataclass
+class Checkpoint():
+    # State at the end of `timestep`, with the cadCAD indexes
+    state: NQGModelState
+    params: NQGModelParams
+    timestep: int
+    # Global generators of `BehaviourSampling.Reference`, as of `timestep`
+    random_state: tuple
+    numpy_random_state: tuple
+
+
+def save_checkpoint(path: str, state: NQGModelState, params: NQGModelParams) -> None:
+    """
+    Write the state at the end of a timestep, the params and the global
+    RNG states into a compressed binary file.
+
+    Neuron layers are stored by their name on `NEURON_LAYERS`, as they hold
+    lambdas. The batched behaviour generators need no state, as they are
+    derived from the seed and the indexes of the state.
+    """
+    params = {**params, **{k: _layers_name(params[k]) for k in LAYER_PARAMS if k in params}}  # type: ignore
+    checkpoint = Checkpoint(state, params, state.get('timestep', 0),  # type: ignore
+                            random.getstate(), np.random.get_state())
+    payload = zlib.compress(pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL))
+    # Written aside first, so that a crash never leaves a truncated checkpoint
+    with open(path + '.tmp', 'wb') as f:
+        f.write(CHECKPOINT_MAGIC + bytes([CHECKPOINT_VERSION]) + payload)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path: str) -> Checkpoint:
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = len(CHECKPOINT_MAGIC)
+    if data[:header] != CHECKPOINT_MAGIC:
+        raise ValueError(f"{path} is not a checkpoint")
+    if data[header] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {data[header]}")
+    checkpoint: Checkpoint = pickle.loads(zlib.decompress(data[header + 1:]))
+    for k in LAYER_PARAMS:
+        if k in checkpoint.params:
+            name = checkpoint.params[k]  # type: ignore
+            checkpoint.params[k] = NEURON_LAYERS[name] if name is not None else None  # type: ignore
+    return checkpoint
+
+
+def checkpoint_path(directory: str, state: NQGModelState) -> str:
+    indexes = [f"{k}={state.get(k, 0)}" for k in ('subset', 'run')]
+    return os.path.join(directory, f"checkpoint-{'-'.join(indexes)}-timestep={state.get('timestep', 0)}.ckpt")
+
+
+def checkpoint_block(directory: str, every: int) -> dict:
+    """
+    Partial State Update Block which checkpoints the state at the end of
+    every `every` timesteps into `directory`. It should go last on the
+    model blocks.
+    """
+    def p_checkpoint(params: NQGModelParams, _2, _3, state: NQGModelState) -> dict:
+        if state.get('timestep', 0) % every == 0:  # type: ignore
+            os.makedirs(directory, exist_ok=True)
+            save_checkpoint(checkpoint_path(directory, state), state, params)
+        return {}
+
+    return {
+        'label': 'Checkpoint',
+        'policies': {
+            'checkpoint': p_checkpoint
+        },
+        'variables': {}
+    }
+
+
+def resume_run(path: str,
+               N_timesteps: int,
+               params: Optional[dict] = None,
+               psubs: list[dict] = NQG_MODEL_BLOCKS,
+               restore_rng: bool = True,
+               recording: Optional[RecordingOptions] = None) -> DataFrame:
+    """
+    Continue a run from a checkpoint until `N_timesteps` on the native runner.
+
+    Under the same params, the resulting states are identical to the ones
+    that the original run had after the checkpoint.
+
+    Args:
+        params (dict, optional): Params to override on the checkpointed ones,
+            eg. for branching scenarios from a common population.
+        psubs (list): Blocks to execute. Append a `checkpoint_block` to keep
+            checkpointing the resumed run.
+        restore_rng (bool): Restore the global `random` and `numpy.random`
+            generators, as used by `BehaviourSampling.Reference`.
+        recording (RecordingOptions, optional): Only record some of the
+            states, as on `native_run`.
+    """
+    checkpoint = load_checkpoint(path)
+    if checkpoint.timestep >= N_timesteps:
+        raise ValueError(f"Checkpoint is already at timestep {checkpoint.timestep}")
+    if restore_rng:
+        random.setstate(checkpoint.random_state)
+        np.random.set_state(checkpoint.numpy_random_state)
+    state = checkpoint.state
+    indexes = {k: state.get(k, 0) for k in ('simulation', 'subset', 'run')}  # type: ignore
+    recording = recording or RecordingOptions()
+    states = iter_run({k: v for k, v in state.items() if k not in STATE_INDEXES},  # type: ignore
+                      {**checkpoint.params, **(params or {})},
+                      psubs,
+                      N_timesteps,
+                      drop_substeps=recording.final_substeps,
+                      initial_timestep=checkpoint.timestep,
+                      **indexes)
+    records = [s for s in map(recording.record, states) if s is not None]
+    df = DataFrame(records)
+    return df.drop(columns=['substep']) if recording.final_substeps else df
@@ -0,0 +1,166 @@
+from typing import Iterable, Iterator, Mapping, Sequence, TypeVar, Union, overload
+from itertools import islice
+from nqg_model.graph import AppendOnlyGraph
+
+K = TypeVar('K')
+V = TypeVar('V')
+T = TypeVar('T')
+
+
+class AppendOnlyDict(Mapping[K, V]):
+    """
+    Persistent mapping for state variables that only gain new keys over time.
+
+    Every snapshot is a view over the first `n` entries of a store that is
+    shared with the snapshots it was derived from. Appending to the newest
+    snapshot extends the store in place, so the cost scales with the number
+    of new entries. Appending to an older snapshot or replacing an existing
+    key forks a private copy, which keeps every snapshot immutable.
+
+    XXX: values are shared between snapshots and must not be mutated.
+    """
+    __slots__ = ('_keys', '_values', '_n')
+
+    def __init__(self, mapping: Union[Mapping[K, V], Iterable[tuple[K, V]]] = ()):
+        entries = dict(mapping.items() if isinstance(mapping, Mapping) else mapping)
+        self._keys: list[K] = list(entries)
+        self._values: dict[K, tuple[int, V]] = {key: (i, value)
+                                                for i, (key, value) in enumerate(entries.items())}
+        self._n = len(self._keys)
+
+    @classmethod
+    def _view(cls, keys: list[K], values: dict[K, tuple[int, V]], n: int) -> 'AppendOnlyDict[K, V]':
+        view = cls.__new__(cls)
+        view._keys, view._values, view._n = keys, values, n
+        return view
+
+    def __getitem__(self, key: K) -> V:
+        (position, value) = self._values[key]
+        if position >= self._n:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._values.get(key)  # type: ignore
+        return entry is not None and entry[0] < self._n
+
+    def __iter__(self) -> Iterator[K]:
+        return islice(self._keys, self._n)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())})"
+
+    def appended(self, items: Union[Mapping[K, V], Iterable[tuple[K, V]]]) -> 'AppendOnlyDict[K, V]':
+        """
+        Return a new snapshot with `items` added on top of this one.
+        """
+        items = list(items.items() if isinstance(items, Mapping) else items)
+        if len(items) == 0:
+            return self
+        is_tip = self._n == len(self._keys)
+        if is_tip and not any(key in self for (key, _) in items):
+            (keys, values) = (self._keys, self._values)
+        else:
+            forked = AppendOnlyDict(self.items())
+            (keys, values) = (forked._keys, forked._values)
+
+        for (key, value) in items:
+            if key in values:
+                values[key] = (values[key][0], value)
+            else:
+                values[key] = (len(keys), value)
+                keys.append(key)
+        return self._view(keys, values, len(keys))
+
+
+class AppendOnlyList(Sequence[T]):
+    """
+    Persistent list for state variables that only gain new elements over time.
+
+    Snapshots are views over a prefix of a shared store, with the same
+    copy-on-write behaviour as `AppendOnlyDict`.
+
+    XXX: elements are shared between snapshots and must not be mutated.
+    """
+    __slots__ = ('_items', '_n')
+
+    def __init__(self, items: Iterable[T] = ()):
+        self._items: list[T] = list(items)
+        self._n = len(self._items)
+
+    @overload
+    def __getitem__(self, index: int) -> T: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[T]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[i] for i in range(*index.indices(self._n))]
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError('list index out of range')
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[T]:
+        return islice(self._items, self._n)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (AppendOnlyList, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)})"
+
+    def appended(self, items: Iterable[T]) -> 'AppendOnlyList[T]':
+        """
+        Return a new snapshot with `items` added on top of this one.
+        """
+        items = list(items)
+        if len(items) == 0:
+            return self
+        if self._n == len(self._items):
+            store = self._items
+        else:
+            store = self._items[:self._n]
+        store.extend(items)
+        view = AppendOnlyList.__new__(AppendOnlyList)
+        view._items, view._n = store, len(store)
+        return view
+
+
+def append_only_dict(mapping: Mapping[K, V]) -> AppendOnlyDict[K, V]:
+    """
+    Wrap plain mappings (eg. from the initial state) as an `AppendOnlyDict`.
+    """
+    if isinstance(mapping, AppendOnlyDict):
+        return mapping
+    return AppendOnlyDict(mapping)
+
+
+def append_only_list(items: Sequence[T]) -> AppendOnlyList[T]:
+    """
+    Wrap plain sequences (eg. from the initial state) as an `AppendOnlyList`.
+    """
+    if isinstance(items, AppendOnlyList):
+        return items
+    return AppendOnlyList(items)
+
+
+def entries_since(mapping: Mapping[K, V], n: int) -> Iterator[tuple[K, V]]:
+    """
+    Iterate over the entries of `mapping` after the first `n` ones
+    in insertion order, eg. the entries added since an earlier snapshot.
+    """
+    if isinstance(mapping, AppendOnlyDict):
+        return ((key, mapping[key]) for key in mapping._keys[n:mapping._n])
+    elif isinstance(mapping, AppendOnlyGraph):
+        return mapping.entries_since(n)
+    return islice(mapping.items(), n, None)
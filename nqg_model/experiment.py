@@ -1,13 +1,42 @@
 from nqg_model.params import INITIAL_STATE
 from nqg_model.params import SINGLE_RUN_PARAMS
 from nqg_model.structure import NQG_MODEL_BLOCKS
+from nqg_model.types import *
+from nqg_model.output import ColumnarWriter, output_block
+from nqg_model.recording import RecordingOptions, recorded_runner
+from nqg_model.run_cache import RunCache
+from nqg_model.graph import AppendOnlyGraph
 from cadCAD_tools import easy_run # type: ignore
-from pandas import DataFrame
+from pandas import DataFrame, concat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from typing import Iterator, Optional
+import multiprocessing
+import random
+import numpy as np
 
+# Parameter Grid: for each swept parameter, the list of values to be tested
+ParamGrid = dict[str, list]
+# Flat per-timestep results of a run as column name -> values
+RunRecords = dict[str, ndarray]
+RunReducer = Callable[[DataFrame], RunRecords]
 
-def standard_run() -> DataFrame:
+
+def standard_run(workers: Optional[int] = None,
+                 output_dir: Optional[str] = None,
+                 runner: Callable = easy_run,
+                 recording: Optional[RecordingOptions] = None,
+                 run_cache: Optional[RunCache] = None) -> DataFrame:
     """Function which runs the cadCAD simulations
 
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        output_dir (str, optional): Also stream the runs as columnar tables into this directory.
+        runner (Callable): `easy_run` or a drop-in replacement for it.
+        recording (RecordingOptions, optional): Only record some of the
+            states of every run, see `iter_experiment`.
+        run_cache (RunCache, optional): Skip the runs stored on this cache.
+
     Returns:
         DataFrame: A dataframe of simulation data
     """
@@ -17,16 +46,204 @@ def standard_run() -> DataFrame:
     # The number of monte carlo runs per set of parameters tested
     N_samples = 1
     # %%
-    # Get the sweep params in the form of single length arrays
-    sweep_params = {k: [v] for k, v in SINGLE_RUN_PARAMS.items()}
-
-    # Load simulation arguments
-    sim_args = (INITIAL_STATE,
-                sweep_params,
-                NQG_MODEL_BLOCKS,
-                N_timesteps,
-                N_samples)
+    # The parameters to be swept, on top of the single run ones
+    grid: ParamGrid = {}
 
     # Run simulation
-    sim_df = easy_run(*sim_args)
-    return sim_df
\ No newline at end of file
+    sim_df = experiment_run(grid,
+                            N_samples,
+                            N_timesteps,
+                            workers=workers,
+                            output_dir=output_dir,
+                            runner=runner,
+                            recording=recording,
+                            run_cache=run_cache)
+    return sim_df
+
+
+def sweep_params(grid: ParamGrid,
+                 base_params: NQGModelParams = SINGLE_RUN_PARAMS) -> list[NQGModelParams]:
+    """
+    Expand the cartesian product of a Parameter Grid into one
+    parameter set per subset.
+    """
+    keys = list(grid.keys())
+    return [NQGModelParams(**{**base_params, **dict(zip(keys, values))})  # type: ignore
+            for values in product(*(grid[k] for k in keys))]
+
+
+def run_seed(seed: int, subset: int, run: int) -> int:
+    """
+    Deterministic seed for a (subset, run) pair of an experiment.
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(subset, run)).generate_state(1)[0])
+
+
+def run_records(sim_df: DataFrame) -> RunRecords:
+    """
+    Reduce the cadCAD output of a single run into flat numeric columns,
+    one row per timestep.
+
+    Only the records of the state variables found on `sim_df` are
+    computed, eg. when recording a subset of them.
+    """
+    records: dict[str, list] = {'timestep': list(sim_df.timestep)}
+    if 'days_passed' in sim_df:
+        records['days_passed'] = list(sim_df.days_passed)
+    if 'users' in sim_df:
+        records['n_users'] = [len(users) for users in sim_df.users]
+    if 'trustees' in sim_df:
+        records['n_trust_edges'] = [g.n_edges if isinstance(g, AppendOnlyGraph) else sum(len(v) for v in g.values())
+                                    for g in sim_df.trustees]
+    if 'delegatees' in sim_df:
+        records['n_quorums'] = [len(g) for g in sim_df.delegatees]
+    if 'user_round_decisions' in sim_df:
+        for action in Action:
+            records[f'n_{action.name.lower()}'] = [sum(1 for d in decisions.values() if d == action)
+                                                   for decisions in sim_df.user_round_decisions]
+    if 'per_project_voting' in sim_df:
+        projects = sorted(set(p for votes in sim_df.per_project_voting for p in votes))
+        for project in projects:
+            records[f'per_project_voting.{project}'] = [votes.get(project, np.nan)
+                                                        for votes in sim_df.per_project_voting]
+    return {k: np.asarray(v) for k, v in records.items()}
+
+
+# Experiment specification shared with the worker processes.
+# It is inherited through `fork`, so that the neuron layers lambdas
+# never need to be pickled.
+_EXPERIMENT: dict = {}
+
+
+def _init_worker(experiment: dict) -> None:
+    _EXPERIMENT.update(experiment)
+
+
+def _execute_run(subset: int, run: int) -> tuple[int, int, RunRecords]:
+    """
+    Execute a single (subset, run) of the shared experiment.
+    """
+    params = dict(_EXPERIMENT['params'][subset])
+    seed = run_seed(params['seed'], subset, run)
+    params['seed'] = seed
+
+    run_cache = _EXPERIMENT['run_cache']
+    if run_cache is not None:
+        # The global generators are seeded from `params` below, so they need no keying
+        key = run_cache.key('experiment', _EXPERIMENT['initial_state'], params, _EXPERIMENT['blocks'],
+                            _EXPERIMENT['timesteps'], _EXPERIMENT['runner'], _EXPERIMENT['reducer'])
+        records = run_cache.get(key)
+        if records is not None:
+            return (subset, run, records)  # type: ignore
+
+    # Also seed the global generators used by `BehaviourSampling.Reference`
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+    blocks = _EXPERIMENT['blocks']
+    if _EXPERIMENT['output_dir'] is not None:
+        writer = ColumnarWriter(_EXPERIMENT['output_dir'],
+                                partition={'subset': subset, 'run': run})
+        blocks = blocks + [output_block(writer, _EXPERIMENT['timesteps'], _EXPERIMENT['recording'])]
+
+    sim_df = _EXPERIMENT['runner'](_EXPERIMENT['initial_state'],
+                                   {k: [v] for k, v in params.items()},
+                                   blocks,
+                                   _EXPERIMENT['timesteps'],
+                                   1,
+                                   assign_params=False)
+    records = _EXPERIMENT['reducer'](sim_df)
+    if run_cache is not None:
+        run_cache.put(key, records)
+    return (subset, run, records)
+
+
+def iter_experiment(grid: ParamGrid,
+                    N_samples: int,
+                    N_timesteps: int,
+                    workers: Optional[int] = None,
+                    base_params: NQGModelParams = SINGLE_RUN_PARAMS,
+                    initial_state: NQGModelState = INITIAL_STATE,
+                    blocks: list[dict] = NQG_MODEL_BLOCKS,
+                    reducer: RunReducer = run_records,
+                    output_dir: Optional[str] = None,
+                    runner: Callable = easy_run,
+                    recording: Optional[RecordingOptions] = None,
+                    run_cache: Optional[RunCache] = None) -> Iterator[tuple[int, int, RunRecords]]:
+    """
+    Execute every (subset, run) of a parameter sweep on a local process
+    pool and yield `(subset, run, records)` as soon as each run finishes.
+
+    Subsets index `sweep_params(grid, base_params)` and runs go from 1 to
+    `N_samples`. Each run is seeded through `run_seed`, so results do not
+    depend on the number of workers nor on the completion order.
+
+    When `output_dir` is given, every run also streams its state into
+    columnar tables (see `nqg_model.output`) on its own partition.
+
+    `runner` executes each run and must follow the `easy_run` signature,
+    eg. `nqg_model.runner.native_run`.
+
+    `recording` selects the states (and their variables) of each run
+    which are passed to `reducer` and written into `output_dir`.
+
+    With `run_cache`, the records of runs that were already computed
+    (under the same initial state, params, seed, blocks, timesteps, runner,
+    recording and reducer) are read from it instead, eg. to extend a
+    sweep with new grid points. As runs are seeded by their (subset, run)
+    position, grid points are only reused if they keep it, eg. when values
+    are appended to the first swept parameter or samples are added. It
+    isn't used when writing `output_dir`, as cached runs would be missing
+    from it.
+    """
+    experiment = {'params': sweep_params(grid, base_params),
+                  'initial_state': initial_state,
+                  'blocks': blocks,
+                  'timesteps': N_timesteps,
+                  'reducer': reducer,
+                  'output_dir': output_dir,
+                  'runner': runner if recording is None else recorded_runner(runner, recording),
+                  'recording': recording,
+                  'run_cache': run_cache if output_dir is None else None}
+    tasks = [(subset, run)
+             for subset in range(len(experiment['params']))
+             for run in range(1, N_samples + 1)]
+
+    if workers == 1:
+        _init_worker(experiment)
+        for task in tasks:
+            yield _execute_run(*task)
+        return
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(experiment,)) as executor:
+        futures = [executor.submit(_execute_run, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def experiment_run(grid: ParamGrid,
+                   N_samples: int,
+                   N_timesteps: int,
+                   workers: Optional[int] = None,
+                   **kwargs) -> DataFrame:
+    """
+    Run a parameter sweep with Monte Carlo samples in parallel and
+    gather the per-run records into a single DataFrame.
+
+    Scalar swept parameters are attached as columns.
+    """
+    params = sweep_params(grid, kwargs.get('base_params', SINGLE_RUN_PARAMS))
+    dfs = []
+    for (subset, run, records) in iter_experiment(grid, N_samples, N_timesteps, workers, **kwargs):
+        df = DataFrame(records).assign(subset=subset, run=run)
+        for key in grid:
+            value = params[subset][key]  # type: ignore
+            if isinstance(value, (int, float, str, bool)):
+                df[key] = value
+        dfs.append(df)
+    sim_df = concat(dfs, ignore_index=True)
+    return sim_df.sort_values(['subset', 'run', 'timestep'], ignore_index=True)
@@ -0,0 +1,282 @@
+from nqg_model.types import *
+from typing import Collection, Iterable, Iterator
+import numpy as np
+
+# Growable integer columns of `_EdgeStore`
+EDGE_COLUMNS = ('sources', 'indptr', 'node_ptr', 'added_at', 'targets')
+
+
+class _EdgeStore():
+    """
+    Growable CSR store which is shared by the `AppendOnlyGraph` snapshots.
+
+    Row `i` holds the successors of node `sources[i]` on
+    `targets[indptr[i]:indptr[i + 1]]`. `node_ptr[i]` is the number of
+    nodes known before row `i` was added. Only the first `n_rows` rows,
+    `indptr[n_rows]` edges and `len(nodes)` nodes are in use.
+    """
+    __slots__ = ('nodes', 'node_index', 'source_rows', 'ordered', 'n_rows') + EDGE_COLUMNS
+
+    def __init__(self, ordered: bool, capacity: int = 16):
+        self.nodes: list[UserUUID] = []
+        self.node_index: dict[UserUUID, int] = {}
+        # Node id -> row
+        self.source_rows: dict[int, int] = {}
+        self.ordered = ordered
+        self.n_rows = 0
+        self.sources = np.empty(capacity, dtype=np.int64)
+        self.indptr = np.zeros(capacity + 1, dtype=np.int64)
+        self.node_ptr = np.zeros(capacity + 1, dtype=np.int64)
+        self.added_at = np.empty(capacity, dtype=np.int32)
+        self.targets = np.empty(capacity, dtype=np.int64)
+
+    def __getstate__(self) -> dict:
+        # Only the rows & edges in use are pickled
+        n_edges = int(self.indptr[self.n_rows])
+        state = {k: getattr(self, k) for k in ('nodes', 'node_index', 'source_rows', 'ordered', 'n_rows')}
+        state.update(sources=self.sources[:self.n_rows].copy(),
+                     indptr=self.indptr[:self.n_rows + 1].copy(),
+                     node_ptr=self.node_ptr[:self.n_rows + 1].copy(),
+                     added_at=self.added_at[:self.n_rows].copy(),
+                     targets=self.targets[:n_edges].copy())
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        for (k, v) in state.items():
+            setattr(self, k, v)
+
+    def node_id(self, node: UserUUID) -> int:
+        i = self.node_index.get(node)
+        if i is None:
+            i = self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return i
+
+    @staticmethod
+    def _grown(values: ndarray, size: int) -> ndarray:
+        if size <= len(values):
+            return values
+        capacity = len(values)
+        while capacity < size:
+            capacity *= 2
+        grown = np.zeros(capacity, dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def extend(self, items: list[tuple[UserUUID, Iterable[UserUUID]]], timestep: int) -> None:
+        n_edges = int(self.indptr[self.n_rows])
+        rows = self.n_rows + len(items)
+        self.sources = self._grown(self.sources, rows)
+        self.added_at = self._grown(self.added_at, rows)
+        self.indptr = self._grown(self.indptr, rows + 1)
+        self.node_ptr = self._grown(self.node_ptr, rows + 1)
+        targets: list[int] = []
+        for (row, (source, successors)) in enumerate(items, self.n_rows):
+            # Sources get their ids before their successors, as on `IncrementalPageRank`
+            source_id = self.node_id(source)
+            self.source_rows[source_id] = row
+            self.sources[row] = source_id
+            targets.extend(self.node_id(t) for t in successors)
+            self.indptr[row + 1] = n_edges + len(targets)
+            self.node_ptr[row + 1] = len(self.nodes)
+        self.added_at[self.n_rows:rows] = timestep
+        self.targets = self._grown(self.targets, n_edges + len(targets))
+        self.targets[n_edges:n_edges + len(targets)] = targets
+        self.n_rows = rows
+
+
+class AppendOnlyGraph(Mapping[UserUUID, Collection[UserUUID]]):
+    """
+    Persistent directed graph for the Trust & Delegation graphs, where
+    every user adds its successors once.
+
+    Nodes get integer ids in order of appearance and the edges are kept
+    on growable CSR arrays. As on `nqg_model.containers.AppendOnlyDict`,
+    every snapshot is a view over a prefix of a store which is shared
+    with the snapshots it was derived from: appending to the newest
+    snapshot is amortized O(1) per edge, while appending to an older
+    one or replacing the successors of a user forks a private copy.
+
+    It is a mapping from users to their successors, as a `set` or as a
+    `list` if the graph is `ordered`, which are built on access.
+    `coo`, `csr` and `successor_ids` give direct access to the arrays.
+    """
+    __slots__ = ('_store', '_rows', '_nodes')
+
+    def __init__(self,
+                 mapping: Union[Mapping[UserUUID, Iterable[UserUUID]],
+                                Iterable[tuple[UserUUID, Iterable[UserUUID]]]] = (),
+                 ordered: bool = False,
+                 timestep: int = 0):
+        self._store = _EdgeStore(ordered)
+        self._store.extend(list(mapping.items() if isinstance(mapping, Mapping) else mapping),
+                           timestep)
+        self._rows = self._store.n_rows
+        self._nodes = len(self._store.nodes)
+
+    @classmethod
+    def _view(cls, store: _EdgeStore, rows: int) -> 'AppendOnlyGraph':
+        view = cls.__new__(cls)
+        view._store, view._rows, view._nodes = store, rows, int(store.node_ptr[rows])
+        return view
+
+    def _row(self, source: object) -> int:
+        store = self._store
+        row = store.source_rows.get(store.node_index.get(source, -1), -1)  # type: ignore
+        return row if row < self._rows else -1
+
+    def _successors(self, row: int) -> Collection[UserUUID]:
+        store = self._store
+        nodes = store.nodes
+        successors = [nodes[i] for i in store.targets[store.indptr[row]:store.indptr[row + 1]].tolist()]
+        return successors if store.ordered else set(successors)
+
+    def __getitem__(self, source: UserUUID) -> Collection[UserUUID]:
+        row = self._row(source)
+        if row < 0:
+            raise KeyError(source)
+        return self._successors(row)
+
+    def __contains__(self, source: object) -> bool:
+        return self._row(source) >= 0
+
+    def __iter__(self) -> Iterator[UserUUID]:
+        nodes = self._store.nodes
+        return (nodes[i] for i in self._store.sources[:self._rows].tolist())
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+    @property
+    def ordered(self) -> bool:
+        return self._store.ordered
+
+    @property
+    def n_nodes(self) -> int:
+        return self._nodes
+
+    @property
+    def n_edges(self) -> int:
+        return int(self._store.indptr[self._rows])
+
+    @property
+    def node_labels(self) -> list[UserUUID]:
+        """
+        Node labels by node id.
+        """
+        return self._store.nodes[:self._nodes]
+
+    def node_ids(self, labels: Sequence[UserUUID]) -> ndarray:
+        """
+        Node ids of `labels`, with -1 for the ones that are not on the graph.
+        """
+        index = self._store.node_index
+        ids = np.fromiter((index.get(u, -1) for u in labels), dtype=np.int64, count=len(labels))
+        ids[ids >= self._nodes] = -1
+        return ids
+
+    def coo(self) -> tuple[ndarray, ndarray]:
+        """
+        (source, target) node ids of every edge, in insertion order.
+        """
+        store = self._store
+        degrees = np.diff(store.indptr[:self._rows + 1])
+        return (np.repeat(store.sources[:self._rows], degrees),
+                store.targets[:self.n_edges])
+
+    def csr(self):
+        """
+        Adjacency matrix over the node ids, as a `scipy.sparse.csr_array`.
+        Repeated edges are summed.
+        """
+        import scipy.sparse as sparse  # type: ignore
+        (sources, targets) = self.coo()
+        return sparse.csr_array((np.ones(len(sources)), (sources, targets)),
+                                shape=(self._nodes, self._nodes))
+
+    def successor_ids(self, sources: Sequence[UserUUID]) -> tuple[ndarray, ndarray]:
+        """
+        Successors of many users at once, as the position on `sources` and
+        the node id of every edge. Users without successors are skipped.
+        """
+        store = self._store
+        source_ids = self.node_ids(sources)
+        rows = np.fromiter((store.source_rows.get(i, -1) for i in source_ids.tolist()),
+                           dtype=np.int64, count=len(sources))
+        rows[rows >= self._rows] = -1
+        starts = np.where(rows >= 0, store.indptr[rows], 0)
+        degrees = np.where(rows >= 0, store.indptr[rows + 1] - starts, 0)
+        positions = np.repeat(np.arange(len(sources)), degrees)
+        # Edge offsets within each row
+        offsets = np.arange(len(positions)) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+        return (positions, store.targets[np.repeat(starts, degrees) + offsets])
+
+    def entries_since(self, n: int) -> Iterator[tuple[UserUUID, Collection[UserUUID]]]:
+        """
+        Iterate over the users added after the first `n` ones, with their successors.
+        """
+        nodes = self._store.nodes
+        sources = self._store.sources[n:self._rows].tolist()
+        return ((nodes[source], self._successors(row))
+                for row, source in enumerate(sources, n))
+
+    def snapshot(self, timestep: int) -> 'AppendOnlyGraph':
+        """
+        View of the graph as of `timestep`.
+        """
+        added_at = self._store.added_at[:self._rows]
+        return self._view(self._store, int(np.searchsorted(added_at, timestep, side='right')))
+
+    def is_same_snapshot(self, other: 'AppendOnlyGraph') -> bool:
+        return self._store is other._store and self._rows == other._rows
+
+    def appended(self,
+                 items: Union[Mapping[UserUUID, Iterable[UserUUID]],
+                              Iterable[tuple[UserUUID, Iterable[UserUUID]]]],
+                 timestep: int = 0) -> 'AppendOnlyGraph':
+        """
+        Return a new snapshot with the successors of `items` added on top of this one.
+        """
+        items = list(items.items() if isinstance(items, Mapping) else items)
+        if len(items) == 0:
+            return self
+        store = self._store
+        if self._rows == store.n_rows and not any(source in self for (source, _) in items):
+            store.extend(items, timestep)
+            return self._view(store, store.n_rows)
+
+        # Forked copy, which keeps the rows & timesteps of this snapshot
+        replaced = dict(items)
+        added_at = store.added_at[:self._rows].tolist()
+        forked = AppendOnlyGraph(ordered=store.ordered)
+        for (row, (source, successors)) in enumerate(self.items()):
+            forked._store.extend([(source, replaced.pop(source, successors))], added_at[row])
+        forked._store.extend(list(replaced.items()), timestep)
+        return self._view(forked._store, forked._store.n_rows)
+
+    def to_dict(self) -> dict[UserUUID, Collection[UserUUID]]:
+        return dict(self.items())
+
+    def to_networkx(self):
+        """
+        Export as a `networkx.DiGraph`, including the nodes without successors.
+        """
+        import networkx as nx  # type: ignore
+        G = nx.DiGraph()
+        G.add_nodes_from(self.node_labels)
+        nodes = self._store.nodes
+        G.add_edges_from((nodes[s], nodes[t]) for (s, t) in zip(*(a.tolist() for a in self.coo())))
+        return G
+
+
+def append_only_graph(mapping: Mapping[UserUUID, Iterable[UserUUID]],
+                      ordered: bool = False) -> AppendOnlyGraph:
+    """
+    Wrap plain mappings (eg. from the initial state) as an `AppendOnlyGraph`.
+    """
+    if isinstance(mapping, AppendOnlyGraph):
+        return mapping
+    return AppendOnlyGraph(mapping, ordered)
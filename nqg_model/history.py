@@ -0,0 +1,211 @@
+from nqg_model.types import *
+from nqg_model.containers import entries_since, append_only_dict, append_only_list
+from nqg_model.registry import UserRegistry, user_registry
+from nqg_model.graph import AppendOnlyGraph, append_only_graph
+from nqg_model.logic import s_oracle_state, p_compute_votes
+from dataclasses import dataclass, replace
+from typing import Iterator, Optional
+from bisect import bisect_right
+from pandas import DataFrame
+
+# Variables which only gain new entries over time. Only the new entries
+# are recorded for them on each timestep.
+APPEND_ONLY_VARIABLES = ('users',
+                         'trustees',
+                         'delegatees',
+                         'action_matrix',
+                         'user_round_decisions')
+
+# Append-only variables which are kept as graphs, and whatever
+# the successors of their users are ordered
+GRAPH_VARIABLES = {'trustees': False, 'delegatees': True}
+
+# Variables which are fully determined by the other ones and the params.
+# They are stored on snapshots only and recomputed on demand otherwise.
+DERIVED_VARIABLES = ('oracle_state', 'effective_action_matrix', 'vote_matrix')
+
+
+@dataclass
+class TimestepDelta():
+    timestep: int
+    # New entries on the append-only variables (`(key, value)` pairs
+    # for mappings, elements for sequences and a slice for the user registry)
+    appended: dict[str, Sequence]
+    # Current value of every other non-derived variable
+    replaced: dict[str, object]
+
+
+def _snapshot(value: Union[Mapping, Sequence]) -> Union[dict, Sequence]:
+    """
+    Full copy of an append-only variable. User registries and graphs are
+    immutable views and are kept as they are.
+    """
+    if isinstance(value, AppendOnlyGraph):
+        return value
+    elif isinstance(value, Mapping):
+        return dict(value)
+    elif isinstance(value, UserRegistry):
+        return value
+    else:
+        return list(value)
+
+
+class DeltaHistory():
+    """
+    History store for the NQG state variables that keeps per-timestep
+    deltas plus a full snapshot every `snapshot_every` recorded timesteps.
+
+    Memory grows with the number of new users, edges and decisions
+    instead of timesteps × population. The state at any recorded
+    timestep is rebuilt on demand through `state_at` / `iter_states`.
+
+    XXX: the derived variables are recomputed with `s_oracle_state` and
+    `p_compute_votes` outside of snapshots. PageRank is warm-started
+    from the closest snapshot, so the oracle state and the vote matrix
+    agree with the simulated ones to within the PageRank tolerance.
+    """
+
+    def __init__(self,
+                 params: NQGModelParams,
+                 initial_state: Optional[NQGModelState] = None,
+                 snapshot_every: int = 100):
+        self.params = params
+        self.snapshot_every = snapshot_every
+        self.timesteps: list[int] = []
+        self.deltas: list[TimestepDelta] = []
+        self.snapshots: dict[int, dict] = {}
+        self.seen: dict[str, int] = {k: 0 for k in APPEND_ONLY_VARIABLES}
+        if initial_state is not None:
+            self.record(initial_state, timestep=0)
+
+    def __len__(self) -> int:
+        return len(self.timesteps)
+
+    def record(self, state: NQGModelState, timestep: Optional[int] = None) -> None:
+        """
+        Record the state at the end of a timestep.
+
+        Timesteps must be recorded in increasing order.
+        """
+        if timestep is None:
+            timestep = state.get('timestep', 0)  # type: ignore
+        if len(self.timesteps) > 0 and timestep <= self.timesteps[-1]:
+            raise ValueError(f"Timestep {timestep} was recorded out of order")
+
+        appended: dict[str, list] = {}
+        for variable in APPEND_ONLY_VARIABLES:
+            value = state[variable]  # type: ignore
+            if isinstance(value, Mapping):
+                appended[variable] = list(entries_since(value, self.seen[variable]))
+            elif isinstance(value, UserRegistry):
+                # Registry slices are immutable views
+                appended[variable] = value[self.seen[variable]:]  # type: ignore
+            else:
+                appended[variable] = list(value[self.seen[variable]:])
+            self.seen[variable] = len(value)
+        replaced = {k: v for k, v in state.items()
+                    if k in NQGModelState.__annotations__
+                    and k not in APPEND_ONLY_VARIABLES
+                    and k not in DERIVED_VARIABLES}
+
+        if len(self.timesteps) % self.snapshot_every == 0:
+            self.snapshots[timestep] = {
+                **{k: _snapshot(state[k]) for k in APPEND_ONLY_VARIABLES},  # type: ignore
+                **{k: state[k] for k in DERIVED_VARIABLES},  # type: ignore
+                **replaced}
+
+        self.timesteps.append(timestep)
+        self.deltas.append(TimestepDelta(timestep, appended, replaced))
+
+    def _rebuild(self, start: int, stop: int) -> Iterator[NQGModelState]:
+        """
+        Yield the states of the recorded timesteps with indexes in [start, stop),
+        starting from the closest snapshot before `start`.
+        """
+        snapshot_index = max(i for i in range(start + 1)
+                             if self.timesteps[i] in self.snapshots)
+        snapshot = self.snapshots[self.timesteps[snapshot_index]]
+        state = dict(snapshot)
+        for variable in APPEND_ONLY_VARIABLES:
+            if variable in GRAPH_VARIABLES:
+                state[variable] = append_only_graph(state[variable], GRAPH_VARIABLES[variable])
+            elif isinstance(state[variable], dict):
+                state[variable] = append_only_dict(state[variable])
+            elif variable == 'users':
+                state[variable] = user_registry(state[variable], self.params['past_rounds'])
+            elif isinstance(state[variable], list):
+                state[variable] = append_only_list(state[variable])
+        oracle_state = replace(snapshot['oracle_state'], pagerank_engine=None)
+
+        for i in range(snapshot_index, stop):
+            delta = self.deltas[i]
+            if i > snapshot_index:
+                for variable, entries in delta.appended.items():
+                    if variable in GRAPH_VARIABLES:
+                        state[variable] = state[variable].appended(entries, delta.timestep)
+                    else:
+                        state[variable] = state[variable].appended(entries)
+                state.update(delta.replaced)
+            if i >= start:
+                if delta.timestep in self.snapshots:
+                    derived = {k: self.snapshots[delta.timestep][k] for k in DERIVED_VARIABLES}
+                else:
+                    derived = self._derive(state, oracle_state)
+                    oracle_state = derived['oracle_state']
+                yield NQGModelState(**{**state, **derived, 'timestep': delta.timestep})  # type: ignore
+
+    def _derive(self, state: dict, previous_oracle_state: OracleState) -> dict:
+        (_, oracle_state) = s_oracle_state(self.params, 0, [],
+                                           {**state, 'oracle_state': previous_oracle_state},  # type: ignore
+                                           {})
+        signal = p_compute_votes(self.params, 0, [],
+                                 {**state, 'oracle_state': oracle_state})  # type: ignore
+        return {'oracle_state': oracle_state,
+                'effective_action_matrix': signal['effective_action_matrix'],
+                'vote_matrix': signal['vote_matrix']}
+
+    def state_at(self, timestep: int) -> NQGModelState:
+        """
+        Rebuild the full state at a recorded timestep.
+        """
+        i = bisect_right(self.timesteps, timestep) - 1
+        if i < 0 or self.timesteps[i] != timestep:
+            raise KeyError(f"Timestep {timestep} was not recorded")
+        return next(self._rebuild(i, i + 1))
+
+    def iter_states(self) -> Iterator[NQGModelState]:
+        """
+        Rebuild the full state of every recorded timestep, in order.
+        Consecutive states share their storage, so this is much cheaper
+        than calling `state_at` for every timestep.
+        """
+        if len(self.timesteps) > 0:
+            yield from self._rebuild(0, len(self.timesteps))
+
+    def to_dataframe(self) -> DataFrame:
+        """
+        Rebuild every recorded timestep as a DataFrame with the same
+        state columns as `easy_run`.
+        """
+        return DataFrame(list(self.iter_states()))
+
+
+def history_block(history: DeltaHistory) -> dict:
+    """
+    Partial State Update Block which records the state at the end of
+    every timestep into `history`. It should go last on the model blocks.
+
+    XXX: cadCAD runs multiple Monte Carlo runs on separate processes,
+    so this is meant for single run executions.
+    """
+    def p_record_history(_1, _2, _3, state: NQGModelState) -> dict:
+        history.record(state)
+        return {}
+
+    return {
+        'label': 'Record history',
+        'policies': {
+            'record_history': p_record_history
+        },
+        'variables': {}
+    }
@@ -0,0 +1,518 @@
+from nqg_model.types import *
+from nqg_model.params import SINGLE_RUN_PARAMS, INITIAL_ORACLE_STATE
+from nqg_model.neural_quorum_governance import neural_governance_power, resolve_quorum_consensus
+from nqg_model.trust_rank import pagerank
+from typing import AsyncIterator, Awaitable, BinaryIO, Iterable, Iterator
+import numpy as np
+import asyncio
+import json
+import os
+import stat
+import sys
+
+# Per-user columns of `LiveTally`, as (users, projects) arrays
+ROW_COLUMNS: dict[str, type] = {
+    'votes': float,  # Effective votes: direct for round voters, by quorum consensus for delegators
+    'mask': bool,  # Whatever the vote is counted
+    'weights': float,  # Quorum agreement weights of the direct votes
+    'has_action': bool,
+    'power': float,
+    'contribution': float,
+}
+
+# Event types, as on the `event` key of the messages
+EVENTS = ('onboard', 'trust', 'vote', 'delegate', 'abstain')
+
+
+def _grown(values: ndarray, size: int) -> ndarray:
+    if size <= len(values):
+        return values
+    capacity = max(len(values), 16)
+    while capacity < size:
+        capacity *= 2
+    grown = np.zeros((capacity,) + values.shape[1:], dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+class LiveTally():
+    """
+    Tally of an open round which is updated event by event.
+
+    Every user has a row holding its effective votes, its Voting Power
+    and its contribution to `per_project_voting`, and an event only
+    recomputes the rows that it affects: a vote updates the voter and the
+    delegators whose quorum includes it, a delegation updates the
+    delegator and onboarding updates the user power.
+
+    Quorums follow `vote_from_quorum_delegation`, where round voters are
+    ranked on the order that they decided (ie. first voted) in.
+
+    As the Trust Score is the PageRank of the whole Trust Graph, trust
+    events only mark the graph as changed. `refresh_trust` recomputes it,
+    warm-started from the previous results, and then updates the users
+    whose Trust Score changed.
+    """
+
+    def __init__(self,
+                 params: NQGModelParams = SINGLE_RUN_PARAMS,
+                 oracle_state: OracleState = INITIAL_ORACLE_STATE):
+        if params.get('quorum_delegation_transitive', False):
+            raise ValueError("Transitive Quorum Delegation is not supported on the live tally")
+        self.params = params
+        self.projects: list[ProjectUUID] = sorted(params['projects'])
+        self.project_index = {p: j for j, p in enumerate(self.projects)}
+        self.labels: list[UserUUID] = []
+        self.rows: dict[UserUUID, int] = {}
+        self.columns = {k: np.zeros((0, len(self.projects)), dtype=dtype) for k, dtype in ROW_COLUMNS.items()}
+        self.power_stale = np.zeros(0, dtype=bool)
+        self.totals = np.zeros(len(self.projects))
+
+        self.decisions: dict[int, Action] = {}
+        # Decision order of the round voters
+        self.voter_order: dict[int, int] = {}
+        self.n_decided = 0
+        self.delegatees: dict[int, list[int]] = {}
+        self.delegators_of: dict[int, set[int]] = {}
+        self.quorums: dict[int, tuple[int, ...]] = {}
+        self.quorum_members: dict[int, set[int]] = {}
+
+        # Trust Graph edges, where replaced edges are marked as dead
+        self.trust_sources = np.zeros(0, dtype=np.int64)
+        self.trust_targets = np.zeros(0, dtype=np.int64)
+        self.trust_alive = np.zeros(0, dtype=bool)
+        self.trust_spans: dict[int, tuple[int, int]] = {}
+        self.n_trust_edges = 0
+        self.trust_changed = False
+        self.pagerank_values = np.zeros(0)
+        self.trust = np.zeros(0)
+
+        self.oracle_state = OracleState(pagerank_results={},
+                                        trust_index={},
+                                        reputation_bonus_values={},
+                                        prior_voting_bonus_values={},
+                                        reputation_bonus_map=oracle_state.reputation_bonus_map,
+                                        prior_voting_bonus_map=oracle_state.prior_voting_bonus_map)
+        self.vote_weights = {Vote.Yes: params['quorum_agreement_weight_yes'],
+                             Vote.No: params['quorum_agreement_weight_no'],
+                             Vote.Abstain: params['quorum_agreement_weight_abstain']}
+
+    @property
+    def n_users(self) -> int:
+        return len(self.labels)
+
+    @property
+    def per_project_voting(self) -> PerProjectVoting:
+        return dict(zip(self.projects, self.totals.tolist()))
+
+    def _row(self, user: UserUUID) -> int:
+        """
+        Row of `user`, which is onboarded as uncategorized if unknown.
+        """
+        row = self.rows.get(user)
+        if row is None:
+            row = self.rows[user] = len(self.labels)
+            self.labels.append(user)
+            for (k, values) in self.columns.items():
+                self.columns[k] = _grown(values, row + 1)
+            self.power_stale = _grown(self.power_stale, row + 1)
+            self.trust = _grown(self.trust, row + 1)
+            self.power_stale[row] = True
+            self.oracle_state.reputation_bonus_values[user] = ReputationCategory.Uncategorized  # type: ignore
+            self.oracle_state.prior_voting_bonus_values[user] = []  # type: ignore
+        return row
+
+    def _compute_power(self, rows: ndarray) -> None:
+        labels = [self.labels[r] for r in rows.tolist()]
+        power = neural_governance_power(labels, self.projects, self.params, self.oracle_state)
+        self.columns['power'][rows] = np.broadcast_to(power, (len(rows), len(self.projects)))
+        self.power_stale[rows] = False
+
+    def update_row(self, row: int) -> None:
+        """
+        `update_rows` for a single row, which is the common case on events.
+        """
+        mask = self.columns['mask'][row]
+        if self.power_stale[row] and mask.any():
+            self._compute_power(np.array([row]))
+        new = np.where(mask, self.columns['votes'][row] * self.columns['power'][row], 0.0)
+        contribution = self.columns['contribution']
+        self.totals += new - contribution[row]
+        contribution[row] = new
+
+    def update_rows(self, rows: Iterable[int]) -> None:
+        """
+        Recompute the contribution of `rows` and apply the difference to the totals.
+        """
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        (votes, mask, contribution) = (self.columns['votes'], self.columns['mask'], self.columns['contribution'])
+        is_stale = self.power_stale[rows] & mask[rows].any(axis=1)
+        if is_stale.any():
+            self._compute_power(rows[is_stale])
+        new = np.where(mask[rows], votes[rows] * self.columns['power'][rows], 0.0)
+        self.totals += new.sum(axis=0) - contribution[rows].sum(axis=0)
+        contribution[rows] = new
+
+    def recount(self) -> None:
+        """
+        Sum the totals from scratch, dropping the rounding of the incremental updates.
+        """
+        self.totals = self.columns['contribution'][:self.n_users].sum(axis=0)
+
+    # Quorum Delegation
+
+    def _select_quorum(self, delegator: int) -> None:
+        order = self.voter_order
+        ranked = sorted(set(v for v in self.delegatees.get(delegator, []) if v in order), key=order.__getitem__)
+        quorum = tuple(ranked[:self.params['max_quorum_selected_delegates']])
+        for v in self.quorums.get(delegator, ()):
+            self.quorum_members[v].discard(delegator)
+        for v in quorum:
+            self.quorum_members.setdefault(v, set()).add(delegator)
+        self.quorums[delegator] = quorum
+
+    def _resolve_quorums(self, delegators: Iterable[int]) -> None:
+        delegators = [d for d in delegators if self.decisions.get(d) == Action.Delegate]
+        if len(delegators) == 0:
+            return
+        max_delegates = self.params['max_quorum_selected_delegates']
+        members = sorted(set(v for d in delegators for v in self.quorums[d]))
+        index = {v: i for i, v in enumerate(members)}
+        # The last row is padding, as on `batch_votes_from_quorum_delegation`
+        weights = np.zeros((len(members) + 1, len(self.projects)))
+        has_action = np.zeros((len(members) + 1, len(self.projects)), dtype=bool)
+        weights[:-1] = self.columns['weights'][members]
+        has_action[:-1] = self.columns['has_action'][members]
+        selected = np.full((len(delegators), max(max_delegates, 0)), len(members))
+        for (i, d) in enumerate(delegators):
+            quorum = [index[v] for v in self.quorums[d]]
+            selected[i, :len(quorum)] = quorum
+        self.columns['votes'][delegators] = resolve_quorum_consensus(weights, has_action, selected, self.params)
+        self.columns['mask'][delegators] = True
+        self.update_rows(delegators)
+
+    def _decide(self, row: int, decision: Action) -> None:
+        previous = self.decisions.get(row)
+        if previous == decision:
+            return
+        self.decisions[row] = decision
+        (votes, mask, weights, has_action) = (self.columns['votes'], self.columns['mask'],
+                                              self.columns['weights'], self.columns['has_action'])
+        votes[row] = 0.0
+        mask[row] = False
+        if previous == Action.Delegate:
+            for v in self.delegatees.pop(row, []):
+                self.delegators_of[v].discard(row)
+            self._select_quorum(row)
+        affected = set(self.delegators_of.get(row, ()))
+        if previous == Action.RoundVote:
+            del self.voter_order[row]
+            weights[row] = 0.0
+            has_action[row] = False
+        if decision == Action.RoundVote:
+            self.voter_order[row] = self.n_decided
+            self.n_decided += 1
+        # Quorums which gained or lost a round voter
+        for d in affected:
+            self._select_quorum(d)
+        self._resolve_quorums(affected)
+        self.update_row(row)
+
+    # Events
+
+    def onboard(self,
+                user: UserUUID,
+                reputation: ReputationCategory = ReputationCategory.Uncategorized,
+                past_rounds: Sequence[PastRoundIndex] = ()) -> None:
+        row = self._row(user)
+        self.oracle_state.reputation_bonus_values[user] = reputation  # type: ignore
+        self.oracle_state.prior_voting_bonus_values[user] = sorted(past_rounds)  # type: ignore
+        self.power_stale[row] = True
+        self.update_row(row)
+
+    def trust_users(self, user: UserUUID, trustees: Iterable[UserUUID]) -> None:
+        """
+        Set the trustees of `user`, replacing any previous ones.
+        """
+        row = self._row(user)
+        targets = [self._row(u) for u in trustees]
+        if row in self.trust_spans:
+            (start, stop) = self.trust_spans[row]
+            self.trust_alive[start:stop] = False
+        (start, stop) = (self.n_trust_edges, self.n_trust_edges + len(targets))
+        self.trust_sources = _grown(self.trust_sources, stop)
+        self.trust_targets = _grown(self.trust_targets, stop)
+        self.trust_alive = _grown(self.trust_alive, stop)
+        self.trust_sources[start:stop] = row
+        self.trust_targets[start:stop] = targets
+        self.trust_alive[start:stop] = True
+        self.trust_spans[row] = (start, stop)
+        self.n_trust_edges = stop
+        self.trust_changed = True
+
+    def vote(self, user: UserUUID, votes: Mapping[ProjectUUID, Vote]) -> None:
+        """
+        Cast or replace votes of a round voter. An empty `votes` only
+        records the decision to vote.
+        """
+        row = self._row(user)
+        self._decide(row, Action.RoundVote)
+        for (project, vote) in votes.items():
+            j = self.project_index.get(project)
+            if j is None:
+                raise KeyError(f"Unknown project {project}")
+            self.columns['votes'][row, j] = vote.value
+            self.columns['mask'][row, j] = True
+            self.columns['weights'][row, j] = self.vote_weights[vote]
+            self.columns['has_action'][row, j] = True
+        self.update_row(row)
+        self._resolve_quorums(self.quorum_members.get(row, ()))
+
+    def delegate(self, user: UserUUID, delegatees: Sequence[UserUUID]) -> None:
+        """
+        Delegate the votes of `user` to its quorum, replacing any previous one.
+        """
+        row = self._row(user)
+        targets = [self._row(u) for u in delegatees]
+        self._decide(row, Action.Delegate)
+        for v in self.delegatees.get(row, []):
+            self.delegators_of[v].discard(row)
+        self.delegatees[row] = targets
+        for v in targets:
+            self.delegators_of.setdefault(v, set()).add(row)
+        self._select_quorum(row)
+        self._resolve_quorums([row])
+
+    def abstain(self, user: UserUUID) -> None:
+        self._decide(self._row(user), Action.Abstain)
+
+    def apply(self, event: dict) -> None:
+        """
+        Apply an event given as a JSON object, eg.
+        `{"event": "vote", "user": "u1", "votes": {"proj_0": 1}}`.
+        """
+        kind = event.get('event')
+        user = event['user']
+        if kind == 'onboard':
+            reputation = event.get('reputation', None)
+            self.onboard(user,
+                         ReputationCategory[reputation] if reputation is not None else ReputationCategory.Uncategorized,
+                         event.get('past_rounds', ()))
+        elif kind == 'trust':
+            self.trust_users(user, event['trustees'])
+        elif kind == 'vote':
+            votes = event.get('votes', {})
+            if 'project' in event:
+                votes = {**votes, event['project']: event['vote']}
+            self.vote(user, {p: Vote(float(v)) for (p, v) in votes.items()})
+        elif kind == 'delegate':
+            self.delegate(user, event['delegatees'])
+        elif kind == 'abstain':
+            self.abstain(user)
+        else:
+            raise ValueError(f"Unknown event {kind}, expected one of {EVENTS}")
+
+    # Trust Score
+
+    def trust_edges(self) -> tuple[ndarray, ndarray, int]:
+        """
+        Copy of the (source, target) rows of the Trust Graph and its
+        number of nodes, where every user is a node.
+        """
+        n = self.n_trust_edges
+        alive = self.trust_alive[:n]
+        self.trust_changed = False
+        return (self.trust_sources[:n][alive], self.trust_targets[:n][alive], self.n_users)
+
+    def apply_trust(self, values: ndarray, chunk_size: int = 10_000) -> Iterator[int]:
+        """
+        Set the PageRank `values` of the first len(values) users and update
+        the ones whose Trust Score changed, in chunks of `chunk_size`.
+        Yields after every chunk, so that other work can be interleaved.
+        """
+        N = len(values)
+        self.pagerank_values = values
+        scores = np.zeros(N)
+        if N >= 2:
+            (min_value, max_value) = (values.min(), values.max())
+            # XXX: assumption for edge cases, as on `normalized_trust_index`
+            scores[:] = 0.5 if max_value == min_value else (values - min_value) / (max_value - min_value)
+        changed = np.flatnonzero(scores != self.trust[:N])
+        self.trust[changed] = scores[changed]
+        trust_index = self.oracle_state.trust_index
+        for (row, score) in zip(changed.tolist(), scores[changed].tolist()):
+            trust_index[self.labels[row]] = score  # type: ignore
+        self.power_stale[changed] = True
+        for start in range(0, len(changed), chunk_size):
+            self.update_rows(changed[start:start + chunk_size])
+            yield start
+        self.recount()
+
+    def pagerank(self, edges: tuple[ndarray, ndarray, int]) -> ndarray:
+        """
+        PageRank of the given `trust_edges`, warm-started from the previous
+        values. Users missing from them start at 1/N.
+        """
+        (sources, targets, N) = edges
+        if N == 0:
+            return np.zeros(0)
+        nstart = np.full(N, 1.0 / N)
+        nstart[:len(self.pagerank_values)] = self.pagerank_values[:N]
+        return pagerank(sources, targets, N, nstart if len(self.pagerank_values) > 0 else None)
+
+    def refresh_trust(self) -> None:
+        for _ in self.apply_trust(self.pagerank(self.trust_edges())):
+            pass
+
+    # Queries
+
+    def query(self, request: dict) -> dict:
+        kind = request.get('query')
+        if kind == 'totals':
+            return {'per_project_voting': self.per_project_voting}
+        elif kind == 'user':
+            row = self.rows.get(request['user'])
+            if row is None:
+                return {'error': f"Unknown user {request['user']}"}
+            decision = self.decisions.get(row)
+            mask = self.columns['mask'][row]
+            return {'user': request['user'],
+                    'decision': decision.name if decision is not None else None,
+                    'votes': {p: v for (p, v, m) in zip(self.projects, self.columns['votes'][row].tolist(),
+                                                        mask.tolist()) if m},
+                    'contribution': dict(zip(self.projects, self.columns['contribution'][row].tolist())),
+                    'trust_score': float(self.trust[row])}
+        elif kind == 'stats':
+            return {'n_users': self.n_users,
+                    'n_roundvotes': len(self.voter_order),
+                    'n_delegations': len(self.delegatees),
+                    'n_trust_edges': int(self.trust_alive[:self.n_trust_edges].sum()),
+                    'trust_changed': self.trust_changed}
+        return {'error': f"Unknown query {kind}"}
+
+
+async def _file_lines(f: BinaryIO, batch: int = 1_000) -> AsyncIterator[bytes]:
+    for (i, line) in enumerate(f):
+        yield line
+        if i % batch == batch - 1:
+            await asyncio.sleep(0)
+
+
+class LiveTallyService():
+    """
+    asyncio front-end of a `LiveTally`, reading JSON lines of events and
+    queries from a stream and writing a JSON line for every query.
+
+    Events are applied as they come, which keeps the loop free for the
+    queries. The Trust Score is refreshed every `trust_refresh_interval`
+    seconds if the Trust Graph changed, with PageRank running on a worker
+    thread, so that it lags the trust events by about that interval.
+    """
+
+    def __init__(self,
+                 tally: LiveTally,
+                 trust_refresh_interval: float = 1.0,
+                 chunk_size: int = 1_000,
+                 yield_every: int = 100):
+        """
+        Args:
+            trust_refresh_interval (float): Seconds between Trust Score refreshes.
+            chunk_size (int): Users updated at once after a refresh.
+            yield_every (int): Lines of a stream handled before letting other clients in.
+        """
+        self.tally = tally
+        self.trust_refresh_interval = trust_refresh_interval
+        self.chunk_size = chunk_size
+        self.yield_every = yield_every
+        self._refresh_lock = asyncio.Lock()
+
+    async def refresh_trust(self) -> None:
+        async with self._refresh_lock:
+            edges = self.tally.trust_edges()
+            values = await asyncio.get_running_loop().run_in_executor(None, self.tally.pagerank, edges)
+            for _ in self.tally.apply_trust(values, self.chunk_size):
+                await asyncio.sleep(0)
+
+    async def refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.trust_refresh_interval)
+            if self.tally.trust_changed:
+                await self.refresh_trust()
+
+    async def handle(self, message: dict) -> Optional[dict]:
+        """
+        Apply an event or answer a query. `{"query": "refresh"}` refreshes
+        the Trust Score right away and answers once it is done.
+        """
+        try:
+            if 'event' in message:
+                self.tally.apply(message)
+                return None
+            if message.get('query') == 'refresh':
+                await self.refresh_trust()
+                return {'refreshed': True}
+            return self.tally.query(message)
+        except (KeyError, ValueError) as e:
+            return {'error': str(e)}
+
+    async def handle_stream(self,
+                            lines: AsyncIterator[bytes],
+                            write: Callable[[bytes], None]) -> None:
+        n_lines = 0
+        async for line in lines:
+            n_lines += 1
+            if n_lines % self.yield_every == 0:
+                # Buffered lines are read without suspending, which would hold back other clients
+                await asyncio.sleep(0)
+            if not line.strip():
+                continue
+            try:
+                response = await self.handle(json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {'error': str(e)}
+            if response is not None:
+                write(json.dumps(response).encode() + b'\n')
+
+    async def _with_refresh(self, server: Awaitable) -> None:
+        refresh = asyncio.create_task(self.refresh_loop())
+        try:
+            await server
+        finally:
+            refresh.cancel()
+
+    async def serve_stdio(self) -> None:
+        """
+        Serve a single JSON lines stream on stdin & stdout until EOF.
+        """
+        lines: AsyncIterator[bytes]
+        if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+            # Redirected files can't be read through the event loop
+            lines = _file_lines(sys.stdin.buffer)
+        else:
+            lines = asyncio.StreamReader()
+            await asyncio.get_running_loop().connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(lines), sys.stdin)  # type: ignore
+
+        def write(data: bytes) -> None:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+        await self._with_refresh(self.handle_stream(lines, write))
+
+    async def serve_socket(self, path: Optional[str] = None, port: Optional[int] = None) -> None:
+        """
+        Serve any number of clients on a Unix socket at `path`, or on
+        localhost at `port`. Every client can send events & queries.
+        """
+        async def on_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            await self.handle_stream(reader, writer.write)
+            writer.close()
+
+        if path is not None:
+            server = await asyncio.start_unix_server(on_client, path)
+        else:
+            server = await asyncio.start_server(on_client, '127.0.0.1', port)
+        async with server:
+            await self._with_refresh(server.serve_forever())
@@ -1,12 +1,14 @@
-from cadCAD_tools.types import Signal, VariableUpdate  # type: ignore
 from nqg_model.types import *
 from typing import Callable
-from copy import deepcopy
-from scipy.stats import poisson, bernoulli  # type: ignore
 from random import choice, sample
 from nqg_model.neural_quorum_governance import *
-from nqg_model.helper import *
-import networkx as nx # type: ignore
+from nqg_model.trust_rank import IncrementalPageRank
+from nqg_model.oracles import oracle_providers
+from nqg_model.containers import append_only_dict
+from nqg_model.graph import append_only_graph
+from nqg_model.registry import UserRegistry, user_registry
+from nqg_model.behaviour import *
+import numpy as np
 
 def generic_policy(_1, _2, _3, _4) -> dict:
     """Function to generate pass through policy
@@ -60,18 +62,30 @@ def s_delta_days(_1, _2, _3, _4, signal: Signal) -> VariableUpdate:
     return ('delta_days', signal['delta_days'])
 
 
-def s_onboard_users(params: NQGModelParams, _2, _3, state: NQGModelState, _5) -> VariableUpdate:
+def p_onboard_users(params: NQGModelParams, _2, _3, state: NQGModelState) -> Signal:
     """
     Onboard N new users and their relevant properties for NQG
     through stochastic processes.
 
+    The new users are published as the `onboarded_users` event batch,
+    which the later blocks consume instead of diffing the users against
+    the history.
+
     XXX: the new user reputation is chosen from the `ReputationCategory` enum
     with every option having equal weight.
     XXX: the active past rounds for the new user is randomly sampled
     from the list of past rounds with equal weights. The amount of samples
     is based on a capped poisson sample.
     """
-    new_user_list = deepcopy(state['users'])
+    n_users = len(state['users'])
+    timestep = state.get('timestep', 0)  # type: ignore
+    if params['behaviour_sampling'] is BehaviourSampling.Batched:
+        rng = behaviour_rng(params, state, ONBOARDING_STREAM)
+        return {'onboarded_users': sample_new_users(rng, n_users, timestep, params)}
+
+    # XXX: imported here as scipy.stats is slow to load
+    from scipy.stats import poisson  # type: ignore
+    new_user_list = []
 
     avg_new_users_per_ts = params['avg_new_users_per_day'] * params['timestep_in_days']
     new_users: int = poisson.rvs(avg_new_users_per_ts)
@@ -83,17 +97,36 @@ def s_onboard_users(params: NQGModelParams, _2, _3, state: NQGModelState, _5) ->
         past_voting_n = min(poisson.rvs(params['avg_user_past_votes']), 
                             len(past_round_choices))
 
-        new_user = User(label=len(new_user_list) + i,
+        new_user = User(label=n_users + i,
                         reputation=choice(reputation_choices),
-                        active_past_rounds=set(sample(past_round_choices, past_voting_n)))
+                        active_past_rounds=set(sample(sorted(past_round_choices), past_voting_n)))
         
         new_user_list.append(new_user)
 
-    return ('users', new_user_list)
+    return {'onboarded_users': UserRegistry(new_user_list, past_round_choices, timestep)}
+
+
+def s_onboard_users(params: NQGModelParams, _2, _3, state: NQGModelState, signal: Signal) -> VariableUpdate:
+    """
+    Append the onboarded users batch to the user registry.
+    """
+    users = user_registry(state['users'], params['past_rounds'])
+    return ('users', users.appended(signal['onboarded_users']))
+
+
+def onboarding_split(state: NQGModelState) -> tuple[UserRegistry, UserRegistry]:
+    """
+    Split the users into the ones that were there before the current
+    timestep and the ones onboarded on it.
+    """
+    users = user_registry(state['users'])
+    onboarded_users = user_registry(state['onboarded_users'])
+    return (users[:len(users) - len(onboarded_users)], onboarded_users)
+
 
 def p_user_vote(params: NQGModelParams,
                  _2,
-                 history: dict[int, dict[int, NQGModelState]], 
+                 _3,
                  state: NQGModelState) -> Signal:
     """
     Make new users decide on their actions: Abstain, Vote or Delegate
@@ -106,25 +139,35 @@ def p_user_vote(params: NQGModelParams,
     XXX: Poisson processes are used for all of the following:
         - determine how much delegatees an user will have if he opted to delegate 
     """
-    delegates: DelegationGraph = deepcopy(state['delegatees'])
-    action_matrix: ActionMatrix = deepcopy(state['action_matrix'])
-    decisions: dict[UserUUID, Action] = deepcopy(state['user_round_decisions'])
-
-    current_users = set(u.label 
-                     for u 
-                     in state['users'])
-    
-    previous_state_users = retrieve_prev_state_users(history)
-
-    new_users = current_users - previous_state_users
-
+    # Only the new users entries are built here. They are appended
+    # on top of the copy-on-write state snapshots at the end.
+    delegates: dict[UserUUID, list[UserUUID]] = {}
+    action_matrix: dict[UserUUID, dict[ProjectUUID, Vote]] = {}
+    decisions: dict[UserUUID, Action] = {}
+
+    (previous_state_users, onboarded_users) = onboarding_split(state)
+    new_users = onboarded_users.labels.tolist()
+    timestep = state.get('timestep', 0)  # type: ignore
+
+    if params['behaviour_sampling'] is BehaviourSampling.Batched:
+        rng = behaviour_rng(params, state, VOTING_STREAM)
+        (decisions, action_matrix, delegates) = sample_user_actions(rng,
+                                                                    new_users,
+                                                                    previous_state_users.labels,
+                                                                    params)
+        return {'delegatees': append_only_graph(state['delegatees'], ordered=True).appended(delegates, timestep),
+                'action_matrix': append_only_dict(state['action_matrix']).appended(action_matrix),
+                'user_round_decisions': append_only_dict(state['user_round_decisions']).appended(decisions)}
+
+    from scipy.stats import poisson, bernoulli  # type: ignore
+    previous_user_labels = previous_state_users.labels.tolist()
     for user in new_users:
         action_matrix[user] = {}
         if bernoulli.rvs(params['new_user_action_probability']):
             if bernoulli.rvs(params['new_user_round_vote_probability']):
                 decisions[user] = Action.RoundVote
-                # Active vote
-                for project in params['projects']:
+                # Active vote. Sorted, as set order varies across processes.
+                for project in sorted(params['projects']):
                     if bernoulli.rvs(params['new_user_project_vote_probability']):
                         if bernoulli.rvs(params['new_user_project_vote_yes_probability']):
                             project_vote = Vote.Yes
@@ -144,68 +187,79 @@ def p_user_vote(params: NQGModelParams,
                 if delegate_count < params['new_user_min_delegate_count']:
                     pass
                 else:
-                    user_delegates = sample(previous_state_users, delegate_count)
+                    user_delegates = sample(previous_user_labels, delegate_count)
                     delegates[user] = user_delegates
         else:
             decisions[user] = Action.Abstain
 
-    return {'delegatees': delegates,
-            'action_matrix': action_matrix, 
-            'user_round_decisions': decisions}
+    return {'delegatees': append_only_graph(state['delegatees'], ordered=True).appended(delegates, timestep),
+            'action_matrix': append_only_dict(state['action_matrix']).appended(action_matrix),
+            'user_round_decisions': append_only_dict(state['user_round_decisions']).appended(decisions)}
 
 
 
-def s_trust(params: NQGModelParams, _2, history, state: NQGModelState, _5) -> VariableUpdate:
+def s_trust(params: NQGModelParams, _2, _3, state: NQGModelState, _5) -> VariableUpdate:
     """
     Make new users trust each other
 
     XXX: this is done by randomly sampling the set of previous users. The amount
     of users to be trusted is sampled from a Poisson distribution.
     """
-    trustees: TrustGraph = deepcopy(state['trustees'])
-    current_users = set(u.label 
-                     for u 
-                     in state['users'])
-    
-    previous_state_users = retrieve_prev_state_users(history)
+    trustees: dict[UserUUID, set[UserUUID]] = {}
+    (previous_state_users, onboarded_users) = onboarding_split(state)
+    new_users = onboarded_users.labels.tolist()
+    timestep = state.get('timestep', 0)  # type: ignore
+
+    if params['behaviour_sampling'] is BehaviourSampling.Batched:
+        rng = behaviour_rng(params, state, TRUST_STREAM)
+        trustees = sample_user_trustees(rng,
+                                        new_users,
+                                        previous_state_users.labels,
+                                        params)
+        return ('trustees', append_only_graph(state['trustees']).appended(trustees, timestep))
 
-    new_users = current_users - previous_state_users
+    from scipy.stats import poisson  # type: ignore
+    previous_user_labels = previous_state_users.labels.tolist()
     for user in new_users:
         n_user_trustees = poisson.rvs(params['new_user_average_trustees'])
         n_user_trustees = min(n_user_trustees, len(previous_state_users))
-        user_trustees = set(sample(previous_state_users, n_user_trustees))
+        user_trustees = set(sample(previous_user_labels, n_user_trustees))
         trustees[user] = user_trustees
 
-    return ('trustees', trustees)
+    return ('trustees', append_only_graph(state['trustees']).appended(trustees, timestep))
 
 def s_oracle_state(params: NQGModelParams, _2, _3, state: NQGModelState, _5) -> VariableUpdate:
     """
     Update the state of the oracles (eg. pagerank values & oracles/reputation weights)
     """
     raw_graph = state['trustees']
+    previous_state = state['oracle_state']
 
     # Update Page rank values
-    G = nx.from_dict_of_lists(raw_graph,
-                              create_using=nx.DiGraph)
-    pagerank_values = nx.pagerank(G, 
-                                  alpha=0.85, 
-                                  personalization=None, 
-                                  max_iter=100,
-                                  tol=1e-6,
-                                  nstart=None,
-                                  weight=None,
-                                  dangling=None)
+    engine = previous_state.pagerank_engine
+    if engine is None:
+        engine = IncrementalPageRank(alpha=0.85, max_iter=100, tol=1e-6)
+    pagerank_values = engine.update(raw_graph,
+                                    nstart=previous_state.pagerank_results)
+    if pagerank_values is previous_state.pagerank_results:
+        trust_index = previous_state.trust_index
+    else:
+        trust_index = normalized_trust_index(pagerank_values)
     
     # Update Reputation & Prior Voting user data
 
-    reputation_values = {u.label: u.reputation for u in state['users']}
-    prior_voting_values = {u.label: list(u.active_past_rounds) for u in state['users']}
+    users = user_registry(state['users'])
+    reputation_values = users.reputation_values()
+    prior_voting_values = users.prior_voting_values()
 
     new_state = OracleState(pagerank_results=pagerank_values,
+                            trust_index=trust_index,
                             reputation_bonus_values=reputation_values,
                             prior_voting_bonus_values=prior_voting_values,
-                            reputation_bonus_map=state['oracle_state'].reputation_bonus_map,
-                            prior_voting_bonus_map=state['oracle_state'].prior_voting_bonus_map)
+                            reputation_bonus_map=previous_state.reputation_bonus_map,
+                            prior_voting_bonus_map=previous_state.prior_voting_bonus_map,
+                            pagerank_engine=engine,
+                            oracles=oracle_providers(previous_state.oracles))
     return ('oracle_state', new_state)
 
 
@@ -213,8 +267,9 @@ def p_compute_votes(params: NQGModelParams, _2, _3, state: NQGModelState) -> Sig
     """
     Perform Neural Quorum Governance
     """
-    action_vote_matrix: ActionMatrix = deepcopy(state['action_matrix'])
-    per_project_voting: PerProjectVoting = deepcopy(state['per_project_voting'])
+    # Shallow copies: rows are replaced, never mutated.
+    action_vote_matrix: dict[UserUUID, dict[ProjectUUID, Vote]] = dict(state['action_matrix'])
+    per_project_voting: PerProjectVoting = dict(state['per_project_voting'])
 
     # Compute Abstainin users action matrix
     abstaining_users = set(u for u, d in state['user_round_decisions'].items()
@@ -226,19 +281,30 @@ def p_compute_votes(params: NQGModelParams, _2, _3, state: NQGModelState) -> Sig
             action_vote_matrix[user_id][project] = Vote.Abstain
     
     # Compute Delegatees action matrix with Quorum Delegation
-    delegating_users = set(u for u, d in state['user_round_decisions'].items()
-                        if d == Action.Delegate)
-    for user_id in delegating_users:
-        action_vote_matrix[user_id] = {}
-        for project in params['projects']:
-            vote = vote_from_quorum_delegation(state['delegatees'].get('user', []),
-                                        project,
-                                        state['action_matrix'],
-                                        state['user_round_decisions'],
-                                        params)
-            action_vote_matrix[user_id][project] = vote
+    delegating_users = [u for u, d in state['user_round_decisions'].items()
+                        if d == Action.Delegate]
+    projects = list(params['projects'])
+    delegated_votes = batch_votes_from_quorum_delegation(delegating_users,
+                                                         projects,
+                                                         state['delegatees'],
+                                                         state['action_matrix'],
+                                                         state['user_round_decisions'],
+                                                         params)
+    vote_choices = {vote.value: vote for vote in Vote}
+    for user_id, votes in zip(delegating_users, delegated_votes.tolist()):
+        action_vote_matrix[user_id] = {project: vote_choices[vote]
+                                       for project, vote in zip(projects, votes)}
 
     # Compute vote matrix with Neural Governance
+    if batch_neuron_layers_of(params) is not None:
+        (vote_matrix, per_project_voting) = batch_tally(action_vote_matrix,
+                                                        per_project_voting,
+                                                        params,
+                                                        state['oracle_state'])
+        return {'effective_action_matrix': action_vote_matrix,
+                'vote_matrix': vote_matrix,
+                'per_project_voting': per_project_voting}
+
     vote_matrix: VotingMatrix = {}
     for user_id, votes in action_vote_matrix.items():
         vote_matrix[user_id] = {}
@@ -254,5 +320,32 @@ def p_compute_votes(params: NQGModelParams, _2, _3, state: NQGModelState) -> Sig
             else:
                 per_project_voting[project] = vote_matrix[user_id][project]
 
-    return {'vote_matrix': vote_matrix,
-            'per_project_voting': per_project_voting}
\ No newline at end of file
+    return {'effective_action_matrix': action_vote_matrix,
+            'vote_matrix': vote_matrix,
+            'per_project_voting': per_project_voting}
+
+
+def batch_tally(action_vote_matrix: ActionMatrix,
+                per_project_voting: PerProjectVoting,
+                params: NQGModelParams,
+                oracle_state: OracleState) -> tuple[VotingMatrix, PerProjectVoting]:
+    """
+    Vectorized Neural Governance tally over a dense users × projects
+    action array, as per `neural_governance_power`.
+    """
+    (user_ids, project_ids, votes, mask) = dense_action_matrix(action_vote_matrix,
+                                                               sorted(params['projects']))
+    power = neural_governance_power(user_ids, project_ids, params, oracle_state)
+    vote_array = votes * power
+
+    vote_matrix: VotingMatrix = {}
+    for user_id, row, row_mask in zip(user_ids, vote_array.tolist(), mask.tolist()):
+        vote_matrix[user_id] = {p: v
+                                for p, v, present in zip(project_ids, row, row_mask)
+                                if present}
+
+    totals = np.where(mask, vote_array, 0.0).sum(axis=0)
+    for project, total, voted in zip(project_ids, totals.tolist(), mask.any(axis=0).tolist()):
+        if voted:
+            per_project_voting[project] = per_project_voting.get(project, 0.0) + total
+    return (vote_matrix, per_project_voting)
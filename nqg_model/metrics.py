@@ -0,0 +1,162 @@
+from nqg_model.types import *
+from nqg_model.containers import entries_since
+from nqg_model.registry import user_registry
+from nqg_model.runner import native_run
+from nqg_model.neural_quorum_governance import batch_votes_from_quorum_delegation, batch_trust_score
+from collections import Counter
+from pandas import DataFrame
+import numpy as np
+
+# Custom per-timestep metric, computed from the state at the end of a timestep
+MetricFunction = Callable[[NQGModelState], float]
+
+# cadCAD indexes that identify a run
+RUN_KEYS = ('subset', 'run')
+
+
+class _RunMetrics():
+    """
+    Running totals of a single run, updated with what is new on
+    the append-only variables since the previous timestep.
+    """
+
+    def __init__(self):
+        self.seen = {'trustees': 0, 'delegatees': 0, 'user_round_decisions': 0}
+        self.n_trust_edges = 0
+        self.n_delegation_edges = 0
+        self.decisions: Counter = Counter()
+        # (delegator, project) pairs and how many of them reached a consensus
+        self.delegated_pairs = 0
+        self.delegated_consensus = 0
+
+
+class MetricsAggregator():
+    """
+    Computes summary statistics of the simulation state at the end of
+    every timestep, while the simulation runs.
+
+    The counts over the append-only variables (users, decisions, trust and
+    delegation edges) are updated incrementally, as quorum delegation
+    outcomes are: delegatees are only drawn from earlier users, whose
+    decisions don't change afterwards. The trust score distribution is
+    computed from scratch, as PageRank is.
+
+    XXX: cadCAD executes multiple runs on separate processes, in which case
+    the rows are recorded on copies of the aggregator. Use it on the native
+    runner (see `metrics_run`) or on single runs.
+    """
+
+    def __init__(self,
+                 trust_quantiles: Sequence[float] = (0.1, 0.5, 0.9),
+                 extra: Optional[dict[str, MetricFunction]] = None):
+        """
+        Args:
+            trust_quantiles (Sequence[float]): Quantiles of the Trust Score to record.
+            extra (dict, optional): Additional metrics to record, by column name.
+        """
+        self.trust_quantiles = trust_quantiles
+        self.extra = extra or {}
+        self.runs: dict[tuple, _RunMetrics] = {}
+        self.rows: list[dict] = []
+
+    def update(self, params: NQGModelParams, state: NQGModelState) -> dict:
+        """
+        Record the metrics of the current state and return them.
+        """
+        key = tuple(state.get(k, 0) for k in RUN_KEYS)
+        run = self.runs.get(key)
+        if run is None:
+            run = self.runs[key] = _RunMetrics()
+
+        for (_, trusted) in entries_since(state['trustees'], run.seen['trustees']):
+            run.seen['trustees'] += 1
+            run.n_trust_edges += len(trusted)
+        for (_, quorum) in entries_since(state['delegatees'], run.seen['delegatees']):
+            run.seen['delegatees'] += 1
+            run.n_delegation_edges += len(quorum)
+
+        decisions = state['user_round_decisions']
+        new_decisions = list(entries_since(decisions, run.seen['user_round_decisions']))
+        run.seen['user_round_decisions'] += len(new_decisions)
+        run.decisions.update(d for (_, d) in new_decisions)
+        new_delegators = [u for (u, d) in new_decisions if d == Action.Delegate]
+        if len(new_delegators) > 0:
+            outcomes = batch_votes_from_quorum_delegation(new_delegators,
+                                                          list(params['projects']),
+                                                          state['delegatees'],
+                                                          state['action_matrix'],
+                                                          decisions,
+                                                          params)
+            run.delegated_pairs += outcomes.size
+            run.delegated_consensus += int(np.count_nonzero(outcomes))
+
+        n_trusters = run.seen['trustees']
+        n_quorums = run.seen['delegatees']
+        row = {'subset': key[0],
+               'run': key[1],
+               'timestep': state.get('timestep', 0),
+               'days_passed': state['days_passed'],
+               'n_users': len(state['users']),
+               'n_quorums': n_quorums,
+               'n_roundvotes': run.decisions[Action.RoundVote],
+               'n_delegations': run.decisions[Action.Delegate],
+               'n_abstains': run.decisions[Action.Abstain],
+               'avg_trustees_per_user': run.n_trust_edges / n_trusters if n_trusters > 0 else 0.0,
+               'avg_delegatees_per_user': run.n_delegation_edges / n_quorums if n_quorums > 0 else 0.0,
+               'delegation_success_rate': (run.delegated_consensus / run.delegated_pairs
+                                           if run.delegated_pairs > 0 else np.nan)}
+
+        trust = batch_trust_score(user_registry(state['users']).labels.tolist(),
+                                  state['oracle_state'])[:, 0]
+        row['trust_mean'] = trust.mean() if len(trust) > 0 else np.nan
+        row['trust_std'] = trust.std() if len(trust) > 0 else np.nan
+        for (q, value) in zip(self.trust_quantiles,
+                              np.quantile(trust, self.trust_quantiles) if len(trust) > 0
+                              else [np.nan] * len(self.trust_quantiles)):
+            row[f'trust_q{q:g}'] = value
+
+        for (project, power) in sorted(state['per_project_voting'].items()):
+            row[f'power_{project}'] = power
+        for (name, f) in self.extra.items():
+            row[name] = f(state)
+
+        self.rows.append(row)
+        return row
+
+    def to_dataframe(self) -> DataFrame:
+        return DataFrame(self.rows)
+
+
+def metrics_block(aggregator: MetricsAggregator) -> dict:
+    """
+    Partial State Update Block which records the metrics of the state at
+    the end of every timestep on `aggregator`. It should go last on the
+    model blocks.
+    """
+    def p_record_metrics(params, _2, _3, state: NQGModelState) -> dict:
+        aggregator.update(params, state)
+        return {}
+
+    return {
+        'label': 'Record metrics',
+        'policies': {
+            'record_metrics': p_record_metrics
+        },
+        'variables': {}
+    }
+
+
+def metrics_run(state_variables: NQGModelState,
+                params: dict[str, list],
+                psubs: list[dict],
+                N_timesteps: int,
+                N_samples: int,
+                aggregator: Optional[MetricsAggregator] = None) -> DataFrame:
+    """
+    Execute the blocks on the native runner while only keeping the metrics
+    of every timestep, so that no state history is held in memory.
+    """
+    aggregator = aggregator or MetricsAggregator()
+    native_run(state_variables, params, psubs + [metrics_block(aggregator)],
+               N_timesteps, N_samples, assign_params=False, variables=(), history_window=0)
+    return aggregator.to_dataframe()
@@ -1,5 +1,9 @@
 from nqg_model.types import *
+from nqg_model.registry import UserAttributes, UserValues, REPUTATION_CATEGORIES
+from nqg_model.graph import AppendOnlyGraph
+from nqg_model.oracles import OracleDefinition, register_oracle, oracle_value, batch_oracle_values
 from functools import reduce
+import numpy as np
 
 # Part 1. General definitions
 
@@ -11,6 +15,9 @@ def vote_from_quorum_delegation(user_quorum: list[UserUUID],
                                 params: NQGModelParams) -> Vote:
     """
     Compute the quorum agreement for the active participants
+
+    XXX: single hop. See `batch_votes_from_transitive_quorum_delegation`
+    for delegates who delegated themselves.
     """
     # Filter User quorum for actively voting users only.
     valid_delegates = [u
@@ -60,6 +67,299 @@ def vote_from_quorum_delegation(user_quorum: list[UserUUID],
         return Vote.Abstain
 
 
+def batch_votes_from_quorum_delegation(delegators: Sequence[UserUUID],
+                                       project_ids: Sequence[ProjectUUID],
+                                       delegatees: DelegationGraph,
+                                       action_matrix: ActionMatrix,
+                                       user_decisions: Mapping[UserUUID, Action],
+                                       params: NQGModelParams) -> ndarray:
+    """
+    Vectorized `vote_from_quorum_delegation` for every delegator × project pair.
+
+    The actively voting users are indexed once, every delegator quorum is
+    resolved against that index in a single pass and the agreement
+    thresholds are applied across all projects at once.
+
+    Returns a (len(delegators), len(project_ids)) array of Vote values.
+    With `quorum_delegation_transitive`, see
+    `batch_votes_from_transitive_quorum_delegation`.
+    """
+    if params.get('quorum_delegation_transitive', False):
+        return batch_votes_from_transitive_quorum_delegation(delegators, project_ids, delegatees,
+                                                             action_matrix, user_decisions, params)
+    max_delegates = params['max_quorum_selected_delegates']
+
+    # Round voters in decision order. The last row is padding for
+    # quorums with less than `max_delegates` valid delegates.
+    round_voters = [u for u, d in user_decisions.items() if d == Action.RoundVote]
+    round_voter_index = {u: i for i, u in enumerate(round_voters)}
+    (weights, has_action) = round_voter_weights(round_voters, project_ids, action_matrix, params,
+                                                len(round_voters) + 1)
+
+    # Select up to the max quorum selected delegates, in decision order
+    if isinstance(delegatees, AppendOnlyGraph):
+        # Node id -> round voter index, or -1. Voters missing from
+        # the graph are written to the last entry, which is reset.
+        voter_of_node = np.full(delegatees.n_nodes + 1, -1)
+        voter_of_node[delegatees.node_ids(round_voters)] = np.arange(len(round_voters))
+        voter_of_node[-1] = -1
+        (owners, targets) = delegatees.successor_ids(delegators)
+        selected = select_quorum_delegates(owners, voter_of_node[targets],
+                                           len(delegators), max_delegates, len(round_voters))
+    else:
+        selected = np.full((len(delegators), max(max_delegates, 0)), len(round_voters))
+        for i, user in enumerate(delegators):
+            valid_delegates = sorted(set(round_voter_index[u]
+                                         for u in delegatees.get(user, [])
+                                         if u in round_voter_index))[:max_delegates]
+            selected[i, :len(valid_delegates)] = valid_delegates
+    return resolve_quorum_consensus(weights, has_action, selected, params)
+
+
+def round_voter_weights(round_voters: Sequence[UserUUID],
+                        project_ids: Sequence[ProjectUUID],
+                        action_matrix: ActionMatrix,
+                        params: NQGModelParams,
+                        n_rows: int) -> tuple[ndarray, ndarray]:
+    """
+    Agreement weight of the action of every round voter on every project,
+    and whatever it exists, as (n_rows, projects) arrays whose rows past
+    the round voters are left empty.
+    """
+    vote_weights = {Vote.Yes: params['quorum_agreement_weight_yes'],
+                    Vote.No: params['quorum_agreement_weight_no']}
+    weights = np.zeros((n_rows, len(project_ids)))
+    has_action = np.zeros((n_rows, len(project_ids)), dtype=bool)
+    for i, user in enumerate(round_voters):
+        actions = action_matrix.get(user, {})
+        for j, project in enumerate(project_ids):
+            action = actions.get(project, None)
+            if action is not None:
+                has_action[i, j] = True
+                weights[i, j] = vote_weights.get(action, params['quorum_agreement_weight_abstain'])
+    return (weights, has_action)
+
+
+def strongly_connected_components(successors: Sequence[Sequence[int]]) -> list[list[int]]:
+    """
+    Strongly connected components of a graph over the nodes 0..N-1, by
+    an iterative Tarjan's algorithm in O(V + E).
+
+    Components come after every component they reach, ie. on reverse
+    topological order.
+    """
+    n = len(successors)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: list[int] = []
+    components: list[list[int]] = []
+    counter = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        # (node, position of the next successor to visit)
+        work = [(root, 0)]
+        while work:
+            (v, i) = work[-1]
+            if i < len(successors[v]):
+                work[-1] = (v, i + 1)
+                w = successors[v][i]
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def batch_votes_from_transitive_quorum_delegation(delegators: Sequence[UserUUID],
+                                                  project_ids: Sequence[ProjectUUID],
+                                                  delegatees: DelegationGraph,
+                                                  action_matrix: ActionMatrix,
+                                                  user_decisions: Mapping[UserUUID, Action],
+                                                  params: NQGModelParams) -> ndarray:
+    """
+    `batch_votes_from_quorum_delegation` where delegates who delegated
+    count with the vote resolved from their own quorum, recursively.
+
+    Quorums are made of up to `max_quorum_selected_delegates` distinct
+    round voters or delegators, in decision order. A resolved vote counts
+    as an action on every project, Abstain included.
+
+    Only the delegators reachable from `delegators` are resolved, each of
+    them once: the components of the delegation graph are visited in
+    topological order, and every resolved vote is memoized as a row of
+    the agreement weights, which the quorums above it read. Delegators of
+    the same depth are resolved together through `resolve_quorum_consensus`,
+    so this takes O(V + E) steps plus O(V × projects) for the consensus.
+
+    Delegators on a cycle of the delegation graph are treated as per
+    `quorum_delegation_cycle_policy`.
+
+    Returns a (len(delegators), len(project_ids)) array of Vote values.
+    """
+    max_delegates = max(params['max_quorum_selected_delegates'], 0)
+    policy = params.get('quorum_delegation_cycle_policy', DelegationCyclePolicy.Drop)
+
+    # Decision order of the valid delegates
+    order: dict[UserUUID, int] = {}
+    round_voters = []
+    for (i, (user, decision)) in enumerate(user_decisions.items()):
+        if decision == Action.RoundVote:
+            round_voters.append(user)
+            order[user] = i
+        elif decision == Action.Delegate:
+            order[user] = i
+    round_voter_index = {u: i for i, u in enumerate(round_voters)}
+
+    # Delegators to resolve, with their valid delegates in decision order
+    nodes: list[UserUUID] = []
+    node_of: dict[UserUUID, int] = {}
+    for user in delegators:
+        if user not in node_of:
+            node_of[user] = len(nodes)
+            nodes.append(user)
+    candidates: list[list[UserUUID]] = []
+    successors: list[list[int]] = []
+    for user in nodes:
+        # Appended to while iterating, as delegators are reached
+        valid = sorted({u for u in delegatees.get(user, []) if u in order}, key=order.__getitem__)
+        for u in valid:
+            if u not in round_voter_index and u not in node_of:
+                node_of[u] = len(nodes)
+                nodes.append(u)
+        candidates.append(valid)
+        successors.append([node_of[u] for u in valid if u not in round_voter_index])
+
+    # Rows of the agreement weights: round voters, delegators & padding
+    n_voters = len(round_voters)
+    padding = n_voters + len(nodes)
+    (weights, has_action) = round_voter_weights(round_voters, project_ids, action_matrix, params,
+                                                padding + 1)
+    selected = np.full((len(nodes), max_delegates), padding)
+    # Resolution level of every delegator: 0 when it is already resolved
+    depth = [-1] * len(nodes)
+    for component in strongly_connected_components(successors):
+        v = component[0]
+        is_cycle = len(component) > 1 or v in successors[v]
+        if is_cycle and policy is DelegationCyclePolicy.Raise:
+            raise ValueError(f"Delegation cycle between {[nodes[w] for w in component]}")
+        if is_cycle and policy is DelegationCyclePolicy.Abstain:
+            weights[[n_voters + w for w in component]] = params['quorum_agreement_weight_abstain']
+            has_action[[n_voters + w for w in component]] = True
+            for w in component:
+                depth[w] = 0
+            continue
+        members = set(component) if is_cycle else ()
+        for v in component:
+            rows = []
+            level = 1
+            for u in candidates[v]:
+                if len(rows) == max_delegates:
+                    break
+                if u in round_voter_index:
+                    rows.append(round_voter_index[u])
+                elif node_of[u] not in members:
+                    # Already resolved, as components come after the ones they reach
+                    w = node_of[u]
+                    rows.append(n_voters + w)
+                    level = max(level, depth[w] + 1)
+            selected[v, :len(rows)] = rows
+            depth[v] = level
+
+    votes = np.full((len(nodes), len(project_ids)), Vote.Abstain.value)
+    levels = np.array(depth, dtype=np.int64)
+    # Agreement weight of every Vote value, by `vote + 1`
+    vote_weights = np.array([params['quorum_agreement_weight_no'],
+                             params['quorum_agreement_weight_abstain'],
+                             params['quorum_agreement_weight_yes']])
+    # Delegators grouped by level, in a single sort
+    by_level = np.argsort(levels, kind='stable')
+    bounds = np.searchsorted(levels[by_level], np.arange(1, int(levels.max(initial=0)) + 2))
+    for (start, end) in zip(bounds[:-1], bounds[1:]):
+        resolved = by_level[start:end]
+        votes[resolved] = resolve_quorum_consensus(weights, has_action, selected[resolved], params)
+        weights[n_voters + resolved] = vote_weights[votes[resolved].astype(np.int64) + 1]
+        has_action[n_voters + resolved] = True
+    return votes[[node_of[u] for u in delegators]]
+
+
+def select_quorum_delegates(owners: ndarray,
+                            voters: ndarray,
+                            n_delegators: int,
+                            max_delegates: int,
+                            padding: int) -> ndarray:
+    """
+    Select the quorum of many delegators at once from their delegatees as
+    (delegator, round voter index) pairs, with -1 for non round voters.
+
+    Every quorum is made of up to `max_delegates` distinct round voters,
+    in increasing index (ie. decision) order. Returns a
+    (n_delegators, max_delegates) array, filled with `padding`.
+    """
+    selected = np.full((n_delegators, max(max_delegates, 0)), padding)
+    # Unique (delegator, voter) pairs, sorted by voter within each delegator
+    pairs = np.unique(np.stack([owners, voters])[:, voters >= 0], axis=1)
+    (owners, voters) = (pairs[0], pairs[1])
+    ranks = np.arange(len(owners)) - np.searchsorted(owners, owners, side='left')
+    is_selected = ranks < max_delegates
+    selected[owners[is_selected], ranks[is_selected]] = voters[is_selected]
+    return selected
+
+
+def resolve_quorum_consensus(weights: ndarray,
+                             has_action: ndarray,
+                             selected: ndarray,
+                             params: NQGModelParams) -> ndarray:
+    """
+    Resolve the votes of selected quorums as per their consensus.
+
+    `weights` and `has_action` are (round voters + 1, projects) arrays with
+    the agreement weight of every action and whatever it exists, where the
+    last row is padding. `selected` holds the rows of every quorum.
+
+    Returns a (len(selected), projects) array of Vote values.
+    """
+    max_delegates = params['max_quorum_selected_delegates']
+
+    # Compute Absolute and Relative agreement fractions
+    agreement = weights[selected].sum(axis=1)
+    quorum_size = has_action[selected].sum(axis=1)
+    absolute_agreement = agreement / max_delegates
+    relative_agreement = np.divide(agreement, quorum_size,
+                                   out=np.zeros_like(agreement),
+                                   where=quorum_size > 0)
+
+    # Resolve votes as per quorum consensus
+    is_consensus = ((np.abs(absolute_agreement) >= params['quorum_delegation_absolute_threshold'])
+                    & (np.abs(relative_agreement) >= params['quorum_delegation_relative_threshold']))
+    return np.where(is_consensus,
+                    np.where(relative_agreement > 0, Vote.Yes.value, Vote.No.value),
+                    Vote.Abstain.value)
+
+
 def power_from_neural_governance(uid: UserUUID,
                                  pid: ProjectUUID,
                                  neuron_layers: list[NeuronLayer],
@@ -89,6 +389,102 @@ def power_from_neural_governance(uid: UserUUID,
 
     return current_vote
 
+
+def batch_power_from_neural_governance(user_ids: Sequence[UserUUID],
+                                       project_ids: Sequence[ProjectUUID],
+                                       batch_neuron_layers: list[BatchNeuronLayer],
+                                       oracle_state: OracleState,
+                                       initial_votes: float = 0.0) -> ndarray:
+    """
+    Vectorized `power_from_neural_governance`. Every neuron is evaluated
+    once over the whole users × projects grid instead of once per
+    (user, project) pair.
+
+    Returns a (len(user_ids), len(project_ids)) array of Voting Power.
+    If `initial_votes` or the bonus maps of `oracle_state` hold arrays of
+    K values (see `nqg_model.what_if`), it has a leading axis of size K.
+    """
+    initial_votes = np.asarray(initial_votes, dtype=float)
+    shape = np.broadcast_shapes(initial_votes.shape, (len(user_ids), len(project_ids)))
+    current_vote = np.array(np.broadcast_to(initial_votes, shape))
+    for (neurons, layer_aggregator) in batch_neuron_layers:
+        neuron_votes = []
+        for (neuron_label, neuron) in neurons.items():
+            (oracle_function, weighting_function) = neuron
+            raw_neuron_vote = oracle_function(
+                user_ids, project_ids, current_vote, oracle_state)
+            neuron_votes.append(weighting_function(raw_neuron_vote))
+        layer_vote = layer_aggregator(neuron_votes)
+        shape = np.broadcast_shapes(np.shape(layer_vote), shape)
+        current_vote = np.broadcast_to(layer_vote, shape)
+    return current_vote
+
+
+def batch_neuron_layers_of(params: NQGModelParams) -> Optional[list[BatchNeuronLayer]]:
+    """
+    The `batch_neuron_layers` standing for the `neuron_layers` param, or
+    None if Voting Power must be computed through the latter.
+
+    `DEFAULT_NG_BATCH_LAYERS` only mirror `DEFAULT_NG_LAYERS`, so they
+    don't apply to custom `neuron_layers` unless set explicitly.
+    """
+    batch_layers = params.get('batch_neuron_layers', None)
+    if batch_layers == DEFAULT_NG_BATCH_LAYERS and params['neuron_layers'] != DEFAULT_NG_LAYERS:
+        return None
+    return batch_layers
+
+
+def neural_governance_power(user_ids: Sequence[UserUUID],
+                            project_ids: Sequence[ProjectUUID],
+                            params: NQGModelParams,
+                            oracle_state: OracleState) -> ndarray:
+    """
+    Voting Power of users × projects as per the neuron layers of `params`.
+    Batch layers are used if they apply (see `batch_neuron_layers_of`),
+    otherwise `power_from_neural_governance` is called on every pair.
+    """
+    batch_layers = batch_neuron_layers_of(params)
+    if batch_layers is not None:
+        return batch_power_from_neural_governance(user_ids,
+                                                  project_ids,
+                                                  batch_layers,
+                                                  oracle_state,
+                                                  params['initial_power'])
+    power = [[power_from_neural_governance(u, p, params['neuron_layers'], oracle_state, params['initial_power'])
+              for p in project_ids]
+             for u in user_ids]
+    return np.array(power, dtype=float).reshape(len(user_ids), len(project_ids))
+
+
+def dense_action_matrix(action_matrix: ActionMatrix,
+                        projects: Sequence[ProjectUUID]) -> tuple[list[UserUUID], list[ProjectUUID], ndarray, ndarray]:
+    """
+    Convert an Action Matrix into a dense users × projects array of votes.
+
+    Projects that are voted on but not listed in `projects` are appended
+    as extra columns. Returns the user and project axes, the vote array
+    and a mask telling which (user, project) entries are present.
+    """
+    user_ids = list(action_matrix.keys())
+    project_ids = list(projects)
+    project_index = {p: j for j, p in enumerate(project_ids)}
+    entries = []
+    for i, votes in enumerate(action_matrix.values()):
+        for project, vote in votes.items():
+            j = project_index.get(project)
+            if j is None:
+                j = project_index[project] = len(project_ids)
+                project_ids.append(project)
+            entries.append((i, j, vote))
+
+    votes = np.zeros((len(user_ids), len(project_ids)))
+    mask = np.zeros((len(user_ids), len(project_ids)), dtype=bool)
+    if len(entries) > 0:
+        (rows, cols, values) = zip(*entries)
+        votes[rows, cols] = values
+        mask[rows, cols] = True
+    return (user_ids, project_ids, votes, mask)
+
 # Part 2. Specific definitions
 # Prior Voting Bonus
 
@@ -103,6 +499,28 @@ def prior_voting_score(user_id: UserUUID, oracle_state: OracleState) -> VotingPo
     return bonus
 
 
+def batch_prior_voting_score(user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    """
+    Vectorized Prior Voting Score as an (users, 1) column, or as a
+    (K, users, 1) array if the bonus map holds arrays of K values.
+    """
+    prior_voting_values = oracle_state.prior_voting_bonus_values
+    if isinstance(prior_voting_values, UserAttributes):
+        # Read the past rounds bitmasks straight from the user registry.
+        # Rounds are added in increasing order, as on `prior_voting_score`.
+        registry = prior_voting_values.registry
+        masks = registry.past_rounds[registry.positions(user_ids)]
+        values = np.ones(len(user_ids))
+        for (bit, r) in sorted(enumerate(registry.rounds), key=lambda x: x[1]):
+            is_set = ((masks >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+            bonus = np.asarray(oracle_state.prior_voting_bonus_map.get(r, 0.0), dtype=float)[..., None]
+            values = np.where(is_set, values + bonus, values)
+    else:
+        values = np.fromiter((prior_voting_score(u, oracle_state) for u in user_ids),
+                             dtype=float, count=len(user_ids))
+    return values[..., None]
+
+
 # Reputation Bonus
 
 def reputation_score(user_id: UserUUID, oracle_state: OracleState) -> VotingPower:
@@ -111,31 +529,116 @@ def reputation_score(user_id: UserUUID, oracle_state: OracleState) -> VotingPowe
     """
     return oracle_state.reputation_bonus_map.get(oracle_state.reputation_bonus_values[user_id], 0.0)
 
+
+def batch_reputation_score(user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    """
+    Vectorized Reputation Score as an (users, 1) column, or as a
+    (K, users, 1) array if the bonus map holds arrays of K values.
+    """
+    reputation_values = oracle_state.reputation_bonus_values
+    if isinstance(reputation_values, UserAttributes):
+        registry = reputation_values.registry
+        bonus_by_tier = np.stack(np.broadcast_arrays(*[np.asarray(oracle_state.reputation_bonus_map.get(tier, 0.0),
+                                                                   dtype=float)
+                                                        for tier in REPUTATION_CATEGORIES]), axis=-1)
+        values = bonus_by_tier[..., registry.reputations[registry.positions(user_ids)]]
+    else:
+        values = np.fromiter((reputation_score(u, oracle_state) for u in user_ids),
+                             dtype=float, count=len(user_ids))
+    return values[..., None]
+
 # Trust Bonus
 
 
+def normalized_trust_index(pagerank_values: dict[UserUUID, float]) -> dict[UserUUID, float]:
+    """
+    Scales the Page Rank results through MinMax so that the Trust Score
+    of any user can be looked up in O(1).
+
+    Users are left out of the index (and therefore score 0.0) when there
+    are fewer than 2 ranked users.
+    """
+    if len(pagerank_values) < 2:
+        return {}
+    max_value = max(pagerank_values.values())
+    min_value = min(pagerank_values.values())
+    if max_value == min_value:
+        # XXX: assumption for edge cases
+        return {u: 0.5 for u in pagerank_values}
+    else:
+        scale = max_value - min_value
+        return {u: (value - min_value) / scale
+                for u, value in pagerank_values.items()}
+
+
+def trust_index_of(oracle_state: OracleState) -> Mapping[UserUUID, float]:
+    """
+    The Trust Index of `oracle_state`, which is computed from its Page Rank
+    results if missing, eg. on states pickled before it was introduced.
+    """
+    if oracle_state.trust_index is None:
+        oracle_state.trust_index = normalized_trust_index(oracle_state.pagerank_results)
+    return oracle_state.trust_index
+
+
 def trust_score(user_id: UserUUID, oracle_state: OracleState) -> VotingPower:
     """
     Computes the Trust Score as based on the Canonical Page Rank.
 
     This is done by computing the Page Rank on the whole Trust Graph
     with default arguments and scaling the results through MinMax.
+    The scaled values are precomputed on `OracleState.trust_index`.
 
     The resulting scores will be contained between 0.0 and 1.0
     """
-    pagerank_values = oracle_state.pagerank_results
-    if (len(pagerank_values)) < 2 or (user_id not in pagerank_values.keys()):
-        trust_score = 0.0
+    return trust_index_of(oracle_state).get(user_id, 0.0)
+
+
+def batch_trust_score(user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    """
+    Vectorized Trust Score as an (users, 1) column.
+    """
+    trust_index = trust_index_of(oracle_state)
+    if isinstance(trust_index, UserValues):
+        values = trust_index.values[trust_index.registry.positions(user_ids)]
     else:
-        value = pagerank_values[user_id]
-        max_value = max(pagerank_values.values())
-        min_value = min(pagerank_values.values())
-        if max_value == min_value:
-            # XXX: assumption for edge cases
-            trust_score = 0.5
-        else:
-            trust_score = (value - min_value) / (max_value - min_value)
-    return trust_score
+        values = np.fromiter((trust_index.get(u, 0.0) for u in user_ids),
+                             dtype=float, count=len(user_ids))
+    return values[:, None]
+
+
+# Oracle stamps, which change whenever the per-user inputs of the oracles do
+
+def reputation_stamps(user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    reputation_values = oracle_state.reputation_bonus_values
+    if isinstance(reputation_values, UserAttributes):
+        registry = reputation_values.registry
+        return registry.reputations[registry.positions(user_ids)].astype(np.int64)
+    return np.fromiter((hash(reputation_values[u]) for u in user_ids), dtype=np.int64, count=len(user_ids))
+
+
+def prior_voting_stamps(user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    prior_voting_values = oracle_state.prior_voting_bonus_values
+    if isinstance(prior_voting_values, UserAttributes):
+        registry = prior_voting_values.registry
+        return registry.past_rounds[registry.positions(user_ids)].view(np.int64)
+    return np.fromiter((hash(tuple(prior_voting_values[u])) for u in user_ids),
+                       dtype=np.int64, count=len(user_ids))
+
+
+# The Trust Score only depends on the Trust Index, which is shared
+register_oracle('trust_score', OracleDefinition(trust_score,
+                                                batch_trust_score,
+                                                lambda u, _: np.zeros(len(u), dtype=np.int64),
+                                                lambda state: (trust_index_of(state),)))
+register_oracle('reputation_score', OracleDefinition(reputation_score,
+                                                     batch_reputation_score,
+                                                     reputation_stamps,
+                                                     lambda state: (state.reputation_bonus_map,)))
+register_oracle('prior_voting_score', OracleDefinition(prior_voting_score,
+                                                       batch_prior_voting_score,
+                                                       prior_voting_stamps,
+                                                       lambda state: (state.prior_voting_bonus_map,)))
 
 
 # Layering it together
@@ -148,16 +651,34 @@ def LAYER_2_AGGREGATOR(lst): return reduce((lambda x, y: x * y), lst)
 
 
 LAYER_1_NEURONS = {
-    'trust_score': (lambda u, _1, _2, state: trust_score(u, state),
+    'trust_score': (lambda u, _1, _2, state: oracle_value('trust_score', u, state),
                     lambda x: x),
-    'reputation_score': (lambda u, _1, _2, state: reputation_score(u, state),
+    'reputation_score': (lambda u, _1, _2, state: oracle_value('reputation_score', u, state),
                          lambda x: x)
 }
 
 LAYER_2_NEURONS = {
-    'past_round': (lambda u, _2, _3, state: prior_voting_score(u, state),
+    'past_round': (lambda u, _2, _3, state: oracle_value('prior_voting_score', u, state),
                    lambda x: x),
 }
 
 DEFAULT_NG_LAYERS: list[NeuronLayer] = [(LAYER_1_NEURONS, LAYER_1_AGGREGATOR),
                                         (LAYER_2_NEURONS, LAYER_2_AGGREGATOR)]
+
+# Vectorized counterpart of `DEFAULT_NG_LAYERS`.
+# The aggregators are shared as they work unchanged on arrays.
+
+LAYER_1_BATCH_NEURONS = {
+    'trust_score': (lambda u, _1, _2, state: batch_oracle_values('trust_score', u, state),
+                    lambda x: x),
+    'reputation_score': (lambda u, _1, _2, state: batch_oracle_values('reputation_score', u, state),
+                         lambda x: x)
+}
+
+LAYER_2_BATCH_NEURONS = {
+    'past_round': (lambda u, _2, _3, state: batch_oracle_values('prior_voting_score', u, state),
+                   lambda x: x),
+}
+
+DEFAULT_NG_BATCH_LAYERS: list[BatchNeuronLayer] = [(LAYER_1_BATCH_NEURONS, LAYER_1_AGGREGATOR),
+                                                   (LAYER_2_BATCH_NEURONS, LAYER_2_AGGREGATOR)]
@@ -0,0 +1,172 @@
+from nqg_model.types import *
+import numpy as np
+
+# Oracle value of every user, as an (users,) or (users, 1) array
+BatchUserOracle = Callable[[Sequence[UserUUID], OracleState], ndarray]
+# Per-user version of the oracle inputs, eg. the encoded attributes it reads
+StampFunction = Callable[[Sequence[UserUUID], OracleState], ndarray]
+# Inputs shared by every user, eg. the bonus maps
+InputsFunction = Callable[[OracleState], tuple]
+
+
+@dataclass
+class OracleDefinition():
+    function: Callable[[UserUUID, OracleState], float]
+    batch_function: BatchUserOracle
+    stamps: StampFunction
+    inputs: InputsFunction = lambda _: ()
+
+
+# Known oracles, by name
+ORACLES: dict[str, OracleDefinition] = {}
+
+
+def register_oracle(name: str, definition: OracleDefinition) -> None:
+    """
+    Make an oracle available to neurons through `oracle_value` and
+    `batch_oracle_values`. States get a provider for it on their next
+    `s_oracle_state`.
+    """
+    ORACLES[name] = definition
+
+
+class OracleProvider():
+    """
+    Lazily evaluated oracle, memoized per user.
+
+    Values are only computed for the users which are asked for, and kept
+    along with a stamp of their inputs. On every new `OracleState`, the
+    stamps of the memoized users are recomputed at once and only the
+    users whose stamp changed are evaluated again, when next asked for.
+    A change of the shared inputs (compared by identity) drops every
+    memoized value.
+
+    XXX: pickled (eg. on checkpoints) by name and without the memoized values.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.definition = ORACLES[name]
+        self.reset()
+
+    def reset(self) -> None:
+        self.users: list[UserUUID] = []
+        self.index: dict[UserUUID, int] = {}
+        self.values = np.zeros(16)
+        self.stamps = np.zeros(16, dtype=np.int64)
+        self.is_valid = np.zeros(16, dtype=bool)
+        # Valid values, for scalar lookups
+        self.cache: dict[UserUUID, float] = {}
+        self.state: Optional[OracleState] = None
+        self.inputs: Optional[tuple] = None
+        self.n_computed = 0
+
+    def __reduce__(self):
+        return (OracleProvider, (self.name,))
+
+    def __repr__(self) -> str:
+        return f"OracleProvider({self.name!r}, users={len(self.users)}, computed={self.n_computed})"
+
+    def _bind(self, oracle_state: OracleState) -> None:
+        inputs = self.definition.inputs(oracle_state)
+        if self.inputs is None or len(inputs) != len(self.inputs) or any(
+                a is not b for (a, b) in zip(inputs, self.inputs)):
+            self.reset()
+        elif len(self.users) > 0:
+            n = len(self.users)
+            try:
+                stamps = np.asarray(self.definition.stamps(self.users, oracle_state), dtype=np.int64)
+            except KeyError:
+                # Memoized users which are gone, eg. on a rewound state
+                stamps = None
+            if stamps is None:
+                self.reset()
+            else:
+                changed = np.flatnonzero(self.is_valid[:n] & (stamps != self.stamps[:n]))
+                self.is_valid[changed] = False
+                for row in changed.tolist():
+                    del self.cache[self.users[row]]
+        self.inputs = inputs
+        self.state = oracle_state
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self.values)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for column in ('values', 'stamps', 'is_valid'):
+            values = getattr(self, column)
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, column, grown)
+
+    def __call__(self, user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+        """
+        Oracle value of every user, as an (users,) array.
+        """
+        if oracle_state is not self.state:
+            self._bind(oracle_state)
+        index = self.index
+        rows = np.fromiter((index.get(u, -1) for u in user_ids), dtype=np.int64, count=len(user_ids))
+        if (rows < 0).any():
+            for i in np.flatnonzero(rows < 0).tolist():
+                row = index.get(user_ids[i])
+                if row is None:
+                    row = index[user_ids[i]] = len(self.users)
+                    self.users.append(user_ids[i])
+                rows[i] = row
+            self._grow(len(self.users))
+
+        invalid = np.flatnonzero(~self.is_valid[rows])
+        if len(invalid) > 0:
+            # Unique rows, as users may be repeated
+            (stale_rows, first) = np.unique(rows[invalid], return_index=True)
+            users = [user_ids[i] for i in invalid[first].tolist()]
+            values = np.reshape(self.definition.batch_function(users, oracle_state), len(users))
+            self.values[stale_rows] = values
+            self.stamps[stale_rows] = self.definition.stamps(users, oracle_state)
+            self.is_valid[stale_rows] = True
+            self.cache.update(zip(users, values.tolist()))
+            self.n_computed += len(users)
+        return self.values[rows]
+
+    def value(self, user_id: UserUUID, oracle_state: OracleState) -> float:
+        if oracle_state is not self.state:
+            self._bind(oracle_state)
+        value = self.cache.get(user_id)
+        if value is None:
+            value = float(self([user_id], oracle_state)[0])
+        return value
+
+
+def oracle_providers(providers: Optional[dict[str, OracleProvider]] = None) -> dict[str, OracleProvider]:
+    """
+    Providers for every registered oracle, reusing the given ones.
+    """
+    providers = dict(providers or {})
+    for name in ORACLES:
+        if name not in providers:
+            providers[name] = OracleProvider(name)
+    return providers
+
+
+def oracle_value(name: str, user_id: UserUUID, oracle_state: OracleState) -> float:
+    """
+    Value of a registered oracle for a user, through the provider on
+    `oracle_state` if there is one.
+    """
+    providers = oracle_state.oracles
+    if providers is not None and name in providers:
+        return providers[name].value(user_id, oracle_state)
+    return ORACLES[name].function(user_id, oracle_state)
+
+
+def batch_oracle_values(name: str, user_ids: Sequence[UserUUID], oracle_state: OracleState) -> ndarray:
+    """
+    Vectorized `oracle_value`, as an (users, 1) column.
+    """
+    providers = oracle_state.oracles
+    if providers is not None and name in providers:
+        return providers[name](user_ids, oracle_state)[:, None]
+    return ORACLES[name].batch_function(user_ids, oracle_state)
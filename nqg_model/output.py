@@ -0,0 +1,252 @@
+from nqg_model.types import *
+from nqg_model.containers import entries_since
+from nqg_model.registry import user_registry, REPUTATION_CATEGORIES
+from nqg_model.recording import RecordingOptions
+from nqg_model.neural_quorum_governance import neural_governance_power
+from typing import Optional
+from pandas import DataFrame
+import numpy as np
+import os
+
+# Columns of every output table.
+# Rows are stamped with the timestep in which they are first written.
+OUTPUT_TABLES: dict[str, tuple[str, ...]] = {
+    'users': ('timestep', 'user', 'reputation', 'active_past_rounds', 'decision'),
+    'trust_edges': ('timestep', 'truster', 'trustee'),
+    'delegation_edges': ('timestep', 'delegator', 'delegatee', 'rank'),
+    'votes': ('timestep', 'user', 'project', 'vote', 'power'),
+    'project_totals': ('timestep', 'project', 'power'),
+}
+
+# Arrow types of the value columns, as a function of the `pyarrow` module.
+# The user & project id columns have their types inferred from the data.
+VALUE_TYPES: dict[str, Callable] = {
+    'timestep': lambda pa: pa.int64(),
+    'reputation': lambda pa: pa.string(),
+    'active_past_rounds': lambda pa: pa.list_(pa.int64()),
+    'decision': lambda pa: pa.string(),
+    'rank': lambda pa: pa.int64(),
+    'vote': lambda pa: pa.float64(),
+    'power': lambda pa: pa.float64(),
+}
+
+# cadCAD indexes that identify a run
+PARTITION_KEYS = ('subset', 'run')
+
+
+class _PartitionWriter():
+    """
+    Buffers the rows of a single run and appends them as Parquet row
+    groups to one file per table.
+    """
+
+    def __init__(self, root: str, partition: tuple[str, ...], row_group_size: int):
+        self.root = root
+        self.partition = partition
+        self.row_group_size = row_group_size
+        self.buffers: dict[str, dict[str, list]] = {table: {c: [] for c in columns}
+                                                    for table, columns in OUTPUT_TABLES.items()}
+        self.writers: dict = {}
+        # Number of entries already written for the append-only variables
+        self.seen = {'users': 0, 'trustees': 0, 'delegatees': 0}
+
+    def append(self, table: str, rows: dict[str, list]) -> None:
+        buffer = self.buffers[table]
+        for column, values in rows.items():
+            buffer[column].extend(values)
+        if len(buffer['timestep']) >= self.row_group_size:
+            self.flush(table)
+
+    def flush(self, table: str) -> None:
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+
+        buffer = self.buffers[table]
+        if len(buffer['timestep']) == 0:
+            return
+        writer = self.writers.get(table)
+        if writer is None:
+            schema = pa.schema([(column, VALUE_TYPES[column](pa) if column in VALUE_TYPES
+                                 else pa.array(values).type)
+                                for column, values in buffer.items()])
+            path = os.path.join(self.root, table, *self.partition)
+            os.makedirs(path, exist_ok=True)
+            writer = self.writers[table] = pq.ParquetWriter(os.path.join(path, 'part-0.parquet'),
+                                                            schema)
+        writer.write_table(pa.Table.from_pydict(buffer, schema=writer.schema))
+        for values in buffer.values():
+            values.clear()
+
+    def close(self) -> None:
+        for table in self.buffers:
+            self.flush(table)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+class ColumnarWriter():
+    """
+    Streams the simulation state into flat Parquet tables while
+    the simulation runs.
+
+    Only what is new since the previous write is stored for the
+    append-only variables (users, trust and delegation edges), while
+    votes and project totals are stored for every written timestep.
+    Each run is stored on its own `subset=<s>/run=<r>` partition
+    below `<root>/<table>/`.
+
+    Requires `pyarrow`.
+    """
+
+    def __init__(self,
+                 root: str,
+                 row_group_size: int = 100_000,
+                 partition: Optional[dict[str, int]] = None):
+        """
+        Args:
+            root (str): Output directory.
+            row_group_size (int): Rows buffered per table before being appended to disk.
+            partition (dict, optional): Overrides the `subset` and `run`
+                indexes found on the state, eg. for runs executed in isolation.
+        """
+        self.root = root
+        self.row_group_size = row_group_size
+        self.partition = partition
+        self.partitions: dict[tuple, _PartitionWriter] = {}
+
+    def _partition_writer(self, state: NQGModelState) -> _PartitionWriter:
+        partition = self.partition or {k: state.get(k, 0) for k in PARTITION_KEYS}  # type: ignore
+        key = tuple(partition[k] for k in PARTITION_KEYS)
+        writer = self.partitions.get(key)
+        if writer is None:
+            directories = tuple(f"{k}={v}" for k, v in zip(PARTITION_KEYS, key))
+            writer = self.partitions[key] = _PartitionWriter(self.root, directories, self.row_group_size)
+        return writer
+
+    def write(self, state: NQGModelState, params: NQGModelParams) -> None:
+        """
+        Append the current state to the output tables. `params` are the
+        ones of the run, under which the Voting Power of abstentions is
+        computed.
+        """
+        writer = self._partition_writer(state)
+        timestep = state.get('timestep', 0)  # type: ignore
+
+        new_users = user_registry(state['users'])[writer.seen['users']:]
+        writer.seen['users'] += len(new_users)
+        labels = new_users.labels.tolist()
+        decisions = state['user_round_decisions']
+        writer.append('users', {
+            'timestep': [timestep] * len(labels),
+            'user': labels,
+            'reputation': [REPUTATION_CATEGORIES[r].name for r in new_users.reputations.tolist()],
+            'active_past_rounds': [new_users.decode_rounds(m) for m in new_users.past_rounds.tolist()],
+            'decision': [decisions[u].name if u in decisions else None
+                         for u in labels]})
+
+        rows: dict[str, list] = {'timestep': [], 'truster': [], 'trustee': []}
+        for (truster, trusted) in entries_since(state['trustees'], writer.seen['trustees']):
+            writer.seen['trustees'] += 1
+            rows['truster'].extend([truster] * len(trusted))
+            rows['trustee'].extend(trusted)
+        rows['timestep'] = [timestep] * len(rows['truster'])
+        writer.append('trust_edges', rows)
+
+        rows = {'timestep': [], 'delegator': [], 'delegatee': [], 'rank': []}
+        for (delegator, quorum) in entries_since(state['delegatees'], writer.seen['delegatees']):
+            writer.seen['delegatees'] += 1
+            rows['delegator'].extend([delegator] * len(quorum))
+            rows['delegatee'].extend(quorum)
+            rows['rank'].extend(range(len(quorum)))
+        rows['timestep'] = [timestep] * len(rows['delegator'])
+        writer.append('delegation_edges', rows)
+
+        # Votes as counted, with the Voting Power recovered from the
+        # vote × power products. Abstentions (a zero vote) have theirs computed.
+        effective_action_matrix = state['effective_action_matrix']
+        rows = {'timestep': [], 'user': [], 'project': [], 'vote': [], 'power': []}
+        abstentions: dict[UserUUID, list[int]] = {}
+        for (user, vote_powers) in state['vote_matrix'].items():
+            votes = effective_action_matrix[user]
+            for (project, vote_power) in vote_powers.items():
+                vote = float(votes[project])
+                if vote == 0.0:
+                    abstentions.setdefault(user, []).append(len(rows['power']))
+                rows['user'].append(user)
+                rows['project'].append(project)
+                rows['vote'].append(vote)
+                rows['power'].append(vote_power / vote if vote != 0.0 else np.nan)
+        if len(abstentions) > 0:
+            projects = list(params['projects'])
+            column = {p: j for (j, p) in enumerate(projects)}
+            power = neural_governance_power(list(abstentions), projects, params, state['oracle_state'])
+            for (user_power, positions) in zip(power.tolist(), abstentions.values()):
+                for i in positions:
+                    rows['power'][i] = user_power[column[rows['project'][i]]]
+        rows['timestep'] = [timestep] * len(rows['user'])
+        writer.append('votes', rows)
+
+        totals = state['per_project_voting']
+        writer.append('project_totals', {'timestep': [timestep] * len(totals),
+                                         'project': list(totals.keys()),
+                                         'power': list(totals.values())})
+
+    def close(self, state: Optional[NQGModelState] = None) -> None:
+        """
+        Flush the buffered rows and close every file, or only the
+        ones of the run which `state` belongs to.
+        """
+        if state is None:
+            writers = list(self.partitions.values())
+        else:
+            writers = [self._partition_writer(state)]
+        for writer in writers:
+            writer.close()
+
+
+def output_block(writer: ColumnarWriter,
+                 N_timesteps: int,
+                 recording: Optional[RecordingOptions] = None) -> dict:
+    """
+    Partial State Update Block which appends the state at the end of
+    every timestep to `writer`. It should go last on the model blocks.
+
+    With `recording`, only its timesteps are written. The append-only
+    tables still hold every row, stamped with the next written timestep.
+
+    The run files are closed on the last timestep, as cadCAD may execute
+    runs on separate processes holding their own copy of `writer`.
+    """
+    def p_write_output(params: NQGModelParams, _2, _3, state: NQGModelState) -> dict:
+        if recording is None or recording.records_timestep(state.get('timestep', 0)):  # type: ignore
+            writer.write(state, params)
+        if state.get('timestep', 0) >= N_timesteps:  # type: ignore
+            writer.close(state)
+        return {}
+
+    return {
+        'label': 'Write output',
+        'policies': {
+            'write_output': p_write_output
+        },
+        'variables': {}
+    }
+
+
+def read_output(root: str,
+                table: str,
+                columns: Optional[list[str]] = None,
+                filter=None) -> DataFrame:
+    """
+    Load an output table, with `subset` and `run` as partition columns.
+
+    Args:
+        root (str): Output directory of a `ColumnarWriter`.
+        table (str): One of `OUTPUT_TABLES`.
+        columns (list, optional): Only load these columns.
+        filter (optional): `pyarrow.dataset` expression for filtering rows.
+    """
+    import pyarrow.dataset as ds  # type: ignore
+    dataset = ds.dataset(os.path.join(root, table), format='parquet', partitioning='hive')
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
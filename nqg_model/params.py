@@ -1,5 +1,5 @@
 from nqg_model.types import *
-from nqg_model.neural_quorum_governance import DEFAULT_NG_LAYERS
+from nqg_model.neural_quorum_governance import DEFAULT_NG_LAYERS, DEFAULT_NG_BATCH_LAYERS
 from numpy import nan
 
 TIMESTEPS = 100
@@ -36,10 +36,12 @@ INITIAL_STATE = NQGModelState(
     days_passed=0.0,
     delta_days=nan,
     users=[],
+    onboarded_users=[],
     user_round_decisions={},
     delegatees={},
     trustees={},
     action_matrix={},
+    effective_action_matrix={},
     vote_matrix={},
     per_project_voting={},
     oracle_state=INITIAL_ORACLE_STATE
@@ -55,7 +57,10 @@ SINGLE_RUN_PARAMS = NQGModelParams(
     max_quorum_candidate_delegates=10,
     quorum_delegation_absolute_threshold=1/2,
     quorum_delegation_relative_threshold=2/3,
+    quorum_delegation_transitive=False,
+    quorum_delegation_cycle_policy=DelegationCyclePolicy.Drop,
     neuron_layers=DEFAULT_NG_LAYERS,
+    batch_neuron_layers=DEFAULT_NG_BATCH_LAYERS,
     initial_power=0.0,
     past_rounds=PAST_ROUNDS,
     projects=DEFAULT_PROJECTS,
@@ -67,6 +72,8 @@ SINGLE_RUN_PARAMS = NQGModelParams(
     new_user_project_vote_yes_probability=0.8,
     new_user_average_delegate_count=6.5,
     new_user_min_delegate_count=5,
-    new_user_average_trustees=7.0
+    new_user_average_trustees=7.0,
+    behaviour_sampling=BehaviourSampling.Batched,
+    seed=0
 
 )
\ No newline at end of file
@@ -0,0 +1,152 @@
+from nqg_model.types import *
+from pandas import DataFrame
+from functools import wraps
+from time import perf_counter
+import tracemalloc
+import json
+
+
+class BlockProfiler():
+    """
+    Records the wall time and the memory allocated by every policy and SUF
+    call of instrumented blocks (see `instrument_blocks`).
+
+    Memory is tracked through `tracemalloc`, which is started on the first
+    instrumented call when `memory` is set. Both the net allocation
+    (retained after the call) and the peak during the call are recorded.
+    Tracing slows down every allocation, so time and memory are better
+    profiled on separate runs. `close` (or leaving the profiler as a
+    context manager) stops the tracing if the profiler started it.
+
+    XXX: cadCAD executes multiple runs on separate processes, in which case
+    the calls are recorded on copies of the profiler. Use it on single runs,
+    or on the native runner.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.events: list[dict] = []
+        self._t0 = perf_counter()
+        self._started_tracing = False
+
+    def __enter__(self) -> 'BlockProfiler':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop `tracemalloc` if it was started by this profiler.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def wrap(self, f: Callable, block: str, kind: str) -> Callable:
+        """
+        Wrap a policy or SUF. The wrapper keeps an explicit signature with
+        the same number of arguments, as cadCAD dispatches on it.
+        """
+        function = getattr(f, '__name__', repr(f))
+
+        def record(substep, state, call):
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                tracemalloc.reset_peak()
+                (before, _) = tracemalloc.get_traced_memory()
+            start = perf_counter()
+            result = call()
+            seconds = perf_counter() - start
+            (allocated, peak) = (0, 0)
+            if self.memory:
+                (after, peak_after) = tracemalloc.get_traced_memory()
+                (allocated, peak) = (after - before, peak_after - before)
+            # Policies of the first block still see the previous timestep index
+            timestep = state.get('timestep', 0) + (1 if substep == 1 else 0)
+            self.events.append({'subset': state.get('subset', 0),
+                                'run': state.get('run', 0),
+                                'timestep': timestep,
+                                'substep': substep,
+                                'block': block,
+                                'function': function,
+                                'kind': kind,
+                                'start': start - self._t0,
+                                'seconds': seconds,
+                                'allocated_bytes': allocated,
+                                'peak_bytes': peak})
+            return result
+
+        if kind == 'policy':
+            @wraps(f)
+            def policy(params, substep, history, state):
+                return record(substep, state, lambda: f(params, substep, history, state))
+            return policy
+        elif f.__code__.co_argcount == 6:
+            @wraps(f)
+            def suf_with_objs(params, substep, history, state, signal, additional_objs):
+                return record(substep, state,
+                              lambda: f(params, substep, history, state, signal, additional_objs))
+            return suf_with_objs
+        else:
+            @wraps(f)
+            def suf(params, substep, history, state, signal):
+                return record(substep, state, lambda: f(params, substep, history, state, signal))
+            return suf
+
+    def to_dataframe(self) -> DataFrame:
+        """
+        One row per recorded call.
+        """
+        return DataFrame(self.events, columns=['subset', 'run', 'timestep', 'substep',
+                                               'block', 'function', 'kind', 'start',
+                                               'seconds', 'allocated_bytes', 'peak_bytes'])
+
+    def summary(self) -> DataFrame:
+        """
+        Wall time, call count and memory per block per timestep.
+        """
+        return (self.to_dataframe()
+                .groupby(['subset', 'run', 'timestep', 'substep', 'block'], sort=True)
+                .agg(calls=('seconds', 'size'),
+                     seconds=('seconds', 'sum'),
+                     allocated_bytes=('allocated_bytes', 'sum'),
+                     peak_bytes=('peak_bytes', 'max'))
+                .reset_index())
+
+    def save_trace(self, path: str) -> None:
+        """
+        Save the calls as a JSON trace on the Trace Event Format, which
+        can be opened on `chrome://tracing` or Perfetto.
+        """
+        events = [{'name': e['function'],
+                   'cat': e['block'],
+                   'ph': 'X',
+                   'ts': e['start'] * 1e6,
+                   'dur': e['seconds'] * 1e6,
+                   'pid': e['subset'],
+                   'tid': e['run'],
+                   'args': {k: e[k] for k in ('timestep', 'substep', 'kind',
+                                              'allocated_bytes', 'peak_bytes')}}
+                  for e in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def instrument_blocks(blocks: list[dict], profiler: BlockProfiler) -> list[dict]:
+    """
+    Copy of the Partial State Update Blocks with every policy and SUF
+    wrapped by `profiler`. The original blocks are left untouched, so
+    there is no overhead unless the instrumented copy is used.
+    """
+    instrumented = []
+    for i, block in enumerate(blocks):
+        label = block.get('label', f'block_{i}')
+        instrumented.append({**block,
+                             'policies': {k: profiler.wrap(f, label, 'policy')
+                                          for k, f in block.get('policies', {}).items()},
+                             'variables': {k: profiler.wrap(f, label, 'suf')
+                                           for k, f in block.get('variables', {}).items()}})
+    return instrumented
@@ -0,0 +1,88 @@
+from nqg_model.types import *
+from typing import Collection
+import inspect
+
+# cadCAD indexes attached to every state, in the order cadCAD adds them
+STATE_INDEXES = ('simulation', 'subset', 'run', 'substep', 'timestep')
+
+
+@dataclass(frozen=True)
+class RecordingOptions():
+    """
+    Which states of a run are recorded, and which of their variables.
+
+    Args:
+        variables (Collection[str], optional): Only record these state
+            variables, on top of the cadCAD indexes. Defaults to all of them.
+        final_substeps (bool): Only record the last substep of each timestep.
+        every (int): Only record every `every`-th timestep, starting with
+            the initial state.
+        timesteps (Collection[int], optional): Only record these timesteps
+            instead, eg. `{0, 30, 365}`. Overrides `every`.
+    """
+    variables: Optional[Collection[str]] = None
+    final_substeps: bool = True
+    every: int = 1
+    timesteps: Optional[Collection[int]] = None
+
+    def __post_init__(self):
+        if self.every < 1:
+            raise ValueError(f"`every` must be a positive number of timesteps, got {self.every}")
+
+    def records_timestep(self, timestep: int) -> bool:
+        if self.timesteps is not None:
+            return timestep in self.timesteps
+        return timestep % self.every == 0
+
+    def record(self, state: dict) -> Optional[dict]:
+        """
+        The state as recorded, or None if it isn't. Substeps are expected
+        to be dropped beforehand as per `final_substeps`.
+        """
+        if not self.records_timestep(state['timestep']):
+            return None
+        if self.variables is None:
+            return state
+        recorded = set(self.variables) | set(STATE_INDEXES)
+        return {k: v for k, v in state.items() if k in recorded}
+
+
+def select_states(df, options: RecordingOptions):
+    """
+    Apply the recording options to a full `easy_run` DataFrame.
+    """
+    # Without a `substep` column, substeps were already dropped by the runner
+    if options.final_substeps and 'substep' in df.columns:
+        run_keys = [k for k in ('simulation', 'subset', 'run', 'timestep') if k in df.columns]
+        last_substep = df.groupby(run_keys, sort=False).substep.transform('max')
+        df = df[df.substep == last_substep]
+    if options.timesteps is not None:
+        df = df[df.timestep.isin(list(options.timesteps))]
+    elif options.every > 1:
+        df = df[df.timestep % options.every == 0]
+    if options.variables is not None:
+        recorded = set(options.variables) | set(STATE_INDEXES)
+        df = df[[c for c in df.columns if c in recorded]]
+    return df
+
+
+def recorded_runner(runner: Callable, options: RecordingOptions) -> Callable:
+    """
+    Wrap a runner with the `easy_run` signature so that it only records
+    as per `options`.
+
+    Runners taking a `recording` argument (eg. `native_run`) apply it
+    while running, so that unrecorded states are never held. Otherwise,
+    eg. on `easy_run`, the whole output is filtered through `select_states`
+    once the runner returns.
+    """
+    parameters = inspect.signature(runner).parameters
+    if 'recording' in parameters:
+        def run(*args, **kwargs):
+            return runner(*args, recording=options, **kwargs)
+    else:
+        def run(*args, **kwargs):
+            if not options.final_substeps and 'drop_substeps' in parameters:
+                kwargs.setdefault('drop_substeps', False)
+            return select_states(runner(*args, **kwargs), options)
+    return run
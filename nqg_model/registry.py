@@ -0,0 +1,405 @@
+from nqg_model.types import *
+from typing import Iterable, Iterator, overload
+import numpy as np
+
+# Reputation tiers are stored as their position on this list
+REPUTATION_CATEGORIES: list[ReputationCategory] = list(ReputationCategory)
+
+# Past rounds participation is stored as a bitmask over the known rounds
+MAX_PAST_ROUNDS = 64
+
+
+class _UserColumns():
+    """
+    Growable column store which is shared by the `UserRegistry` snapshots.
+    Only the first `size` rows are in use.
+    """
+    __slots__ = ('labels', 'reputations', 'past_rounds', 'added_at',
+                 'rounds', 'round_bits', 'size', 'index')
+
+    def __init__(self, rounds: Iterable[PastRoundIndex] = (), capacity: int = 16):
+        self.labels = np.empty(capacity, dtype=np.int64)
+        self.reputations = np.empty(capacity, dtype=np.int8)
+        self.past_rounds = np.empty(capacity, dtype=np.uint64)
+        self.added_at = np.empty(capacity, dtype=np.int32)
+        self.rounds: list[PastRoundIndex] = []
+        self.round_bits: dict[PastRoundIndex, int] = {}
+        self.size = 0
+        # Label -> row, built on first use if labels are not a contiguous range
+        self.index: Optional[dict[UserUUID, int]] = None
+        for r in sorted(rounds):
+            self.round_bit(r)
+
+    def round_bit(self, past_round: PastRoundIndex) -> int:
+        bit = self.round_bits.get(past_round)
+        if bit is None:
+            if len(self.rounds) == MAX_PAST_ROUNDS:
+                raise ValueError(f"At most {MAX_PAST_ROUNDS} distinct past rounds are supported")
+            bit = self.round_bits[past_round] = len(self.rounds)
+            self.rounds.append(past_round)
+        return bit
+
+    def reserve(self, n: int) -> None:
+        capacity = len(self.labels)
+        if self.size + n <= capacity:
+            return
+        while capacity < self.size + n:
+            capacity *= 2
+        for column in ('labels', 'reputations', 'past_rounds', 'added_at'):
+            values = getattr(self, column)
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            setattr(self, column, grown)
+
+    def copy(self, start: int, stop: int) -> '_UserColumns':
+        """
+        Private copy of the rows in [start, stop).
+        """
+        columns = _UserColumns(capacity=max(2 * (stop - start), 16))
+        columns.rounds = list(self.rounds)
+        columns.round_bits = dict(self.round_bits)
+        columns.extend(self.labels[start:stop], self.reputations[start:stop],
+                       self.past_rounds[start:stop], self.added_at[start:stop])
+        return columns
+
+    def extend(self, labels, reputations, past_rounds, added_at) -> None:
+        n = len(labels)
+        self.reserve(n)
+        rows = slice(self.size, self.size + n)
+        self.labels[rows] = labels
+        self.reputations[rows] = reputations
+        self.past_rounds[rows] = past_rounds
+        self.added_at[rows] = added_at
+        if self.index is None:
+            # Labels are kept as a contiguous range for as long as possible
+            expected = self.labels[0] + np.arange(self.size, self.size + n)
+            if not (self.labels[rows] == expected).all():
+                self.index = {label: i for i, label
+                              in enumerate(self.labels[:self.size + n].tolist())}
+        else:
+            self.index.update((label, self.size + i)
+                              for i, label in enumerate(self.labels[rows].tolist()))
+        self.size += n
+
+    def row(self, label: UserUUID) -> int:
+        if self.index is not None:
+            return self.index[label]
+        if self.size > 0 and isinstance(label, (int, np.integer)):
+            row = int(label) - int(self.labels[0])
+            if 0 <= row < self.size:
+                return row
+        raise KeyError(label)
+
+
+class UserRegistry(Sequence[User]):
+    """
+    Columnar, append-only registry of the users.
+
+    Label ids, reputation tiers (as their position on `REPUTATION_CATEGORIES`),
+    past rounds participation (as a bitmask over `rounds`) and the timestep
+    in which each user was onboarded are kept on contiguous arrays.
+
+    Like `nqg_model.containers.AppendOnlyList`, every snapshot is a view over
+    a store shared with the snapshots it was derived from. Appending to the
+    newest snapshot is amortized O(1) per user, while appending to an older
+    one forks a private copy.
+
+    Indexing and iterating yields `User` objects, which are built on demand.
+
+    XXX: labels must be integers.
+    """
+    __slots__ = ('_columns', '_start', '_stop')
+
+    def __init__(self,
+                 users: Iterable[User] = (),
+                 rounds: Iterable[PastRoundIndex] = (),
+                 timestep: int = 0):
+        self._columns = _UserColumns(rounds)
+        self._start = 0
+        self._stop = 0
+        self._extend(list(users), timestep)
+
+    @classmethod
+    def from_columns(cls,
+                     labels: ndarray,
+                     reputations: ndarray,
+                     past_rounds: ndarray,
+                     rounds: Sequence[PastRoundIndex],
+                     timestep: int = 0) -> 'UserRegistry':
+        """
+        Build a registry from already encoded columns, where bit `i` of
+        the `past_rounds` bitmasks stands for `rounds[i]`.
+        """
+        registry = cls(rounds=())
+        columns = registry._columns
+        for r in rounds:
+            columns.round_bit(r)
+        columns.extend(labels, reputations, past_rounds, timestep)
+        registry._stop = columns.size
+        return registry
+
+    @classmethod
+    def _view(cls, columns: _UserColumns, start: int, stop: int) -> 'UserRegistry':
+        view = cls.__new__(cls)
+        view._columns, view._start, view._stop = columns, start, stop
+        return view
+
+    def _extend(self, users: list[User], timestep: int) -> None:
+        columns = self._columns
+        past_rounds = []
+        for user in users:
+            mask = 0
+            for r in user.active_past_rounds:
+                mask |= 1 << columns.round_bit(r)
+            past_rounds.append(mask)
+        columns.extend([u.label for u in users],
+                       [REPUTATION_CATEGORIES.index(u.reputation) for u in users],
+                       np.array(past_rounds, dtype=np.uint64),
+                       timestep)
+        self._stop = columns.size
+
+    def _column(self, values: ndarray) -> ndarray:
+        view = values[self._start:self._stop]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def labels(self) -> ndarray:
+        return self._column(self._columns.labels)
+
+    @property
+    def reputations(self) -> ndarray:
+        return self._column(self._columns.reputations)
+
+    @property
+    def past_rounds(self) -> ndarray:
+        return self._column(self._columns.past_rounds)
+
+    @property
+    def added_at(self) -> ndarray:
+        return self._column(self._columns.added_at)
+
+    @property
+    def rounds(self) -> tuple[PastRoundIndex, ...]:
+        """
+        Past rounds which the bits of `past_rounds` stand for.
+        """
+        return tuple(self._columns.rounds)
+
+    def decode_rounds(self, mask: int) -> list[PastRoundIndex]:
+        """
+        Past rounds set on a `past_rounds` bitmask, in increasing order.
+        """
+        return sorted(r for bit, r in enumerate(self._columns.rounds)
+                      if (mask >> bit) & 1)
+
+    def _user(self, row: int) -> User:
+        columns = self._columns
+        return User(label=int(columns.labels[row]),
+                    reputation=REPUTATION_CATEGORIES[columns.reputations[row]],
+                    active_past_rounds=set(self.decode_rounds(int(columns.past_rounds[row]))))
+
+    @overload
+    def __getitem__(self, index: int) -> User: ...
+    @overload
+    def __getitem__(self, index: slice) -> 'UserRegistry': ...
+
+    def __getitem__(self, index):
+        n = len(self)
+        if isinstance(index, slice):
+            (start, stop, step) = index.indices(n)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return UserRegistry._view(self._columns, self._start + start,
+                                      self._start + max(start, stop))
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('list index out of range')
+        return self._user(self._start + index)
+
+    def __iter__(self) -> Iterator[User]:
+        return (self._user(row) for row in range(self._start, self._stop))
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (UserRegistry, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)})"
+
+    def __reduce__(self):
+        # Only the rows of this view are pickled, without the spare capacity
+        return (_registry_from_rows, (self.labels.copy(), self.reputations.copy(),
+                                      self.past_rounds.copy(), self.added_at.copy(),
+                                      list(self._columns.rounds)))
+
+    def __contains__(self, user: object) -> bool:
+        if not isinstance(user, User):
+            return False
+        try:
+            return self[self.position(user.label)] == user
+        except KeyError:
+            return False
+
+    def position(self, label: UserUUID) -> int:
+        """
+        Position of a user on this registry.
+        """
+        row = self._columns.row(label)
+        if not self._start <= row < self._stop:
+            raise KeyError(label)
+        return row - self._start
+
+    def positions(self, labels: Sequence[UserUUID]) -> ndarray:
+        """
+        Vectorized `position`.
+        """
+        columns = self._columns
+        if columns.index is not None:
+            rows = np.fromiter((columns.index[u] for u in labels), dtype=np.int64, count=len(labels))
+        elif columns.size > 0:
+            rows = np.asarray(labels, dtype=np.int64) - columns.labels[0]
+        else:
+            rows = np.full(len(labels), -1, dtype=np.int64)
+        invalid = (rows < self._start) | (rows >= self._stop)
+        if invalid.any():
+            raise KeyError(labels[int(np.flatnonzero(invalid)[0])])
+        return rows - self._start
+
+    def added_since(self, timestep: int) -> 'UserRegistry':
+        """
+        View of the users onboarded on or after `timestep`.
+        """
+        offset = int(np.searchsorted(self.added_at, timestep, side='left'))
+        return UserRegistry._view(self._columns, self._start + offset, self._stop)
+
+    def appended(self,
+                 users: Union['UserRegistry', Iterable[User]],
+                 timestep: int = 0) -> 'UserRegistry':
+        """
+        Return a new snapshot with `users` added on top of this one.
+
+        Users given as a `UserRegistry` keep their onboarding timestep,
+        otherwise they are stamped with `timestep`.
+        """
+        if not isinstance(users, UserRegistry):
+            users = list(users)
+        if len(users) == 0:
+            return self
+        if self._start == 0 and self._stop == self._columns.size:
+            columns = self._columns
+        else:
+            columns = self._columns.copy(self._start, self._stop)
+        registry = UserRegistry._view(columns, 0, self._stop - self._start)
+
+        if isinstance(users, UserRegistry):
+            source_rounds = users.rounds
+            masks = users.past_rounds
+            if source_rounds != tuple(columns.rounds[:len(source_rounds)]):
+                remapped = np.zeros(len(users), dtype=np.uint64)
+                for bit, r in enumerate(source_rounds):
+                    is_set = (masks >> np.uint64(bit)) & np.uint64(1)
+                    remapped |= is_set << np.uint64(columns.round_bit(r))
+                masks = remapped
+            columns.extend(users.labels, users.reputations, masks, users.added_at)
+        else:
+            registry._extend(users, timestep)
+        registry._stop = columns.size
+        return registry
+
+    def reputation_values(self) -> 'UserAttributes':
+        """
+        Read-only mapping from label to `ReputationCategory`.
+        """
+        return UserAttributes(self, 'reputation')
+
+    def prior_voting_values(self) -> 'UserAttributes':
+        """
+        Read-only mapping from label to the list of active past rounds.
+        """
+        return UserAttributes(self, 'past_rounds')
+
+
+class UserAttributes(Mapping[UserUUID, object]):
+    """
+    Label-indexed view of a `UserRegistry` column, for use on the
+    `OracleState` without rebuilding a dict on every timestep.
+    """
+    __slots__ = ('registry', 'attribute')
+
+    def __init__(self, registry: UserRegistry, attribute: str):
+        self.registry = registry
+        self.attribute = attribute
+
+    def __getitem__(self, label: UserUUID):
+        registry = self.registry
+        row = registry._start + registry.position(label)
+        if self.attribute == 'reputation':
+            return REPUTATION_CATEGORIES[registry._columns.reputations[row]]
+        return registry.decode_rounds(int(registry._columns.past_rounds[row]))
+
+    def __iter__(self) -> Iterator[UserUUID]:
+        return iter(self.registry.labels.tolist())
+
+    def __len__(self) -> int:
+        return len(self.registry)
+
+    def __contains__(self, label: object) -> bool:
+        try:
+            self.registry.position(label)  # type: ignore
+            return True
+        except KeyError:
+            return False
+
+
+class UserValues(Mapping[UserUUID, float]):
+    """
+    Label-indexed view of an array of values aligned with the rows of a
+    `UserRegistry`, eg. for the `OracleState.trust_index` of a whole round.
+    """
+    __slots__ = ('registry', 'values')
+
+    def __init__(self, registry: UserRegistry, values: ndarray):
+        self.registry = registry
+        self.values = values
+
+    def __getitem__(self, label: UserUUID) -> float:
+        return float(self.values[self.registry.position(label)])
+
+    def __iter__(self) -> Iterator[UserUUID]:
+        return iter(self.registry.labels.tolist())
+
+    def __len__(self) -> int:
+        return len(self.registry)
+
+    def __contains__(self, label: object) -> bool:
+        try:
+            self.registry.position(label)  # type: ignore
+            return True
+        except KeyError:
+            return False
+
+
+def _registry_from_rows(labels: ndarray,
+                        reputations: ndarray,
+                        past_rounds: ndarray,
+                        added_at: ndarray,
+                        rounds: list[PastRoundIndex]) -> UserRegistry:
+    registry = UserRegistry.from_columns(labels, reputations, past_rounds, rounds)
+    registry._columns.added_at[:len(added_at)] = added_at
+    return registry
+
+
+def user_registry(users: Sequence[User],
+                  rounds: Iterable[PastRoundIndex] = ()) -> UserRegistry:
+    """
+    Wrap plain user lists (eg. from the initial state) as a `UserRegistry`.
+    """
+    if isinstance(users, UserRegistry):
+        return users
+    return UserRegistry(users, rounds)
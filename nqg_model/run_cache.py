@@ -0,0 +1,315 @@
+from nqg_model.types import *
+from nqg_model.runner import assign_param_columns
+from enum import Enum
+from functools import cache, partial
+from typing import Iterator
+from types import BuiltinFunctionType, CodeType, FunctionType, MethodType, ModuleType
+import dataclasses
+import hashlib
+import os
+import pickle
+import random
+import zlib
+import numpy as np
+
+# Header of run cache files, followed by the format version byte
+RUN_CACHE_MAGIC = b'NQGRUN'
+RUN_CACHE_VERSION = 1
+
+DEFAULT_RUN_CACHE_DIR = os.environ.get('NQG_RUN_CACHE', 'data/run_cache')
+DEFAULT_RUN_CACHE_BYTES = 2 * 1024 ** 3
+
+# Modules whose functions are followed into the globals they read, as
+# for code defined on scripts & notebooks. The model code is covered by
+# `source_digest` and the installed packages by their name.
+FOLLOWED_MODULES = ('__main__',)
+
+
+@cache
+def source_digest() -> bytes:
+    """
+    Digest of the `nqg_model` sources, so that any change of the model
+    logic invalidates the cached runs.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    root = os.path.dirname(os.path.abspath(__file__))
+    for (directory, subdirectories, files) in sorted(os.walk(root)):
+        subdirectories.sort()
+        for name in sorted(f for f in files if f.endswith('.py')):
+            path = os.path.join(directory, name)
+            h.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.digest()
+
+
+def _code_digest(code: CodeType, h) -> None:
+    h.update(code.co_code)
+    h.update(repr((code.co_names, code.co_varnames, code.co_freevars)).encode())
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            _code_digest(const, h)
+        else:
+            h.update(repr(const).encode())
+
+
+def _global_names(code: CodeType) -> set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _digest(obj: object, active: set[int]) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{type(obj).__module__}.{type(obj).__qualname__}".encode())
+    if id(obj) in active:
+        # Reference cycle
+        h.update(b'cycle')
+        return h.digest()
+
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, Enum):
+        h.update(obj.name.encode())
+    elif isinstance(obj, (type, ModuleType, BuiltinFunctionType)):
+        h.update(f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', obj.__name__)}".encode())
+    elif isinstance(obj, np.ndarray) and obj.dtype != object:
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        active.add(id(obj))
+        try:
+            for part in _parts(obj, active):
+                h.update(part if isinstance(part, bytes) else _digest(part, active))
+        finally:
+            active.discard(id(obj))
+    return h.digest()
+
+
+def _parts(obj: object, active: set[int]) -> Iterator:
+    """
+    What makes up an object, as bytes or as objects to be digested.
+    """
+    if isinstance(obj, FunctionType):
+        yield f"{obj.__module__}.{obj.__qualname__}".encode()
+        h = hashlib.blake2b(digest_size=16)
+        _code_digest(obj.__code__, h)
+        yield h.digest()
+        yield obj.__defaults__
+        yield obj.__kwdefaults__
+        for cell in obj.__closure__ or ():
+            try:
+                yield cell.cell_contents
+            except ValueError:
+                yield b'empty cell'
+        if obj.__module__ in FOLLOWED_MODULES:
+            for name in sorted(_global_names(obj.__code__)):
+                if name in obj.__globals__:
+                    yield name.encode()
+                    yield obj.__globals__[name]
+    elif isinstance(obj, MethodType):
+        yield obj.__func__
+        yield obj.__self__
+    elif isinstance(obj, partial):
+        yield from (obj.func, obj.args, obj.keywords)
+    elif isinstance(obj, np.ndarray):
+        yield repr(obj.shape).encode()
+        yield obj.tolist()
+    elif dataclasses.is_dataclass(obj):
+        for f in dataclasses.fields(obj):
+            # Fields excluded from comparisons are caches, eg. `OracleState.oracles`
+            if f.compare:
+                yield f.name.encode()
+                yield getattr(obj, f.name)
+    elif isinstance(obj, Mapping):
+        # Sorted, as the key order doesn't matter on equality
+        yield from sorted(_digest(k, active) + _digest(v, active) for (k, v) in obj.items())
+    elif isinstance(obj, (set, frozenset)):
+        yield from sorted(_digest(v, active) for v in obj)
+    elif isinstance(obj, (list, tuple, Sequence)):
+        yield from obj
+    elif hasattr(obj, '__dict__'):
+        yield vars(obj)
+    else:
+        # XXX: objects whose repr holds their address never match, which
+        # only makes them miss the cache
+        yield repr(obj).encode()
+
+
+def fingerprint(*objects: object) -> str:
+    """
+    Stable digest of objects built from the model's data types, numpy
+    arrays and functions, which are digested by their bytecode, constants
+    and closures. Equal objects give the same fingerprint across processes.
+    """
+    h = hashlib.blake2b(digest_size=32)
+    for obj in objects:
+        h.update(_digest(obj, set()))
+    return h.hexdigest()
+
+
+class RunCache():
+    """
+    Local on-disk cache of run results, keyed by the fingerprint of
+    everything a run depends on (see `RunCache.key`).
+
+    Entries are compressed pickles, one file per key. They are evicted on
+    least recently used order, through their modification time, once the
+    cache holds more than `max_bytes` or `max_entries`.
+    """
+
+    def __init__(self,
+                 directory: str = DEFAULT_RUN_CACHE_DIR,
+                 max_bytes: int = DEFAULT_RUN_CACHE_BYTES,
+                 max_entries: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"RunCache({self.directory!r}, hits={self.hits}, misses={self.misses})"
+
+    def key(self, *parts: object) -> str:
+        """
+        Key of a run, as the fingerprint of the model sources and `parts`,
+        eg. the initial state, the params, the blocks and the timesteps.
+        """
+        return fingerprint(RUN_CACHE_VERSION, source_digest(), *parts)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.run")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str) -> Optional[object]:
+        """
+        Stored value of `key`, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        header = len(RUN_CACHE_MAGIC)
+        if data[:header] != RUN_CACHE_MAGIC or data[header] != RUN_CACHE_VERSION:
+            self.misses += 1
+            return None
+        value = pickle.loads(zlib.decompress(data[header + 1:]))
+        try:
+            # Marks the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: object) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        path = self.path(key)
+        # Written aside first, as entries may be read by other processes
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(RUN_CACHE_MAGIC + bytes([RUN_CACHE_VERSION]) + payload)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """
+        (last use, bytes, path) of every entry, on least recently used order.
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.run'):
+                        try:
+                            info = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((info.st_mtime, info.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return sorted(entries)
+
+    def evict(self) -> None:
+        entries = self.entries()
+        size = sum(e[1] for e in entries)
+        max_entries = self.max_entries if self.max_entries is not None else len(entries)
+        for (_, n_bytes, path) in entries:
+            if size <= self.max_bytes and len(entries) <= max_entries:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            size -= n_bytes
+            max_entries += 1
+
+    def clear(self) -> None:
+        for (_, _, path) in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+@dataclass
+class CachedRun():
+    # Output without the params columns, which may hold lambdas
+    df: object
+    # Global generators of `BehaviourSampling.Reference` after the run, if used
+    random_state: Optional[tuple] = None
+    numpy_random_state: Optional[tuple] = None
+
+
+def cached_runner(runner: Callable, run_cache: Optional[RunCache] = None) -> Callable:
+    """
+    Wrap a runner with the `easy_run` signature so that runs already
+    stored on `run_cache` are returned without being executed.
+
+    Runs are keyed by the initial state, the params (neuron layers
+    included, through their code), the blocks, the timesteps, the samples,
+    the runner and its other arguments. Runs of `BehaviourSampling.Reference`
+    also depend on the global generators: their state is part of the key,
+    and set as it was after the run on cache hits.
+
+    XXX: params columns are attached as on `native_run`.
+    """
+    run_cache = run_cache or RunCache()
+
+    def run(state_variables: NQGModelState,
+            params: dict[str, list],
+            psubs: list[dict],
+            N_timesteps: int,
+            N_samples: int,
+            *args,
+            assign_params: Union[bool, set] = True,
+            **kwargs):
+        is_reference = any(v is BehaviourSampling.Reference for v in params.get('behaviour_sampling', []))
+        rng_states = (random.getstate(), np.random.get_state()) if is_reference else None
+        key = run_cache.key(runner, state_variables, params, psubs, N_timesteps, N_samples,
+                            args, kwargs, rng_states)
+        cached: Optional[CachedRun] = run_cache.get(key)  # type: ignore
+        if cached is None:
+            df = runner(state_variables, params, psubs, N_timesteps, N_samples, *args,
+                        assign_params=False, **kwargs)
+            cached = CachedRun(df)
+            if is_reference:
+                cached.random_state = random.getstate()
+                cached.numpy_random_state = np.random.get_state()
+            run_cache.put(key, cached)
+        elif is_reference:
+            random.setstate(cached.random_state)
+            np.random.set_state(cached.numpy_random_state)
+        return assign_param_columns(cached.df, params, assign_params)  # type: ignore
+
+    return run
@@ -0,0 +1,193 @@
+from nqg_model.types import *
+from nqg_model.recording import RecordingOptions, STATE_INDEXES
+from pandas import DataFrame
+from collections import deque
+from functools import reduce
+from typing import Collection, Iterator, Optional
+from time import perf_counter
+import operator
+
+
+def expand_params(params: dict[str, list]) -> list[dict]:
+    """
+    Expand a cadCAD parameter dict of lists into one parameter set per subset.
+
+    Like cadCAD, lists are swept together rather than on a cartesian
+    product and single-valued lists are shared by every subset.
+    """
+    n_subsets = max((len(v) for v in params.values()), default=1)
+    for key, values in params.items():
+        if len(values) not in (1, n_subsets):
+            raise ValueError(f"Param '{key}' has {len(values)} values for {n_subsets} subsets")
+    return [{k: v[i] if len(v) > 1 else v[0] for k, v in params.items()}
+            for i in range(n_subsets)]
+
+
+def iter_run(initial_state: NQGModelState,
+             params: dict,
+             psubs: list[dict],
+             N_timesteps: int,
+             simulation: int = 0,
+             subset: int = 0,
+             run: int = 1,
+             drop_substeps: bool = True,
+             history_window: Optional[int] = 0,
+             initial_timestep: int = 0) -> Iterator[dict]:
+    """
+    Execute a single run of the Partial State Update Blocks and yield
+    its states, starting with the initial one.
+
+    Policies and SUFs are called with the same arguments as cadCAD does,
+    and states carry the same `simulation`, `subset`, `run`, `substep`
+    and `timestep` indexes with the same semantics.
+
+    Args:
+        drop_substeps (bool): Only yield the last substep of each timestep.
+        history_window (int, optional): Number of past timesteps that are kept
+            on the history passed to policies & SUFs. Defaults to none, as the
+            NQG blocks do not read the history. Use `None` for the full
+            history, as cadCAD does.
+        initial_timestep (int): Timestep of `initial_state`, eg. when resuming
+            from a checkpoint. The run goes on until `N_timesteps`.
+    """
+    blocks = [(list(block.get('policies', {}).values()),
+               list(block.get('variables', {}).values()))
+              for block in psubs]
+
+    state = dict(initial_state)
+    state.update(simulation=simulation, subset=subset, run=run, substep=0, timestep=initial_timestep)
+    history: deque[list[dict]] = deque([[state]], maxlen=history_window)
+    yield state
+
+    for timestep in range(initial_timestep + 1, N_timesteps + 1):
+        substates = []
+        for substep, (policies, sufs) in enumerate(blocks, 1):
+            current = state.copy()
+            signals: dict[str, list] = {}
+            for policy in policies:
+                for key, value in policy(params, substep, history, current).items():
+                    signals.setdefault(key, []).append(value)
+            signal = {k: reduce(operator.add, v) for k, v in signals.items()}
+
+            updates = {}
+            for suf in sufs:
+                if suf.__code__.co_argcount == 6:
+                    (key, value) = suf(params, substep, history, current, signal, None)
+                else:
+                    (key, value) = suf(params, substep, history, current, signal)
+                updates[key] = value
+            state = {**current, **updates,
+                     'substep': substep, 'timestep': timestep, 'run': run}
+            substates.append(state)
+            if not drop_substeps:
+                yield state
+        history.append(substates)
+        if drop_substeps:
+            yield state
+
+
+def native_run(state_variables: NQGModelState,
+               params: dict[str, list],
+               psubs: list[dict],
+               N_timesteps: int,
+               N_samples: int,
+               use_label: bool = False,
+               assign_params: Union[bool, set] = True,
+               drop_substeps: bool = True,
+               variables: Optional[Collection[str]] = None,
+               history_window: Optional[int] = 0,
+               recording: Optional[RecordingOptions] = None) -> DataFrame:
+    """
+    Drop-in replacement for `cadCAD_tools.easy_run` which executes the
+    blocks on a plain loop in the current process.
+
+    Returns the same columns and index as `easy_run`. Subsets and runs are
+    executed one after the other, so the `BehaviourSampling.Reference`
+    global generators keep their state between runs.
+
+    Args:
+        variables (Collection[str], optional): Only record these state
+            variables, on top of the cadCAD indexes.
+        history_window (int, optional): See `iter_run`.
+        recording (RecordingOptions, optional): Only record some of the
+            states, overriding `drop_substeps` & `variables`. Unrecorded
+            states are never held, so memory doesn't grow with the
+            timesteps if only a few are recorded.
+    """
+    subsets = expand_params(params)
+    n_substeps = len(psubs)
+    if recording is None:
+        recording = RecordingOptions(variables, drop_substeps)
+    drop_substeps = recording.final_substeps
+
+    records = []
+    index = []
+    for subset, subset_params in enumerate(subsets):
+        for run in range(1, N_samples + 1):
+            for state in iter_run(state_variables, subset_params, psubs, N_timesteps,
+                                  subset=subset, run=run,
+                                  drop_substeps=drop_substeps,
+                                  history_window=history_window):
+                recorded_state = recording.record(state)
+                if recorded_state is None:
+                    continue
+                records.append(recorded_state)
+                # Position that the state would have on the full cadCAD output
+                position = (subset * N_samples + run - 1) * (N_timesteps * n_substeps + 1)
+                if state['timestep'] > 0:
+                    position += (state['timestep'] - 1) * n_substeps + state['substep']
+                index.append(position)
+    df = DataFrame(records, index=index)
+
+    if drop_substeps:
+        df = df.drop(columns=['substep'])
+    df = assign_param_columns(df, params, assign_params)
+    if use_label and not drop_substeps:
+        labels = {0: 'Initial State', **{i + 1: b.get('label', '') for i, b in enumerate(psubs)}}
+        df['substep_label'] = df.substep.map(labels)
+    return df
+
+
+def assign_param_columns(df: DataFrame,
+                         params: dict[str, list],
+                         assign_params: Union[bool, set] = True) -> DataFrame:
+    """
+    Attach the params of every subset as columns, as `easy_run` does.
+    """
+    if assign_params is False:
+        return df
+    from cadCAD_tools.execution.easy_run import select_M_dict  # type: ignore
+    subsets = expand_params(params)
+    keys = set(params.keys()) if assign_params is True else set(params.keys()) & set(assign_params)
+    # Assigned row by row, so that list & set valued params are kept as is
+    described = [select_M_dict(subset_params, keys) for subset_params in subsets]
+    for key in (k for k in params if k in keys):
+        df[key] = [described[subset][key] for subset in df.subset]
+    return df
+
+
+def compare_runners(N_timesteps: int = 100, N_samples: int = 1) -> DataFrame:
+    """
+    Time `native_run` side by side with `easy_run` on the default single
+    run and check that both produce the same states.
+    """
+    from nqg_model import default_run_args
+    from cadCAD_tools import easy_run  # type: ignore
+
+    (initial_state, params, blocks, _, _) = default_run_args
+    args = (initial_state, params, blocks, N_timesteps, N_samples)
+
+    timings = {}
+    t0 = perf_counter()
+    cadcad_df = easy_run(*args, assign_params=False)
+    timings['easy_run'] = perf_counter() - t0
+    t0 = perf_counter()
+    native_df = native_run(*args, assign_params=False)
+    timings['native_run'] = perf_counter() - t0
+
+    columns = [c for c in cadcad_df.columns if c != 'oracle_state']
+    if not cadcad_df[columns].equals(native_df[columns]):
+        raise AssertionError("native_run and easy_run results differ")
+    return DataFrame({'runner': list(timings.keys()),
+                      'seconds': list(timings.values()),
+                      'speedup': [timings['easy_run'] / t for t in timings.values()]})
@@ -1,74 +1,88 @@
 from nqg_model.logic import *
 from copy import deepcopy
+from functools import cache
 
 
-NQG_MODEL_BLOCKS: list[dict] = [
-    {
-        'label': 'Time Tracking',
-        'ignore': False,
-        'desc': 'Updates the time in the system',
-        'policies': {
-            'evolve_time': p_evolve_time
+# Blocks as written, before post processing
+def _raw_blocks() -> list[dict]:
+    return [
+        {
+            'label': 'Time Tracking',
+            'ignore': False,
+            'desc': 'Updates the time in the system',
+            'policies': {
+                'evolve_time': p_evolve_time
+            },
+            'variables': {
+                'days_passed': s_days_passed,
+                'delta_days': s_delta_days
+            }
+        }, 
+        {
+            'label': 'Onboard users',
+            'policies': {
+                'onboard_users': p_onboard_users
+            },
+            'variables': {
+                'users': s_onboard_users,
+                'onboarded_users': replace_suf
+            }
         },
-        'variables': {
-            'days_passed': s_days_passed,
-            'delta_days': s_delta_days
-        }
-    }, 
-    {
-        'label': 'Onboard users',
-        'policies': {},
-        'variables': {
-            'users': s_onboard_users
-        }
-    },
-    {
-        'label': 'Trust & Vote',
-        'policies': {
-            'user_vote': p_user_vote
+        {
+            'label': 'Trust & Vote',
+            'policies': {
+                'user_vote': p_user_vote
+            },
+            'variables': {
+                'trustees': s_trust,
+                'delegatees': replace_suf,
+                'action_matrix': replace_suf,
+                'user_round_decisions': replace_suf
+            }
         },
-        'variables': {
-            'trustees': s_trust,
-            'delegatees': replace_suf,
-            'action_matrix': replace_suf,
-            'user_round_decisions': replace_suf
-        }
-    },
-    {
-        'label': 'Update Oracle State',
-        'policies': {},
-        'variables': {
-            'oracle_state': s_oracle_state
-        }
-    },
-    {
-        'label': 'Tally votes according to Neural Quorum Governance',
-        'policies': {
-            'tally votes': p_compute_votes
+        {
+            'label': 'Update Oracle State',
+            'policies': {},
+            'variables': {
+                'oracle_state': s_oracle_state
+            }
         },
-        'variables': {
-            'vote_matrix': replace_suf,
-            'per_project_voting': replace_suf
+        {
+            'label': 'Tally votes according to Neural Quorum Governance',
+            'policies': {
+                'tally votes': p_compute_votes
+            },
+            'variables': {
+                'effective_action_matrix': replace_suf,
+                'vote_matrix': replace_suf,
+                'per_project_voting': replace_suf
+            }
         }
-    }
-]
-
+    ]
 
-NQG_MODEL_BLOCKS = [block for block in NQG_MODEL_BLOCKS
-                              if block.get('ignore', False) is False]
 
-# Post Processing
+@cache
+def model_blocks() -> list[dict]:
+    """
+    The model blocks, with the `add_suf` & `replace_suf` placeholders
+    bound to their variables. Built once, on first use.
+    """
+    blocks: list[dict] = []
+    for block in [b for b in _raw_blocks() if b.get('ignore', False) != True]:
+        _block = deepcopy(block)
+        for variable, suf in block.get('variables', {}).items():
+            if suf == add_suf:
+                _block['variables'][variable] = add_suf(variable)
+            elif suf == replace_suf:
+                _block['variables'][variable] = replace_suf(variable)
+            else:
+                pass
+        blocks.append(_block)
+    return blocks
 
-blocks: list[dict] = []
-for block in [b for b in NQG_MODEL_BLOCKS if b.get('ignore', False) != True]:
-    _block = deepcopy(block)
-    for variable, suf in block.get('variables', {}).items():
-        if suf == add_suf:
-            _block['variables'][variable] = add_suf(variable)
-        elif suf == replace_suf:
-            _block['variables'][variable] = replace_suf(variable)
-        else:
-            pass
-    blocks.append(_block)
 
-NQG_MODEL_BLOCKS = deepcopy(blocks)
\ No newline at end of file
+def __getattr__(name: str):
+    # `NQG_MODEL_BLOCKS` is built lazily, see `model_blocks`
+    if name == 'NQG_MODEL_BLOCKS':
+        return model_blocks()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,363 @@
+from nqg_model.types import *
+from typing import Iterable, Iterator
+from nqg_model.params import SINGLE_RUN_PARAMS, INITIAL_ORACLE_STATE
+from nqg_model.registry import UserRegistry, UserValues, user_registry
+from nqg_model.neural_quorum_governance import (neural_governance_power,
+                                                select_quorum_delegates,
+                                                resolve_quorum_consensus)
+from nqg_model.trust_rank import pagerank
+from pandas import DataFrame
+import numpy as np
+import json
+import os
+
+SNAPSHOT_VERSION = 1
+
+# Decisions are stored as their position on this list, or -1 for none
+ACTIONS: list[Action] = list(Action)
+
+# Columns of a round snapshot, stored as one `<column>.npy` file each.
+# Users are referenced by their position on the `users_*` columns and
+# projects by their position on the snapshot projects.
+SNAPSHOT_COLUMNS: dict[str, type] = {
+    'users_label': np.int64,
+    'users_reputation': np.int8,  # Position on `REPUTATION_CATEGORIES`
+    'users_past_rounds': np.uint64,  # Bitmask over the snapshot rounds
+    'users_decision': np.int8,
+    'trust_truster': np.int64,
+    'trust_trustee': np.int64,
+    'votes_user': np.int64,  # Sorted
+    'votes_project': np.int32,
+    'votes_vote': np.int8,  # Vote value
+    'delegations_delegator': np.int64,  # Sorted, with the delegatees on rank order
+    'delegations_delegatee': np.int64,
+}
+
+# Columns which must be sorted for the users to be tallied in chunks
+SORTED_COLUMNS = {'votes_user': ('votes_project', 'votes_vote'),
+                  'delegations_delegator': ('delegations_delegatee',)}
+
+# Columns of the per-project results
+RESULT_COLUMNS = ('project', 'power', 'yes_power', 'no_power', 'n_yes', 'n_no', 'n_delegated')
+
+
+@dataclass
+class RoundSnapshot():
+    """
+    Static snapshot of a voting round: the users, their trust edges,
+    the votes of the round voters and the delegations of the delegators.
+    """
+    columns: dict[str, ndarray]
+    projects: list[ProjectUUID]
+    # Past rounds of the `users_past_rounds` bits
+    rounds: list[PastRoundIndex]
+
+    @property
+    def n_users(self) -> int:
+        return len(self.columns['users_label'])
+
+
+def save_snapshot(directory: str, snapshot: RoundSnapshot) -> None:
+    """
+    Write a round snapshot as one `.npy` file per column, plus a
+    `snapshot.json` header with the projects and rounds.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = dict(snapshot.columns)
+    for (key, others) in SORTED_COLUMNS.items():
+        order = np.argsort(columns[key], kind='stable')
+        for column in (key,) + others:
+            columns[column] = np.asarray(columns[column])[order]
+    for (column, dtype) in SNAPSHOT_COLUMNS.items():
+        np.save(os.path.join(directory, f"{column}.npy"), np.asarray(columns[column], dtype=dtype))
+    with open(os.path.join(directory, 'snapshot.json'), 'w') as f:
+        json.dump({'version': SNAPSHOT_VERSION,
+                   'projects': list(snapshot.projects),
+                   'rounds': list(snapshot.rounds)}, f)
+
+
+def load_snapshot(directory: str, mmap: bool = True) -> RoundSnapshot:
+    """
+    Load a round snapshot. Columns are memory-mapped unless `mmap` is
+    off, so that only the pages being tallied are kept in memory.
+    """
+    with open(os.path.join(directory, 'snapshot.json')) as f:
+        header = json.load(f)
+    if header['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {header['version']}")
+    columns = {column: np.load(os.path.join(directory, f"{column}.npy"),
+                               mmap_mode='r' if mmap else None)
+               for column in SNAPSHOT_COLUMNS}
+    for key in SORTED_COLUMNS:
+        if not _is_sorted(columns[key]):
+            raise ValueError(f"Column {key} must be sorted")
+    return RoundSnapshot(columns, header['projects'], header['rounds'])
+
+
+def _is_sorted(values: ndarray, chunk_size: int = 1_000_000) -> bool:
+    for start in range(0, len(values), chunk_size):
+        chunk = values[max(start - 1, 0):start + chunk_size]
+        if (np.diff(chunk) < 0).any():
+            return False
+    return True
+
+
+def snapshot_from_state(state: NQGModelState, params: NQGModelParams) -> RoundSnapshot:
+    """
+    Round snapshot of a simulation state, eg. for tallying it outside of the model.
+    """
+    users = user_registry(state['users'], params['past_rounds'])
+    projects = sorted(params['projects'])
+    project_index = {p: j for j, p in enumerate(projects)}
+    position = {u: i for i, u in enumerate(users.labels.tolist())}
+
+    decisions = np.full(len(users), -1, dtype=np.int8)
+    for (user, decision) in state['user_round_decisions'].items():
+        decisions[position[user]] = ACTIONS.index(decision)
+
+    def edges(graph: Mapping[UserUUID, Iterable[UserUUID]]) -> tuple[list[int], list[int]]:
+        (sources, targets) = ([], [])
+        for (source, successors) in graph.items():
+            successors = [position[u] for u in successors]
+            sources.extend([position[source]] * len(successors))
+            targets.extend(successors)
+        return (sources, targets)
+
+    votes: tuple[list, list, list] = ([], [], [])
+    for (user, actions) in state['action_matrix'].items():
+        for (project, vote) in actions.items():
+            votes[0].append(position[user])
+            votes[1].append(project_index[project])
+            votes[2].append(int(vote.value))
+
+    (trusters, trustees) = edges(state['trustees'])
+    (delegators, delegatees) = edges(state['delegatees'])
+    columns = {'users_label': users.labels,
+               'users_reputation': users.reputations,
+               'users_past_rounds': users.past_rounds,
+               'users_decision': decisions,
+               'trust_truster': trusters,
+               'trust_trustee': trustees,
+               'votes_user': votes[0],
+               'votes_project': votes[1],
+               'votes_vote': votes[2],
+               'delegations_delegator': delegators,
+               'delegations_delegatee': delegatees}
+    return RoundSnapshot({k: np.asarray(v, dtype=SNAPSHOT_COLUMNS[k]) for k, v in columns.items()},
+                         projects, list(users.rounds))
+
+
+def trust_scores(snapshot: RoundSnapshot,
+                 chunk_size: int = 1_000_000,
+                 alpha: float = 0.85,
+                 max_iter: int = 100,
+                 tol: float = 1e-6) -> ndarray:
+    """
+    Trust Score of every user, as on `trust_score`: the PageRank of the
+    Trust Graph, where every user is a node, scaled through MinMax.
+    """
+    N = snapshot.n_users
+    scores = np.zeros(N)
+    if N < 2:
+        return scores
+    # Edges are copied in chunks into compact arrays
+    (trusters, trustees) = (snapshot.columns['trust_truster'], snapshot.columns['trust_trustee'])
+    dtype = np.int32 if N < 2 ** 31 else np.int64
+    (sources, targets) = (np.empty(len(trusters), dtype=dtype), np.empty(len(trusters), dtype=dtype))
+    for start in range(0, len(trusters), chunk_size):
+        sources[start:start + chunk_size] = trusters[start:start + chunk_size]
+        targets[start:start + chunk_size] = trustees[start:start + chunk_size]
+    values = pagerank(sources, targets, N, alpha=alpha, max_iter=max_iter, tol=tol)
+    (min_value, max_value) = (values.min(), values.max())
+    if max_value == min_value:
+        # XXX: assumption for edge cases, as on `normalized_trust_index`
+        scores[:] = 0.5
+    else:
+        scores[:] = (values - min_value) / (max_value - min_value)
+    return scores
+
+
+@dataclass
+class ResolvedRound():
+    """
+    What a round tally shares across Neural Governance configurations:
+    the user registry, the Trust Score and the Quorum Delegation outcome.
+    """
+    registry: UserRegistry
+    trust: ndarray
+    # Row of every user on the round voters & delegators, or -1
+    voter_of_user: ndarray
+    delegator_of_user: ndarray
+    # Votes of the delegators, in position order
+    delegated_votes: ndarray
+
+    def oracle_state(self,
+                     reputation_bonus_map: Optional[dict] = None,
+                     prior_voting_bonus_map: Optional[dict] = None) -> OracleState:
+        return OracleState(pagerank_results={},
+                           trust_index=UserValues(self.registry, self.trust),
+                           reputation_bonus_values=self.registry.reputation_values(),
+                           prior_voting_bonus_values=self.registry.prior_voting_values(),
+                           reputation_bonus_map=(reputation_bonus_map
+                                                 if reputation_bonus_map is not None
+                                                 else INITIAL_ORACLE_STATE.reputation_bonus_map),
+                           prior_voting_bonus_map=(prior_voting_bonus_map
+                                                   if prior_voting_bonus_map is not None
+                                                   else INITIAL_ORACLE_STATE.prior_voting_bonus_map))
+
+
+def resolve_round(snapshot: RoundSnapshot,
+                  params: NQGModelParams = SINGLE_RUN_PARAMS,
+                  chunk_size: int = 100_000) -> ResolvedRound:
+    """
+    Compute the Trust Score and resolve Quorum Delegation for a round,
+    with the delegators processed in chunks of `chunk_size`.
+
+    XXX: Quorum Delegation is single hop, as chunks are resolved on their own.
+    """
+    if params.get('quorum_delegation_transitive', False):
+        raise ValueError("Transitive Quorum Delegation is not supported on the standalone tally")
+    columns = snapshot.columns
+    N = snapshot.n_users
+    P = len(snapshot.projects)
+    decisions = np.asarray(columns['users_decision'])
+    registry = UserRegistry.from_columns(columns['users_label'],
+                                         columns['users_reputation'],
+                                         columns['users_past_rounds'],
+                                         snapshot.rounds)
+    trust = trust_scores(snapshot)
+
+    # Agreement weights of the round voters, in position order.
+    # The last row is padding, as on `batch_votes_from_quorum_delegation`.
+    round_voters = np.flatnonzero(decisions == ACTIONS.index(Action.RoundVote))
+    voter_of_user = np.full(N, -1)
+    voter_of_user[round_voters] = np.arange(len(round_voters))
+    vote_weights = np.array([params['quorum_agreement_weight_no'],
+                             params['quorum_agreement_weight_abstain'],
+                             params['quorum_agreement_weight_yes']])
+    weights = np.zeros((len(round_voters) + 1, P))
+    has_action = np.zeros((len(round_voters) + 1, P), dtype=bool)
+    (vote_users, vote_projects, vote_values) = (columns['votes_user'],
+                                                columns['votes_project'],
+                                                columns['votes_vote'])
+    for start in range(0, len(vote_users), chunk_size):
+        rows = voter_of_user[vote_users[start:start + chunk_size]]
+        cols = vote_projects[start:start + chunk_size][rows >= 0]
+        values = vote_values[start:start + chunk_size][rows >= 0]
+        rows = rows[rows >= 0]
+        weights[rows, cols] = vote_weights[values.astype(np.int64) + 1]
+        has_action[rows, cols] = True
+
+    # Quorum Delegation, for chunks of delegators
+    delegators = np.flatnonzero(decisions == ACTIONS.index(Action.Delegate))
+    delegated_votes = np.zeros((len(delegators), P), dtype=np.int8)
+    (delegation_users, delegation_targets) = (columns['delegations_delegator'],
+                                              columns['delegations_delegatee'])
+    for start in range(0, len(delegators), chunk_size):
+        chunk = delegators[start:start + chunk_size]
+        first = np.searchsorted(delegation_users, chunk[0], side='left')
+        last = np.searchsorted(delegation_users, chunk[-1], side='right')
+        users = delegation_users[first:last]
+        # Delegations of users which did not decide to delegate are skipped
+        owners = np.searchsorted(chunk, users)
+        is_owned = chunk[np.minimum(owners, len(chunk) - 1)] == users
+        voters = np.where(is_owned, voter_of_user[delegation_targets[first:last]], -1)
+        selected = select_quorum_delegates(owners, voters, len(chunk),
+                                           params['max_quorum_selected_delegates'],
+                                           len(round_voters))
+        delegated_votes[start:start + len(chunk)] = resolve_quorum_consensus(weights, has_action,
+                                                                             selected, params)
+    delegator_of_user = np.full(N, -1)
+    delegator_of_user[delegators] = np.arange(len(delegators))
+
+    return ResolvedRound(registry, trust, voter_of_user, delegator_of_user, delegated_votes)
+
+
+def iter_round_votes(snapshot: RoundSnapshot,
+                     resolved: ResolvedRound,
+                     chunk_size: int = 100_000) -> Iterator[tuple[ndarray, ndarray, ndarray, ndarray]]:
+    """
+    Iterate over chunks of `chunk_size` users with the (positions, votes,
+    mask, is_delegator) of the ones who vote, either as round voters or
+    through their quorum. Votes & mask are dense voters × projects arrays.
+    """
+    columns = snapshot.columns
+    N = snapshot.n_users
+    P = len(snapshot.projects)
+    (voter_of_user, delegator_of_user) = (resolved.voter_of_user, resolved.delegator_of_user)
+    (vote_users, vote_projects, vote_values) = (columns['votes_user'],
+                                                columns['votes_project'],
+                                                columns['votes_vote'])
+    for start in range(0, N, chunk_size):
+        stop = min(start + chunk_size, N)
+        voting = np.flatnonzero((voter_of_user[start:stop] >= 0)
+                                | (delegator_of_user[start:stop] >= 0)) + start
+        if len(voting) == 0:
+            continue
+        row_of_user = np.full(stop - start, -1)
+        row_of_user[voting - start] = np.arange(len(voting))
+
+        votes = np.zeros((len(voting), P))
+        mask = np.zeros((len(voting), P), dtype=bool)
+        (first, last) = np.searchsorted(vote_users, [start, stop], side='left')
+        rows = row_of_user[vote_users[first:last] - start]
+        is_round_voter = voter_of_user[vote_users[first:last]] >= 0
+        votes[rows[is_round_voter], vote_projects[first:last][is_round_voter]] = \
+            vote_values[first:last][is_round_voter]
+        mask[rows[is_round_voter], vote_projects[first:last][is_round_voter]] = True
+
+        is_delegator = delegator_of_user[voting] >= 0
+        votes[is_delegator] = resolved.delegated_votes[delegator_of_user[voting[is_delegator]]]
+        mask[is_delegator] = True
+        yield (voting, votes, mask, is_delegator)
+
+
+def tally_round(snapshot: RoundSnapshot,
+                params: NQGModelParams = SINGLE_RUN_PARAMS,
+                reputation_bonus_map: Optional[dict[ReputationCategory, float]] = None,
+                prior_voting_bonus_map: Optional[dict[int, float]] = None,
+                chunk_size: int = 100_000) -> DataFrame:
+    """
+    Tally a round with Quorum Delegation and Neural Governance in batch.
+
+    Users are processed in chunks of `chunk_size`, which bounds the
+    memory of the users × projects arrays. On top of them, memory is
+    linear on the number of users, round voters and trust edges.
+
+    Only the votes of the round voters are counted. Delegators vote as
+    per their quorum consensus and abstaining users are not counted.
+
+    Returns one row per project with the total Voting Power (also split
+    into yes & no) and the number of yes, no and delegated votes.
+    """
+    P = len(snapshot.projects)
+    resolved = resolve_round(snapshot, params, chunk_size)
+    oracle_state = resolved.oracle_state(reputation_bonus_map, prior_voting_bonus_map)
+
+    totals = {k: np.zeros(P) for k in ('power', 'yes_power', 'no_power')}
+    counts = {k: np.zeros(P, dtype=np.int64) for k in ('n_yes', 'n_no', 'n_delegated')}
+    for (voting, votes, mask, is_delegator) in iter_round_votes(snapshot, resolved, chunk_size):
+        power = neural_governance_power(resolved.registry.labels[voting],
+                                        snapshot.projects,
+                                        params,
+                                        oracle_state)
+        vote_power = np.where(mask, votes * power, 0.0)
+        totals['power'] += vote_power.sum(axis=0)
+        totals['yes_power'] += np.where(votes > 0, vote_power, 0.0).sum(axis=0)
+        totals['no_power'] += np.where(votes < 0, vote_power, 0.0).sum(axis=0)
+        counts['n_yes'] += (mask & (votes > 0)).sum(axis=0)
+        counts['n_no'] += (mask & (votes < 0)).sum(axis=0)
+        counts['n_delegated'] += (votes[is_delegator] != 0).sum(axis=0)
+
+    return DataFrame({'project': snapshot.projects, **totals, **counts}, columns=list(RESULT_COLUMNS))
+
+
+def write_results(results: DataFrame, path: str) -> None:
+    """
+    Write the per-project results as Parquet (requires `pyarrow`) or CSV,
+    as per the extension of `path`.
+    """
+    if path.endswith('.parquet'):
+        results.to_parquet(path, index=False)
+    else:
+        results.to_csv(path, index=False)
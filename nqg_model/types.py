@@ -1,14 +1,22 @@
-from typing import Annotated, TypedDict, Union, Callable
-from dataclasses import dataclass
+from typing import Annotated, TypedDict, Union, Callable, Optional, Sequence, Mapping, TYPE_CHECKING
+from dataclasses import dataclass, field
 from enum import Enum, auto
+from numpy import ndarray
+
+if TYPE_CHECKING:
+    from nqg_model.trust_rank import IncrementalPageRank
+    from nqg_model.oracles import OracleProvider
 
 Days = Annotated[float, 'days']  # Number of days
 UserUUID = str
 ProjectUUID = str
 VotingPower = float
 PastRoundIndex = int
-TrustGraph = dict[UserUUID, set[UserUUID]]
-DelegationGraph = dict[UserUUID, list[UserUUID]]
+TrustGraph = Mapping[UserUUID, set[UserUUID]]
+DelegationGraph = Mapping[UserUUID, list[UserUUID]]
+# As on `cadCAD_tools.types`, which is not imported as it loads cadCAD
+Signal = dict[str, object]
+VariableUpdate = tuple[str, object]
 
 class ReputationCategory(Enum):
     Tier3 = auto()
@@ -19,10 +27,40 @@ class ReputationCategory(Enum):
 @dataclass
 class OracleState():
     pagerank_results: dict[UserUUID, float]
-    reputation_bonus_values: dict[UserUUID, ReputationCategory]
-    prior_voting_bonus_values: dict[UserUUID, list[int]]
+    # Label-indexed views over the user registry (see `nqg_model.registry`)
+    reputation_bonus_values: Mapping[UserUUID, ReputationCategory]
+    prior_voting_bonus_values: Mapping[UserUUID, list[int]]
     reputation_bonus_map: dict[ReputationCategory, float]
     prior_voting_bonus_map: dict[int, float]
+    # MinMax-scaled `pagerank_results`, rebuilt once per update.
+    # Computed from `pagerank_results` when not given.
+    trust_index: Optional[Mapping[UserUUID, float]] = None
+    # Sparse PageRank engine carried across timesteps. Created on first use.
+    pagerank_engine: Optional['IncrementalPageRank'] = field(default=None, repr=False, compare=False)
+    # Memoized oracle providers by name, carried across timesteps. Created on first use.
+    oracles: Optional[dict[str, 'OracleProvider']] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.trust_index is None:
+            # XXX: imported here, as the oracles are built on top of the types
+            from nqg_model.neural_quorum_governance import normalized_trust_index
+            self.trust_index = normalized_trust_index(self.pagerank_results)
+
+class BehaviourSampling(Enum):
+    """
+    How the stochastic user behaviour is sampled.
+    """
+    Reference = auto() # One scipy / `random` call per variate
+    Batched = auto() # Vectorized draws from a seeded numpy Generator
+
+class DelegationCyclePolicy(Enum):
+    """
+    How transitive Quorum Delegation treats delegators which delegate to
+    each other in a cycle.
+    """
+    Drop = auto() # Delegates on the same cycle are left out of the quorum
+    Abstain = auto() # Delegators on a cycle abstain on every project
+    Raise = auto() # Raise a ValueError
 
 class Vote(float, Enum):
     """
@@ -48,7 +86,7 @@ class User():
     active_past_rounds: set[PastRoundIndex]
 
 
-ActionMatrix = dict[UserUUID, dict[ProjectUUID, Vote]]
+ActionMatrix = Mapping[UserUUID, dict[ProjectUUID, Vote]]
 VotingMatrix = dict[UserUUID, dict[ProjectUUID, VotingPower]]
 PerProjectVoting = dict[ProjectUUID, VotingPower]
 
@@ -58,15 +96,32 @@ LayerAggregatorFunction = Callable[[list[VotingPower]], VotingPower]
 Neuron = tuple[OracleFunction, WeightingFunction]
 NeuronsContainer = dict[Annotated[str, 'Neuron label'], Neuron]
 NeuronLayer = tuple[NeuronsContainer, LayerAggregatorFunction]
+
+# Vectorized counterparts. Batch Oracles are evaluated over the whole
+# users × projects grid at once and return arrays broadcastable to it.
+BatchOracleFunction = Callable[[Sequence[UserUUID], Sequence[ProjectUUID], ndarray, OracleState], ndarray]
+BatchWeightingFunction = Callable[[ndarray], ndarray]
+BatchLayerAggregatorFunction = Callable[[list[ndarray]], ndarray]
+BatchNeuron = tuple[BatchOracleFunction, BatchWeightingFunction]
+BatchNeuronsContainer = dict[Annotated[str, 'Neuron label'], BatchNeuron]
+BatchNeuronLayer = tuple[BatchNeuronsContainer, BatchLayerAggregatorFunction]
 class NQGModelState(TypedDict):
     days_passed: Days
     delta_days: Days
-    users: list[User]
+    # Population-sized variables are copy-on-write snapshots
+    # (see `nqg_model.containers`) shared across timesteps.
+    # Users are kept on a columnar `nqg_model.registry.UserRegistry`.
+    users: Sequence[User]
+    # Users onboarded on the current timestep
+    onboarded_users: Sequence[User]
     
-    user_round_decisions: dict[UserUUID, Action]
+    user_round_decisions: Mapping[UserUUID, Action]
     delegatees: DelegationGraph
     trustees: TrustGraph
     action_matrix: ActionMatrix
+    # Votes as counted on the tally: the Quorum Delegation outcome
+    # for delegators and Abstain for abstaining users
+    effective_action_matrix: ActionMatrix
     vote_matrix: VotingMatrix
     per_project_voting: PerProjectVoting
     oracle_state: OracleState
@@ -84,9 +139,12 @@ class NQGModelParams(TypedDict):
     max_quorum_candidate_delegates: int
     quorum_delegation_absolute_threshold: float
     quorum_delegation_relative_threshold: float
+    quorum_delegation_transitive: bool # Resolve the delegates which delegated through their own quorum
+    quorum_delegation_cycle_policy: DelegationCyclePolicy
 
     # Neural Governance Parameters
     neuron_layers: list[NeuronLayer]
+    batch_neuron_layers: Optional[list[BatchNeuronLayer]] # Vectorized `neuron_layers`. None for the per-user path, which custom `neuron_layers` take unless set.
     initial_power: float
 
     # Neuron parameters
@@ -105,6 +163,8 @@ class NQGModelParams(TypedDict):
     new_user_average_delegate_count: float
     new_user_min_delegate_count: int
     new_user_average_trustees: float
+    behaviour_sampling: BehaviourSampling
+    seed: int # Only used for `BehaviourSampling.Batched`
 
 
 
@@ -0,0 +1,105 @@
+from nqg_model.types import *
+from nqg_model.params import SINGLE_RUN_PARAMS, INITIAL_ORACLE_STATE
+from nqg_model.neural_quorum_governance import batch_power_from_neural_governance, batch_neuron_layers_of
+from nqg_model.tally import RoundSnapshot, resolve_round, iter_round_votes, snapshot_from_state
+from pandas import DataFrame
+import numpy as np
+
+
+@dataclass
+class NGConfig():
+    """
+    Neural Governance parametrization to evaluate. Fields left as None
+    take the value of the tally params or of the initial oracle state.
+    """
+    label: str
+    reputation_bonus_map: Optional[dict[ReputationCategory, float]] = None
+    prior_voting_bonus_map: Optional[dict[PastRoundIndex, float]] = None
+    batch_neuron_layers: Optional[list[BatchNeuronLayer]] = None
+    initial_power: Optional[float] = None
+
+
+def stacked_bonus_map(maps: Sequence[dict]) -> dict[object, ndarray]:
+    """
+    Merge K bonus maps into a single one holding arrays of K values,
+    with 0.0 where a map lacks a key (as on `dict.get(k, 0.0)`).
+    """
+    keys = {k for m in maps for k in m}
+    return {k: np.array([m.get(k, 0.0) for m in maps]) for k in keys}
+
+
+def evaluate_configs(snapshot: Union[RoundSnapshot, NQGModelState],
+                     configs: Sequence[NGConfig],
+                     params: NQGModelParams = SINGLE_RUN_PARAMS,
+                     chunk_size: int = 100_000) -> DataFrame:
+    """
+    Tally the same round under K Neural Governance configurations.
+
+    The Trust Score (PageRank), the votes and the Quorum Delegation
+    outcome are computed once and shared by every configuration.
+    Configurations with the same neuron layers are evaluated together:
+    their bonus maps and initial power are stacked into arrays of K
+    values, so that every neuron is called once for all of them. Only
+    batch neuron layers are supported (see `batch_neuron_layers_of`).
+
+    Args:
+        snapshot: A `RoundSnapshot` or a simulation state, which is
+            converted through `snapshot_from_state`.
+        configs: Configurations to evaluate. Labels must be unique.
+        chunk_size (int): Users × configurations evaluated at once,
+            which bounds the memory as on `tally_round`.
+
+    Returns a K × projects DataFrame of the total Voting Power of every
+    project, indexed by the configuration label.
+    """
+    if not isinstance(snapshot, RoundSnapshot):
+        snapshot = snapshot_from_state(snapshot, params)
+    labels = [c.label for c in configs]
+    if len(set(labels)) != len(labels):
+        raise ValueError("Configuration labels must be unique")
+
+    # Configurations grouped by their neuron layers, on order of appearance
+    groups: dict[int, list[int]] = {}
+    layers_of_group: dict[int, list[BatchNeuronLayer]] = {}
+    params_layers = batch_neuron_layers_of(params)
+    for (i, config) in enumerate(configs):
+        layers = config.batch_neuron_layers if config.batch_neuron_layers is not None else params_layers
+        if layers is None:
+            raise ValueError(f"Configuration {config.label!r} has no batch neuron layers, which are "
+                             "required as the params' `neuron_layers` have no batch counterpart")
+        groups.setdefault(id(layers), []).append(i)
+        layers_of_group[id(layers)] = layers
+
+    resolved = resolve_round(snapshot, params, chunk_size)
+    stacked = {}
+    for (key, members) in groups.items():
+        group = [configs[i] for i in members]
+        oracle_state = resolved.oracle_state(
+            stacked_bonus_map([c.reputation_bonus_map if c.reputation_bonus_map is not None
+                               else INITIAL_ORACLE_STATE.reputation_bonus_map
+                               for c in group]),
+            stacked_bonus_map([c.prior_voting_bonus_map if c.prior_voting_bonus_map is not None
+                               else INITIAL_ORACLE_STATE.prior_voting_bonus_map
+                               for c in group]))
+        initial_power = np.array([c.initial_power if c.initial_power is not None else params['initial_power']
+                                  for c in group])[:, None, None]
+        stacked[key] = (oracle_state, initial_power)
+
+    # Users are split in chunks so that the K × users × projects arrays hold `chunk_size` users at most
+    totals = np.zeros((len(configs), len(snapshot.projects)))
+    user_chunk_size = max(1, chunk_size // max(len(members) for members in groups.values()))
+    for (voting, votes, mask, _) in iter_round_votes(snapshot, resolved, user_chunk_size):
+        masked_votes = np.where(mask, votes, 0.0)
+        user_ids = resolved.registry.labels[voting]
+        for (key, members) in groups.items():
+            (oracle_state, initial_power) = stacked[key]
+            power = batch_power_from_neural_governance(user_ids,
+                                                       snapshot.projects,
+                                                       layers_of_group[key],
+                                                       oracle_state,
+                                                       initial_power)
+            # XXX: layers whose output has no config axis score all the group alike
+            power = np.broadcast_to(power, (len(members),) + votes.shape)
+            totals[members] += np.einsum('kup,up->kp', power, masked_votes)
+
+    return DataFrame(totals, index=labels, columns=snapshot.projects).rename_axis('config')
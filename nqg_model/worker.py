@@ -0,0 +1,131 @@
+from nqg_model.types import *
+from nqg_model.params import SINGLE_RUN_PARAMS, INITIAL_STATE, TIMESTEPS, SAMPLES
+from enum import Enum
+from time import perf_counter
+from typing import Iterable, TextIO
+import json
+import random
+import numpy as np
+
+# Runs whose results are returned on a worker, see `run_job`
+JOB_MODES = ('metrics', 'native')
+
+
+def decode_params(overrides: Mapping[str, object],
+                  base_params: NQGModelParams = SINGLE_RUN_PARAMS) -> NQGModelParams:
+    """
+    Parameters from JSON values, on top of `base_params`. Enum valued
+    parameters are given by member name and set valued ones as lists.
+    Neuron layers can't be overridden.
+    """
+    params = dict(base_params)
+    for (key, value) in overrides.items():
+        if key not in base_params:
+            raise ValueError(f"Unknown parameter {key!r}")
+        default = base_params[key]  # type: ignore
+        if key in ('neuron_layers', 'batch_neuron_layers'):
+            raise ValueError(f"Parameter {key!r} can't be set on a worker")
+        elif isinstance(default, Enum):
+            value = type(default)[value]  # type: ignore
+        elif isinstance(default, set):
+            value = set(value)  # type: ignore
+        params[key] = value
+    return NQGModelParams(**params)  # type: ignore
+
+
+def write_output(df, path: str) -> None:
+    """
+    Write a run DataFrame as Parquet (requires `pyarrow`), CSV or pickle,
+    as per the extension of `path`.
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path)
+    elif path.endswith('.csv'):
+        df.to_csv(path)
+    else:
+        df.to_pickle(path)
+
+
+def run_job(job: Mapping[str, object]) -> dict:
+    """
+    Execute a single run configuration and describe its outcome.
+
+    A job is a JSON object with the fields:
+        id: Echoed back on the reply.
+        params (optional): Overrides of the single run params, see `decode_params`.
+        timesteps, samples (optional): Default to the single run ones.
+        mode (optional): 'metrics' (default) only keeps the per-timestep
+            metrics, see `metrics_run`. 'native' keeps the full states,
+            see `native_run`.
+        recording (optional): `RecordingOptions` fields for the 'native'
+            mode, eg. `{"variables": ["per_project_voting"], "every": 30}`.
+        output (optional): Write the resulting DataFrame into this path.
+
+    The global generators used by `BehaviourSampling.Reference` are
+    seeded from the params, so that a job's results don't depend on the
+    jobs executed before it on the same worker.
+    """
+    from nqg_model.structure import model_blocks
+    from nqg_model.runner import native_run
+    from nqg_model.metrics import metrics_run
+    from nqg_model.recording import RecordingOptions
+
+    start = perf_counter()
+    reply: dict = {'id': job.get('id')}
+    try:
+        params = decode_params(job.get('params', {}))  # type: ignore
+        timesteps = int(job.get('timesteps', TIMESTEPS))  # type: ignore
+        samples = int(job.get('samples', SAMPLES))  # type: ignore
+        mode = job.get('mode', 'metrics')
+        if mode not in JOB_MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {JOB_MODES}")
+        recording = job.get('recording')
+        if recording is not None:
+            if mode != 'native':
+                raise ValueError("Recording options are only supported on the 'native' mode")
+            recording = RecordingOptions(**{k: set(v) if k == 'timesteps' else v  # type: ignore
+                                            for (k, v) in recording.items()})  # type: ignore
+        random.seed(params['seed'])
+        np.random.seed(params['seed'] % 2 ** 32)
+
+        run_params = {k: [v] for k, v in params.items()}
+        if mode == 'metrics':
+            df = metrics_run(INITIAL_STATE, run_params, model_blocks(), timesteps, samples)
+        else:
+            df = native_run(INITIAL_STATE, run_params, model_blocks(), timesteps, samples,
+                            assign_params=False, recording=recording)
+        if job.get('output') is not None:
+            write_output(df, str(job['output']))
+            reply['output'] = job['output']
+        reply.update(status='ok', rows=len(df))
+    except Exception as e:
+        reply.update(status='error', error=f"{type(e).__name__}: {e}")
+    reply['seconds'] = perf_counter() - start
+    return reply
+
+
+def warm_up() -> None:
+    """
+    Load the dependencies and build the model blocks ahead of the first job.
+    """
+    run_job({'id': None, 'timesteps': 1})
+
+
+def serve_jobs(lines: Iterable[str], output: TextIO) -> None:
+    """
+    Execute the JSON lines of jobs one after the other, writing a JSON line
+    reply for each of them. Blank lines are skipped.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object")
+        except ValueError as e:
+            reply = {'id': None, 'status': 'error', 'error': f"Invalid job: {e}"}
+        else:
+            reply = run_job(job)
+        output.write(json.dumps(reply) + '\n')
+        output.flush()